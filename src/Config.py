@@ -1,7 +1,96 @@
+import atexit
 import json
+import os
 import shutil
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
+
+
+def atomic_write_json(path: Path, data: Any):
+    """先写临时文件再重命名，避免写入中断产生损坏的文件"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class DebouncedJsonWriter:
+    """
+    合并短时间内的多次保存请求，只在窗口结束时写入一次
+    写入时才调用 provider 获取最新数据，写入方式为原子替换
+    """
+
+    def __init__(self, path: Path, provider: Callable[[], Any], log, delay: float = 0.5):
+        """
+        :param path: 目标文件
+        :param provider: 返回待写入数据的函数
+        :param log: 日志对象
+        :param delay: 合并窗口（秒）
+        """
+        self.path = Path(path)
+        self.provider = provider
+        self.log = log
+        self.delay = delay
+        self.lock = threading.RLock()  # 修改数据和序列化时共用，避免写出不完整的数据
+        self.write_count = 0
+        self.ok = True  # 最近一次写入是否成功
+        self._timer = None
+        self._dirty = False
+        self._depth = 0
+        atexit.register(self.flush)
+
+    def schedule(self):
+        """请求保存，窗口内的多次请求只写一次"""
+        with self.lock:
+            self._dirty = True
+            if self._depth or self._timer is not None:
+                return
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> bool:
+        """
+        立即写入未保存的修改
+        事务进行中时不写入（避免写出事务的中间状态），由事务结束时统一写入
+        :return: 是否写入成功，事务进行中时返回最近一次写入的结果
+        """
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return True
+            if self._depth:
+                return self.ok
+            try:
+                atomic_write_json(self.path, self.provider())
+                self._dirty = False
+                self.write_count += 1
+                self.ok = True
+                return True
+            except Exception as e:
+                self.log.error(f"保存 {self.path} 失败: {e}")
+                self.ok = False
+                return False
+
+    @contextmanager
+    def transaction(self):
+        """事务内的所有修改在退出时一次性写入"""
+        with self.lock:
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self._depth -= 1
+                if self._depth == 0 and self._dirty:
+                    self.flush()
+
 
 class Config:
     def __init__(self, core):
@@ -9,6 +98,10 @@ class Config:
         self.core = core
         self._config_example_file = Path("config_example.json")
         self.config_data = self.load_config()
+        self._writer = DebouncedJsonWriter(
+            self._config_file, lambda: self.config_data, self.core.log,
+            delay=self.get_config("config_save_delay", 0.5)
+        )
 
         try:
             with open(self._config_example_file, "r", encoding="utf-8") as f:
@@ -41,9 +134,10 @@ class Config:
     def save_config(self,data: Dict[str, Any]) -> bool:
         """保存配置到文件"""
         try:
-            with open(self._config_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-            self.config_data = data
+            with self._writer.lock:
+                atomic_write_json(self._config_file, data)
+                self.config_data = data
+                self._writer.write_count += 1
             self.core.log.debug(f"⚙️配置已保存到: {self._config_file}")
             return True
         except Exception as e:
@@ -55,8 +149,25 @@ class Config:
         return self.config_data.get(key, default)
 
     def set_config(self, key: str, value: Any, auto_save: bool = True) -> bool:
-        """设置配置值"""
-        self.config_data[key] = value
+        """
+        设置配置值，自动保存会合并短时间内的多次修改
+        :return: 最近一次写入是否成功（本次修改在合并窗口结束后写入，需要确认时调用 flush）
+        """
+        with self._writer.lock:
+            self.config_data[key] = value
         if auto_save:
-            return self.save_config(self.config_data)
-        return True
\ No newline at end of file
+            self._writer.schedule()
+        return self._writer.ok
+
+    def transaction(self):
+        """
+        批量修改配置，退出时只写入一次
+        with core.config.transaction():
+            core.config.set_config("a", 1)
+            core.config.set_config("b", 2)
+        """
+        return self._writer.transaction()
+
+    def flush(self) -> bool:
+        """立即写入未保存的修改"""
+        return self._writer.flush()
\ No newline at end of file
@@ -1,10 +1,12 @@
 import asyncio
 import sys
+import threading
+import time
 from time import sleep
 from plyer import notification
 from Timer import TimerManager
 from Logger import Logger
-from Config import Config
+from Config import Config, DebouncedJsonWriter, atomic_write_json
 from MQTT import MQTT
 import importlib
 import inspect
@@ -12,6 +14,7 @@ from pathlib import Path
 import json
 from typing import Optional, Dict, List
 from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 
 @dataclass
@@ -75,15 +78,24 @@ class Core:
 
         self.timer_dict = {}
 
+        # 所有异步任务共用的后台事件循环
+        self.loop = None
+        self._loop_thread = None
+        self._start_event_loop()
+
         self.plugins = {
             "instances": {},  # {name: instance}
             "metadata": {},  # {name: PluginMetadata}
             "modules": {},  # {name: module_object}
             "paths": {},  # {name: path}
             "errors": {},  # {name: error_message}
+            "writers": {},  # {name: DebouncedJsonWriter}
+            "import_times": {},  # {name: (导入耗时ms, 新增模块数)}
         }
 
         self._base_path = Path(__file__).parent / "plugins"
+        # 插件模块逐个导入：并行初始化时同时导入会互相计入耗时和新增模块数
+        self._import_lock = threading.Lock()
 
         # 扫描并加载插件
         self._scan_plugins()
@@ -99,6 +111,69 @@ class Core:
             self.config_plugin_timer()
             self.is_initialized = True
 
+    def _start_event_loop(self):
+        """启动后台事件循环线程"""
+        if self._loop_thread and self._loop_thread.is_alive():
+            return
+
+        loop = self.loop = asyncio.new_event_loop()
+
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        self._loop_thread = threading.Thread(target=run_loop, name="CoreEventLoop", daemon=True)
+        self._loop_thread.start()
+        self.log.debug("后台事件循环已启动")
+
+    def _stop_event_loop(self, timeout=2):
+        """取消未完成的协程并停止后台事件循环"""
+        thread = self._loop_thread
+        if thread is None or not thread.is_alive():
+            return
+
+        async def cancel_tasks():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_tasks(), self.loop).result(timeout)
+        except Exception as e:
+            self.log.warning(f"⚠️ 取消后台协程失败: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        thread.join(timeout)
+        if thread.is_alive():
+            self.log.warning("⚠️ 后台事件循环未能及时停止")
+        else:
+            self._loop_thread = None
+            self.log.debug("后台事件循环已停止")
+
+    def submit(self, coro):
+        """
+        将协程提交到后台事件循环（线程安全）
+        :param coro: 协程对象
+        :return: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run_coro(self, coro, timeout=None):
+        """
+        在后台事件循环中执行协程并等待结果（线程安全）
+        :param coro: 协程对象
+        :param timeout: 超时时间（秒），None 表示一直等待
+        :return: 协程返回值
+        """
+        if threading.current_thread() is self._loop_thread:
+            coro.close()
+            raise RuntimeError("不能在后台事件循环线程中同步等待协程")
+        return self.submit(coro).result(timeout)
+
     def _scan_plugins(self):
         """
         扫描插件目录，只支持文件夹插件
@@ -163,8 +238,12 @@ class Core:
         config_file = plugin_folder / "config.json"
 
         try:
-            with open(config_file, 'w', encoding='utf-8') as f:
-                json.dump(plugin_config.to_dict(), f, indent=4, ensure_ascii=False)
+            writer = self.plugins["writers"].get(plugin_folder.name)
+            if writer:
+                with writer.lock:
+                    atomic_write_json(config_file, plugin_config.to_dict())
+            else:
+                atomic_write_json(config_file, plugin_config.to_dict())
             return True
         except Exception as e:
             self.log.error(f"❌ 保存 {plugin_folder.name} 配置失败: {e}")
@@ -191,20 +270,37 @@ class Core:
         metadata = PluginMetadata.from_json(plugin_name, metadata_dict, plugin_config)
         self.plugins["metadata"][plugin_name] = metadata
 
-        # 只有启用的插件才导入模块
-        if plugin_config.enabled:
-            try:
-                module = importlib.import_module(module_path)
-                self.plugins["modules"][plugin_name] = module
-                self.log.debug(f"✅ 导入插件模块: {plugin_name}")
-            except Exception as e:
-                self.log.error(f"❌ 导入插件 {plugin_name} 模块失败: {str(e)}")
-                self.plugins["errors"][plugin_name] = str(e)
-        else:
+        # 模块延迟到创建实例时才导入
+        if not plugin_config.enabled:
             self.log.debug(f"⏸️ 插件 {plugin_name} 已禁用，跳过模块导入")
 
+    def _import_plugin_module(self, plugin_name: str):
+        """导入插件模块并记录耗时（持有导入锁，统计只包含本插件的导入）"""
+        module_path = f"plugins.{plugin_name}.{plugin_name}"
+        with self._import_lock:
+            modules_before = len(sys.modules)
+            start = time.perf_counter()
+            module = importlib.import_module(module_path)
+            elapsed = (time.perf_counter() - start) * 1000
+            added = len(sys.modules) - modules_before
+
+        self.plugins["modules"][plugin_name] = module
+        self.plugins["import_times"][plugin_name] = (elapsed, added)
+        self.log.debug(f"✅ 导入插件模块: {plugin_name} ({elapsed:.1f}ms)")
+        return module
+
+    def get_import_report(self) -> str:
+        """获取插件导入耗时报告（按耗时降序）"""
+        lines = ["插件导入耗时:"]
+        for name, (elapsed, count) in sorted(self.plugins["import_times"].items(), key=lambda x: -x[1][0]):
+            lines.append(f"  {name:<16} {elapsed:>8.1f}ms  新增模块 {count}")
+        return "\n".join(lines)
+
     def initialize_all_plugins(self):
-        """初始化所有启用的插件（按依赖顺序）"""
+        """
+        初始化所有启用的插件（按依赖关系并行）
+        依赖已满足的插件在线程池中并发创建，单个插件超时不会阻塞无关插件
+        """
         # 获取所有需要初始化的插件
         to_initialize = [
             name for name in self.plugins["metadata"].keys()
@@ -212,36 +308,146 @@ class Core:
                and name not in self.plugins["instances"]
                and name not in self.plugins["errors"]
         ]
+        pending = set(to_initialize)
 
-        # 拓扑排序：处理依赖关系
-        initialized = set()
-
-        def init_with_deps(plugin_name: str):
-            if plugin_name in initialized or plugin_name in self.plugins["instances"]:
-                return True
-
-            metadata = self.plugins["metadata"].get(plugin_name)
-            if not metadata or not metadata.config.enabled:
-                return False
-
-            # 先初始化依赖
-            for dep in metadata.dependencies:
-                if dep not in initialized:
-                    if not init_with_deps(dep):
-                        self.log.error(f"❌ 插件 {plugin_name} 的依赖 {dep} 初始化失败")
-                        return False
-
-            # 初始化当前插件
-            success = self._create_instance(plugin_name)
-            if success:
-                initialized.add(plugin_name)
-            return success
-
-        # 初始化所有插件
+        # 构建依赖图，缺失或未启用的依赖直接判定失败
+        waiting_on = {}  # {插件: 尚未完成的依赖}
+        dependents = {name: [] for name in to_initialize}  # {插件: 依赖它的插件}
+        failed = set()
         for name in to_initialize:
-            init_with_deps(name)
+            deps = set()
+            for dep in self.plugins["metadata"][name].dependencies:
+                if dep in self.plugins["instances"]:
+                    continue
+                if dep not in pending:
+                    self.log.error(f"❌ 插件 {name} 的依赖 {dep} 未启用或不存在")
+                    failed.add(name)
+                    continue
+                deps.add(dep)
+                dependents[dep].append(name)
+            waiting_on[name] = deps
+
+        # 环检测（Kahn 算法），环上的插件及其下游都无法初始化
+        in_degree = {name: len(deps) for name, deps in waiting_on.items()}
+        queue = [name for name, degree in in_degree.items() if degree == 0]
+        visited = set()
+        while queue:
+            name = queue.pop()
+            visited.add(name)
+            for child in dependents[name]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    queue.append(child)
+        cyclic = pending - visited
+        if cyclic:
+            self.log.error(f"❌ 插件依赖存在循环: {', '.join(sorted(cyclic))}")
+            for name in cyclic:
+                self.plugins["errors"][name] = "依赖存在循环"
+            failed |= cyclic
 
-        self.log.info(f"✅ 插件初始化完成: {len(initialized)}/{len(to_initialize)}")
+        initialized = set()
+        timings = {}  # {插件: 耗时ms}
+        timeout = self.config.get_config("plugin_init_timeout", 30)
+        executor = ThreadPoolExecutor(
+            max_workers=self.config.get_config("plugin_init_workers", 8),
+            thread_name_prefix="PluginInit"
+        )
+        running = {}  # {future: (插件, 开始时间)}
+
+        def fail(plugin_name):
+            """标记插件失败，并级联标记依赖它的插件"""
+            stack = [plugin_name]
+            while stack:
+                name = stack.pop()
+                failed.add(name)
+                for child in dependents.get(name, []):
+                    if child not in failed:
+                        self.log.error(f"❌ 插件 {child} 的依赖 {name} 初始化失败")
+                        stack.append(child)
+
+        def submit_ready():
+            """提交所有依赖已满足的插件"""
+            for name in to_initialize:
+                if name in failed or name in submitted or waiting_on[name]:
+                    continue
+                submitted.add(name)
+                running[executor.submit(self._create_instance, name)] = (name, time.perf_counter())
+
+        for name in list(failed):
+            fail(name)
+
+        submitted = set()
+        start_all = time.perf_counter()
+        submit_ready()
+
+        while running:
+            done, _ = wait(list(running), timeout=1, return_when=FIRST_COMPLETED)
+            now = time.perf_counter()
+
+            for future in done:
+                name, started = running.pop(future)
+                timings[name] = (now - started) * 1000
+                success = False
+                try:
+                    success = future.result()
+                except Exception as e:
+                    self.log.error(f"❌ 加载插件 {name} 失败: {e}")
+                if success:
+                    initialized.add(name)
+                    for child in dependents[name]:
+                        waiting_on[child].discard(name)
+                else:
+                    fail(name)
+
+            # 超时的插件放弃等待，线程继续在后台运行，完成后卸载迟到的实例
+            for future, (name, started) in list(running.items()):
+                if now - started > timeout:
+                    running.pop(future)
+                    timings[name] = (now - started) * 1000
+                    self.log.error(f"❌ 插件 {name} 初始化超时 ({timeout}秒)")
+                    self.plugins["errors"][name] = f"初始化超时 ({timeout}秒)"
+                    future.cancel()  # 尚未开始执行的直接取消
+                    # 已创建但 initialize 未返回的实例先取消注册，完成后再卸载
+                    partial = self._unregister_instance(name)
+                    future.add_done_callback(lambda f, n=name, i=partial: self._discard_late_instance(n, f, i))
+                    fail(name)
+
+            submit_ready()
+
+        executor.shutdown(wait=False)
+
+        total = (time.perf_counter() - start_all) * 1000
+        self.log.info(f"✅ 插件初始化完成: {len(initialized)}/{len(to_initialize)} ({total:.0f}ms)")
+        for name, elapsed in sorted(timings.items(), key=lambda x: -x[1]):
+            self.log.debug(f"  {name:<16} {elapsed:>8.1f}ms {'✅' if name in initialized else '❌'}")
+        self.log.debug(self.get_import_report())
+
+    def _unregister_instance(self, plugin_name: str):
+        """从核心移除插件实例（不调用 on_unload），返回被移除的实例"""
+        instance = self.plugins["instances"].pop(plugin_name, None)
+        if instance is not None and getattr(self, plugin_name, None) is instance:
+            delattr(self, plugin_name)
+        return instance
+
+    def _discard_late_instance(self, plugin_name: str, future, instance=None):
+        """
+        卸载超时后才完成初始化的插件实例
+        超时的插件已判定失败（依赖它的插件也已放弃），迟到的实例不再注册到核心
+        :param instance: 超时时已取消注册的实例
+        """
+        if future.cancelled():
+            return
+        # 超时时还没创建实例的，在超时后才注册
+        late = self._unregister_instance(plugin_name)
+        instance = instance or late
+        if instance is None:
+            return
+        self.log.warning(f"⚠️ 插件 {plugin_name} 在超时后才完成初始化，已卸载")
+        if hasattr(instance, 'on_unload'):
+            try:
+                instance.on_unload()
+            except Exception as e:
+                self.log.error(f"❌ 卸载插件 {plugin_name} 失败: {e}")
 
     def _create_instance(self, plugin_name: str) -> bool:
         """创建插件实例"""
@@ -251,8 +457,7 @@ class Core:
                 return True
 
             if plugin_name not in self.plugins["modules"]:
-                self.log.error(f"❌ 插件模块 {plugin_name} 未加载")
-                return False
+                self._import_plugin_module(plugin_name)
 
             module = self.plugins["modules"][plugin_name]
 
@@ -355,14 +560,7 @@ class Core:
 
         # 立即加载插件模块和实例
         try:
-            # 如果模块还未导入，先导入
-            if plugin_name not in self.plugins["modules"]:
-                module_path = f"plugins.{plugin_name}.{plugin_name}"
-                module = importlib.import_module(module_path)
-                self.plugins["modules"][plugin_name] = module
-                self.log.debug(f"✅ 导入插件模块: {plugin_name}")
-
-            # 创建插件实例
+            # 创建插件实例（模块未导入时会先导入）
             if self._create_instance(plugin_name):
                 self.log.info(f"🚀 插件 {plugin_name} 已载入实例")
 
@@ -441,6 +639,7 @@ class Core:
         :param plugin_name: 插件名称
         :param key: 配置键
         :param value: 配置值
+        :return: 最近一次写入是否成功（本次修改在合并窗口结束后写入，需要确认时调用 flush_configs）
         """
         plugin_name = self._normalize_module_name(plugin_name)
 
@@ -448,12 +647,40 @@ class Core:
             self.log.warning(f"⚠️ 获取配置出错，插件 {plugin_name} 不存在")
             return False
 
-        metadata = self.plugins["metadata"][plugin_name]
-        metadata.config.settings[key] = value
+        # 保存配置文件（短时间内的多次修改合并为一次写入）
+        writer = self._get_plugin_writer(plugin_name)
+        with writer.lock:
+            self.plugins["metadata"][plugin_name].config.settings[key] = value
+        writer.schedule()
+        return writer.ok
 
-        # 保存配置文件
-        plugin_folder = self._base_path / plugin_name
-        return self._save_plugin_config(plugin_folder, metadata.config)
+    def plugin_config_transaction(self, plugin_name: str):
+        """
+        批量修改插件配置，退出时只写入一次
+        with core.plugin_config_transaction("Hotkey"):
+            core.set_plugin_config("Hotkey", "a", 1)
+            core.set_plugin_config("Hotkey", "b", 2)
+        """
+        return self._get_plugin_writer(self._normalize_module_name(plugin_name)).transaction()
+
+    def _get_plugin_writer(self, plugin_name: str) -> DebouncedJsonWriter:
+        """获取插件配置的合并写入器"""
+        writer = self.plugins["writers"].get(plugin_name)
+        if writer is None:
+            writer = DebouncedJsonWriter(
+                self._base_path / plugin_name / "config.json",
+                lambda: self.plugins["metadata"][plugin_name].config.to_dict(),
+                self.log,
+                delay=self.config.get_config("config_save_delay", 0.5)
+            )
+            self.plugins["writers"][plugin_name] = writer
+        return writer
+
+    def flush_configs(self):
+        """立即写入所有未保存的配置"""
+        self.config.flush()
+        for writer in self.plugins["writers"].values():
+            writer.flush()
 
     def get_plugin_info(self, plugin_name: Optional[str] = None) -> Dict:
         """获取插件信息"""
@@ -506,8 +733,8 @@ class Core:
         return status
 
     def config_plugin_entities(self):
-        """配置插件实体到MQTT"""
-        for module_name in list(self.plugins["instances"].keys()):
+        """配置插件实体到MQTT（各插件并行执行）"""
+        def setup(module_name):
             try:
                 module = self.plugins["instances"][module_name]
 
@@ -518,6 +745,12 @@ class Core:
             except Exception as e:
                 self.log.error(f"❌ 插件 {module_name} 实体新增失败: {str(e)}")
 
+        with ThreadPoolExecutor(
+                max_workers=self.config.get_config("discovery_workers", 4),
+                thread_name_prefix="Discovery"
+        ) as executor:
+            list(executor.map(setup, list(self.plugins["instances"].keys())))
+
         self.log.info(f"✅ 插件实体发现完成")
 
     def config_plugin_timer(self):
@@ -547,9 +780,7 @@ class Core:
                 if hasattr(plugin, 'update_state'):
                     handler = plugin.update_state
                     if inspect.iscoroutinefunction(handler):
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        loop.run_until_complete(handler())
+                        self.run_coro(handler())
                     else:
                         handler()
                     self.log.debug(f"{module_name}: 更新数据")
@@ -617,6 +848,7 @@ class Core:
     def start(self):
         """启动核心服务"""
         try:
+            self._start_event_loop()
             self.mqtt.start_mqtt()
             self.timer.start_all_timers()
             self.start_plugin()
@@ -628,7 +860,10 @@ class Core:
         try:
             self.mqtt.stop_mqtt()
             self.timer.stop_all_timers()
+            self.timer.shutdown()
             self.stop_plugin()
+            self.flush_configs()
+            self._stop_event_loop()
         except Exception as e:
             self.log.error(f"进程停止失败: {e}")
 
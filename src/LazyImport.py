@@ -0,0 +1,62 @@
+"""
+延迟导入
+模块在第一次访问属性时才真正导入，用于插件中仅设置页面等场景才需要的重量级依赖（如 flet）
+"""
+import importlib
+import sys
+import threading
+import time
+import types
+
+# 已完成的延迟导入耗时 {模块名: 毫秒}
+load_times = {}
+
+
+class LazyModule(types.ModuleType):
+    """模块代理，首次访问属性时导入真实模块"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is not None:
+            return module
+        with self.__dict__["_lazy_lock"]:
+            module = self.__dict__["_lazy_module"]
+            if module is None:
+                start = time.perf_counter()
+                module = importlib.import_module(self.__name__)
+                load_times[self.__name__] = (time.perf_counter() - start) * 1000
+                self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        loaded = self.__dict__["_lazy_module"] is not None
+        return f"<lazy module '{self.__name__}' ({'loaded' if loaded else 'not loaded'})>"
+
+
+def lazy_import(name: str):
+    """
+    延迟导入模块，已导入的模块直接返回
+    用法: ft = lazy_import("flet")
+    插件约定：flet 只在设置页面使用，插件模块顶部统一用 lazy_import 导入，
+    无界面运行时不会加载 flet；其他只在部分功能中使用的重量级依赖同样处理
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    """模块是否已真正导入"""
+    return name in sys.modules
@@ -1,7 +1,82 @@
-import inspect
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 import os
+import threading
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    队列满时丢弃日志并计数，生产者不会阻塞
+    入队前由 QueueHandler.prepare 在调用线程中把 args/exc_info 合并为最终文本并清除
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class _BatchWriter(threading.Thread):
+    """单个写入线程，批量格式化日志并每批只刷新一次"""
+
+    _STOP = object()
+
+    def __init__(self, log_queue, handlers, max_batch=256):
+        super().__init__(name="LogWriter", daemon=True)
+        self.queue = log_queue
+        self.handlers = handlers
+        self.max_batch = max_batch
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            record = self.queue.get()
+            if record is self._STOP:
+                break
+            batch = [record]
+            while len(batch) < self.max_batch:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            for handler in self.handlers:
+                self._write(handler, batch)
+
+    @staticmethod
+    def _write(handler, batch):
+        records = [record for record in batch if record.levelno >= handler.level]
+        if not records or handler.stream is None:
+            return
+        with handler.lock:
+            try:
+                lines = [handler.format(record) + handler.terminator for record in records]
+                handler.stream.write(''.join(lines))
+                handler.flush()
+                # 按批次检查文件大小并轮转
+                if isinstance(handler, logging.handlers.RotatingFileHandler) \
+                        and handler.maxBytes and handler.stream.tell() >= handler.maxBytes:
+                    handler.doRollover()
+            except Exception:
+                handler.handleError(records[-1])
+
+    def stop(self, timeout=2):
+        self.queue.put(self._STOP)
+        self.join(timeout)
 
 
 class Logger:
@@ -23,10 +98,22 @@ class Logger:
         'RESET': '\033[0m'  # 重置颜色
     }
 
-    def __init__(self, name: str = None, level: int = logging.DEBUG, log_file: str = None):
+    def __init__(self, name: str = None, level: int = logging.DEBUG, log_file: str = None,
+                 use_queue: bool = True, queue_size: int = 10000,
+                 max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        """
+        :param use_queue: 是否使用队列异步写日志（调用方只入队，由单独线程写入）
+        :param queue_size: 队列容量，满时丢弃新日志并计数
+        :param max_bytes: 日志文件轮转大小，0 表示不轮转
+        :param backup_count: 保留的历史日志文件数量
+        """
         self.base_name = name
+        self._caller_cache = {}  # {code对象: 调用者名称，空字符串表示需要跳过的帧}
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
+        self.handlers = list(self.logger.handlers)
+        self._queue_handler = None
+        self._writer = None
 
         if not self.logger.handlers:
             console_handler = logging.StreamHandler(sys.stdout)
@@ -45,11 +132,19 @@ class Logger:
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
             console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
+            self.handlers.append(console_handler)
 
             # 如果提供了日志文件路径，添加文件handler
             if log_file:
-                file_handler = logging.FileHandler(log_file, mode='w',encoding='utf-8')  # mode='w'表示覆盖写入
+                file_handler = logging.handlers.RotatingFileHandler(
+                    log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+                )
+                # 每次启动使用新文件，上次的日志轮转为备份
+                if max_bytes and backup_count and file_handler.stream.tell() > 0:
+                    file_handler.doRollover()
+                elif not (max_bytes and backup_count):
+                    file_handler.stream.seek(0)
+                    file_handler.stream.truncate()
                 file_handler.setLevel(level)
                 # 文件日志使用不包含颜色的格式
                 file_formatter = logging.Formatter(
@@ -57,28 +152,64 @@ class Logger:
                     datefmt='%Y-%m-%d %H:%M:%S'
                 )
                 file_handler.setFormatter(file_formatter)
-                self.logger.addHandler(file_handler)
+                self.handlers.append(file_handler)
+
+            if use_queue:
+                log_queue = queue.Queue(maxsize=queue_size)
+                self._queue_handler = _DroppingQueueHandler(log_queue)
+                self._writer = _BatchWriter(log_queue, self.handlers)
+                self._writer.start()
+                self.logger.addHandler(self._queue_handler)
+                atexit.register(self.close)
+            else:
+                for handler in self.handlers:
+                    self.logger.addHandler(handler)
+
+    def get_stats(self) -> dict:
+        """获取日志队列状态：当前排队数量、丢弃数量"""
+        if not self._queue_handler:
+            return {"queued": 0, "dropped": 0, "max_size": 0}
+        return {
+            "queued": self._queue_handler.queue.qsize(),
+            "dropped": self._queue_handler.dropped,
+            "max_size": self._queue_handler.queue.maxsize,
+        }
+
+    def close(self):
+        """写完队列中剩余的日志并停止写入线程"""
+        if self._writer and self._writer.is_alive():
+            self._writer.stop()
 
     def _get_caller_name(self) -> str:
         """
         获取调用者文件名
+        逐帧向上查找，按 code 对象缓存结果，避免 inspect.stack() 读取源码上下文
         """
-        stack = inspect.stack()
-        for frame_info in stack[3:]:
-            frame = frame_info.frame
-            file_path = frame.f_globals.get('__file__', '')
-
-            # 跳过日志系统本身的文件和core.py
-            if not file_path or 'logging' in file_path or 'core.py' in file_path:
-                continue
-
-            filename = os.path.splitext(os.path.basename(file_path))[0]
-            return filename
+        frame = sys._getframe(3)
+        cache = self._caller_cache
+        while frame is not None:
+            code = frame.f_code
+            name = cache.get(code)
+            if name is None:
+                file_path = frame.f_globals.get('__file__', '')
+
+                # 跳过日志系统本身的文件和core.py
+                if not file_path or 'logging' in file_path or 'core.py' in file_path:
+                    name = ''
+                else:
+                    name = os.path.splitext(os.path.basename(file_path))[0]
+                cache[code] = name
+
+            if name:
+                return name
+            frame = frame.f_back
 
         return self.base_name
 
-
     def _log_with_caller(self, level: int, message: str):
+        # 先判断级别，被过滤的日志不查找调用者
+        if not self.logger.isEnabledFor(level):
+            return
         caller_name = self._get_caller_name()
         self.logger.log(level, message, extra={'caller_name': caller_name})
 
@@ -86,7 +217,7 @@ class Logger:
         level_upper = level.upper()
         if level_upper in self.LEVEL_MAP:
             self.logger.setLevel(self.LEVEL_MAP[level_upper])
-            for handler in self.logger.handlers:
+            for handler in self.handlers:
                 handler.setLevel(self.LEVEL_MAP[level_upper])
         else:
             self.logger.warning(f"Invalid log level: {level}. Using default level.")
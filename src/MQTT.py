@@ -1,8 +1,186 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import paho.mqtt.client as mqtt
-from ha_mqtt_discoverable import Settings, DeviceInfo
+from Config import DebouncedJsonWriter
+from TopicRouter import TopicRouter
+from ha_mqtt_discoverable import Settings, DeviceInfo, clean_string
 from ha_mqtt_discoverable.sensors import SensorInfo, Sensor
 
 
+class ThrottledClient(mqtt.Client):
+    """
+    对 discovery 配置消息（以 /config 结尾的主题）按令牌桶限速的 MQTT 客户端
+    允许 burst 条消息成批发出，之后按 rate 条/秒补充
+    状态消息与上次内容相同且未到刷新间隔时不重复发送
+    未连接或 paho 队列已满时交给 on_unsent 缓冲（实体直接调用 client.publish 时同样生效），
+    发布成功时通知 on_sent，缓冲中同一主题的旧消息随之作废
+    """
+
+    def __init__(self, *args, rate: float = 0, burst: int = 50, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._bucket_lock = threading.Lock()
+        self.first_state_at = None  # 连接后第一条状态消息的发送时间
+
+        # discovery 配置指纹，内容未变化的配置不重复发布
+        self.config_cache = {}  # {topic: 指纹} 本地记录的已发布配置
+        self.broker_configs = None  # {topic: 指纹} 连接后从 broker 读到的保留配置，None 表示未核对
+        self.broker_config_filter = None  # 核对范围（订阅过滤器），范围外的配置只依据本地缓存
+        self.on_config_published = None  # 配置发布后的回调（用于持久化缓存）
+        self.config_lock = threading.RLock()  # 修改指纹缓存时持有
+        self.config_stats = {"published": 0, "skipped": 0}
+
+        # 状态消息去重
+        self.dedup = True
+        self.state_keepalive = 300  # 内容未变化时的最长重发间隔（秒）
+        self._last_state = {}  # {topic: (payload, 发送时间)}
+        self._topic_keepalive = {}  # {state_topic: 秒} 根据实体 expire_after 缩短的刷新间隔
+        self._state_lock = threading.Lock()
+        self.state_stats = {"sent": 0, "suppressed": 0}
+
+        # 未发送消息的回调 on_unsent(topic, payload, qos, retain)，用于离线缓冲
+        self.on_unsent = None
+        self.on_sent = None  # 发布成功的回调 on_sent(topic)
+
+    @staticmethod
+    def _published_info():
+        """未实际发送时返回的发布结果"""
+        info = mqtt.MQTTMessageInfo(0)
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        info._set_as_published()
+        return info
+
+    @staticmethod
+    def _unsent_info():
+        """未连接、消息进入缓冲时返回的发布结果"""
+        info = mqtt.MQTTMessageInfo(0)
+        info.rc = mqtt.MQTT_ERR_NO_CONN
+        return info
+
+    def reset_state_cache(self):
+        """清空状态缓存（重连后 broker 上的状态可能已丢失）"""
+        with self._state_lock:
+            self._last_state.clear()
+
+    def _register_keepalive(self, payload):
+        """从 discovery 配置中读取 expire_after，保证刷新间隔短于过期时间"""
+        try:
+            config = json.loads(payload)
+            state_topic = config.get("state_topic")
+            expire_after = config.get("expire_after")
+        except (TypeError, ValueError, AttributeError):
+            return
+        if state_topic and expire_after:
+            with self._state_lock:
+                current = self._topic_keepalive.get(state_topic, self.state_keepalive)
+                self._topic_keepalive[state_topic] = min(current, expire_after / 2)
+
+    def _publish_state(self, topic, payload, qos, retain, properties):
+        """发布状态消息，内容未变化且未到刷新间隔时跳过"""
+        if not self.dedup:
+            return super().publish(topic, payload, qos, retain, properties)
+
+        now = time.monotonic()
+        with self._state_lock:
+            last = self._last_state.get(topic)
+            keepalive = self._topic_keepalive.get(topic, self.state_keepalive)
+            if last is not None and last[0] == payload and now - last[1] < keepalive:
+                self.state_stats["suppressed"] += 1
+                return self._published_info()
+
+        result = super().publish(topic, payload, qos, retain, properties)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            with self._state_lock:
+                self._last_state[topic] = (payload, now)
+                self.state_stats["sent"] += 1
+        return result
+
+    @staticmethod
+    def digest(payload):
+        """计算消息内容指纹"""
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif not isinstance(payload, (bytes, bytearray)):
+            payload = str(payload).encode("utf-8")
+        return hashlib.sha1(payload).hexdigest()
+
+    def _config_unchanged(self, topic, digest):
+        """本地缓存和 broker 保留的配置都与待发布内容一致"""
+        if self.config_cache.get(topic) != digest:
+            return False
+        if self.broker_configs is None:
+            return True
+        if self.broker_config_filter and not mqtt.topic_matches_sub(self.broker_config_filter, topic):
+            return True
+        return self.broker_configs.get(topic) == digest
+
+    def _acquire(self):
+        """取得一个令牌，不足时在调用线程中等待"""
+        while True:
+            with self._bucket_lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if self.on_unsent is None:
+            return self._publish(topic, payload, qos, retain, properties)
+        if not self.is_connected():
+            self.on_unsent(topic, payload, qos, retain)
+            return self._unsent_info()
+
+        result = self._publish(topic, payload, qos, retain, properties)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            if self.on_sent:
+                self.on_sent(topic)
+        elif result.rc in (mqtt.MQTT_ERR_QUEUE_SIZE, mqtt.MQTT_ERR_NO_CONN):
+            self.on_unsent(topic, payload, qos, retain)
+        return result
+
+    def _publish(self, topic, payload, qos, retain, properties):
+        if not topic.endswith("/config"):
+            if self.first_state_at is None:
+                self.first_state_at = time.perf_counter()
+            return self._publish_state(topic, payload, qos, retain, properties)
+
+        if payload:
+            self._register_keepalive(payload)
+        digest = self.digest(payload)
+        if payload and self._config_unchanged(topic, digest):
+            with self.config_lock:
+                self.config_stats["skipped"] += 1
+            return self._published_info()
+
+        if self.rate > 0:
+            self._acquire()
+        result = super().publish(topic, payload, qos, retain, properties)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            with self.config_lock:
+                self.config_stats["published"] += 1
+                if payload:
+                    self.config_cache[topic] = digest
+                else:
+                    self.config_cache.pop(topic, None)
+            if self.on_config_published:
+                self.on_config_published()
+        return result
+
+
 class MQTT:
     def __init__(self, core):
         """
@@ -10,9 +188,34 @@ class MQTT:
         :param core: Core实例
         """
         self.core = core
-        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.mqtt_client = ThrottledClient(
+            mqtt.CallbackAPIVersion.VERSION2,
+            rate=self.core.config.get_config("discovery_rate", 200),
+            burst=self.core.config.get_config("discovery_burst", 50)
+        )
         self.subscribed_topics = {}
 
+        # 消息路由，回调在线程池中执行，不占用 paho 网络线程；线程池随服务启动创建、停止时关闭
+        self.router = TopicRouter()
+        self._callback_workers = self.core.config.get_config("mqtt_callback_workers", 4)
+        self._callback_executor = None
+        self._callback_slots = threading.BoundedSemaphore(self.core.config.get_config("mqtt_callback_queue", 1000))
+        self.dropped_messages = 0
+
+        # 离线发布缓冲：每个主题只保留最新一条，重连后补发
+        self._offline = OrderedDict()  # {topic: (payload, qos, retain)}
+        self._offline_lock = threading.Lock()
+        self.offline_limit = self.core.config.get_config("mqtt_offline_buffer", 1000)
+        self.offline_stats = {"buffered": 0, "coalesced": 0, "dropped": 0, "replayed": 0}
+        self.mqtt_client.on_unsent = self._buffer_offline
+        self.mqtt_client.on_sent = self._discard_offline
+        # 限制 paho 内部队列，broker 响应慢时消息进入离线缓冲合并，而不是无限堆积
+        self.mqtt_client.max_queued_messages_set(self.core.config.get_config("mqtt_max_queued", 1000))
+
+        # 状态去重：内容未变化的状态消息只按刷新间隔重发
+        self.mqtt_client.dedup = self.core.config.get_config("state_dedup", True)
+        self.mqtt_client.state_keepalive = self.core.config.get_config("state_keepalive", 300)
+
         # 读取配置
         self.device_name = self.core.config.get_config("device_name")
         self.broker = self.core.config.get_config("HA_MQTT")
@@ -31,6 +234,101 @@ class MQTT:
         self.version_entity = None
         self.version_timer = None  # 版本实体心跳定时器
 
+        # 实体发现在后台线程执行，不阻塞网络线程
+        self.connected_at = None
+        self.discovery_entity = None
+        self._discovery_lock = threading.Lock()
+        self._discovery_pending = threading.Event()
+
+        # discovery 配置指纹缓存（持久化）
+        self.discovery_verify = self.core.config.get_config("discovery_verify", True)
+        self._config_cache_writer = DebouncedJsonWriter(
+            Path("discovery_cache.json"), lambda: self.mqtt_client.config_cache, self.core.log, delay=2
+        )
+        self.mqtt_client.config_cache = self._load_config_cache()
+        self.mqtt_client.config_lock = self._config_cache_writer.lock
+        self.mqtt_client.on_config_published = self._config_cache_writer.schedule
+
+    def _load_config_cache(self):
+        """读取本地 discovery 配置指纹缓存"""
+        try:
+            if self._config_cache_writer.path.exists():
+                with open(self._config_cache_writer.path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            self.core.log.warning(f"读取 discovery 缓存失败: {e}")
+        return {}
+
+    def _scan_broker_configs(self, max_time=3.0, quiet=0.2):
+        """
+        临时订阅本设备的 discovery 配置主题，读取 broker 保留的配置指纹
+        broker 丢失的配置会因指纹不一致而重新发布；只订阅本设备节点，不拉取其他设备的配置
+        broker 在订阅确认后立即下发保留消息：收到非保留消息，或确认后 quiet 秒内没有新的保留消息即结束
+        :param max_time: 最长等待时间（秒），超时未收到订阅确认时不核对
+        :param quiet: 判定保留消息下发完毕的静默时间（秒）
+        """
+        topic_filter = f"{self.prefix}/+/{clean_string(self.device_name)}/+/config"
+        found = {}
+        cond = threading.Condition()
+        state = {"mid": None, "acked": set(), "last": 0.0, "done": False}
+
+        def on_retained(client, userdata, msg):
+            with cond:
+                if not msg.retain:
+                    state["done"] = True  # 保留消息之后才会出现实时消息
+                elif msg.payload:
+                    found[msg.topic] = ThrottledClient.digest(msg.payload)
+                state["last"] = time.monotonic()
+                cond.notify_all()
+
+        def on_subscribe(client, userdata, mid, reason_codes, properties):
+            with cond:
+                state["acked"].add(mid)
+                state["last"] = time.monotonic()
+                cond.notify_all()
+            if previous:
+                previous(client, userdata, mid, reason_codes, properties)
+
+        def finished():
+            if state["done"]:
+                return True
+            return state["mid"] in state["acked"] and time.monotonic() - state["last"] >= quiet
+
+        previous = self.mqtt_client.on_subscribe
+        self.mqtt_client.on_subscribe = on_subscribe
+        self.mqtt_client.message_callback_add(topic_filter, on_retained)
+        acked = False
+        try:
+            rc, mid = self.mqtt_client.subscribe(topic_filter)
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                raise RuntimeError(f"订阅失败 ({rc})")
+            deadline = time.monotonic() + max_time
+            with cond:
+                state["mid"] = mid
+                while not finished():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    cond.wait(min(remaining, quiet))
+                acked = mid in state["acked"]
+                found = dict(found)
+        except Exception as e:
+            self.core.log.warning(f"读取 broker 保留的 discovery 配置失败: {e}")
+        finally:
+            self.mqtt_client.unsubscribe(topic_filter)
+            self.mqtt_client.message_callback_remove(topic_filter)
+            self.mqtt_client.on_subscribe = previous
+
+        if not acked:
+            # 无法确认 broker 已下发全部保留配置，只依据本地缓存
+            self.mqtt_client.broker_configs = None
+            if state["mid"] is not None:
+                self.core.log.warning("未收到 discovery 配置订阅确认，跳过 broker 核对")
+            return
+        self.mqtt_client.broker_config_filter = topic_filter
+        self.mqtt_client.broker_configs = found
+        self.core.log.debug(f"broker 保留的 discovery 配置: {len(found)} 个")
+
     def get_mqtt_settings(self):
         """
         获取 MQTT 配置（用于 ha-mqtt-discoverable）
@@ -85,12 +383,77 @@ class MQTT:
             if hasattr(self.core, 'gui') and self.core.gui is not None:
                 self.core.gui.logic.update_home_status()
 
-            # 配置插件实体
-            self.core.config_plugin_entities()
+            # 恢复自定义订阅
+            if self.subscribed_topics:
+                self.re_subscribe()
+
+            # 在后台线程中配置插件实体
+            self.connected_at = time.perf_counter()
+            self.mqtt_client.first_state_at = None
+            self.mqtt_client.reset_state_cache()
+            self._discovery_pending.set()
+            threading.Thread(target=self._run_discovery, name="MQTTDiscovery", daemon=True).start()
+
+    def _run_discovery(self):
+        """
+        执行实体发现，发现期间再次连接时会重新执行一次
+        释放锁后再次检查请求标志：新线程在释放前获取锁失败而退出时，由当前线程继续执行
+        """
+        while self._discovery_lock.acquire(blocking=False):
+            try:
+                while self._discovery_pending.is_set():
+                    self._discovery_pending.clear()
+                    self._discover(self.connected_at)
+            except Exception as e:
+                self.core.log.error(f"实体发现失败: {e}")
+            finally:
+                self._discovery_lock.release()
+            if not self._discovery_pending.is_set():
+                return
+
+    def _discover(self, connected_at):
+        """执行一次实体发现"""
+        # 先补发断线期间缓冲的消息，之后插件发布的新状态覆盖它们
+        self.replay_offline()
+
+        # 核对 broker 上保留的配置，未核对时只依据本地缓存跳过
+        self.mqtt_client.config_stats = {"published": 0, "skipped": 0}
+        if self.discovery_verify:
+            self._scan_broker_configs()
+
+        # 配置插件实体
+        self.core.config_plugin_entities()
+
+        # 创建并启动版本实体
+        self.create_version_entity()
+        self.start_version_heartbeat()
+
+        self._report_discovery_time(connected_at)
+
+    def _report_discovery_time(self, connected_at):
+        """记录连接后首条状态消息和全部实体就绪的耗时"""
+        ready_ms = (time.perf_counter() - connected_at) * 1000
+        first_state_at = self.mqtt_client.first_state_at
+        first_state_ms = (first_state_at - connected_at) * 1000 if first_state_at else ready_ms
+        stats = self.mqtt_client.config_stats
+        self.core.log.info(f"MQTT连接后首条状态耗时 {first_state_ms:.0f}ms, 全部实体就绪耗时 {ready_ms:.0f}ms, "
+                           f"discovery 配置发布 {stats['published']} 个, 未变化跳过 {stats['skipped']} 个")
 
-            # 创建并启动版本实体
-            self.create_version_entity()
-            self.start_version_heartbeat()
+        try:
+            if self.discovery_entity is None:
+                discovery_info = SensorInfo(
+                    name="discovery_time",
+                    unique_id=f"{self.device_name}_PCTools_discovery_time",
+                    object_id=f"{self.device_name}_PCTools_discovery_time",
+                    device=self.get_device_info(),
+                    unit_of_measurement="ms",
+                    entity_category="diagnostic",
+                    icon="mdi:timer-outline"
+                )
+                self.discovery_entity = Sensor(Settings(mqtt=self.get_mqtt_settings(), entity=discovery_info))
+            self.discovery_entity.set_state(round(first_state_ms))
+        except Exception as e:
+            self.core.log.error(f"更新实体发现耗时失败: {e}")
 
     def on_connect_fail(self, client, userdata):
         """连接失败回调"""
@@ -120,36 +483,62 @@ class MQTT:
         将消息路由到对应的订阅回调函数
         """
         topic = msg.topic
-        payload = msg.payload.decode()
+        payload = msg.payload.decode(errors="replace")
 
         self.core.log.debug(f"MQTT主题: `{topic}` 消息: `{payload}`")
 
+        for callback in self.router.match(topic):
+            # 待执行回调过多时丢弃，避免消息堆积占满内存
+            if not self._callback_slots.acquire(blocking=False):
+                self.dropped_messages += 1
+                self.core.log.warning(f"MQTT回调队列已满，丢弃消息: {topic}")
+                continue
+            executor = self._callback_executor
+            try:
+                if executor is None:
+                    raise RuntimeError("MQTT服务未启动")
+                future = executor.submit(self._run_callback, callback, topic, payload)
+            except RuntimeError as e:
+                self._callback_slots.release()
+                self.dropped_messages += 1
+                self.core.log.warning(f"MQTT回调线程池不可用，丢弃消息: {topic}, {e}")
+                continue
+            # 执行完成或停止服务时被取消都会释放名额
+            future.add_done_callback(lambda f: self._callback_slots.release())
+
+    def _run_callback(self, callback, topic, payload):
+        """在线程池中执行订阅回调"""
+        try:
+            callback(topic, payload)
+        except Exception as e:
+            self.core.log.error(f"MQTT消息回调执行失败: {topic}, 错误: {e}")
+
     def publish(self, topic, payload, qos=0, retain=False):
         """
         发布MQTT消息
+        未连接或 paho 队列已满时消息进入离线缓冲，重连后补发（同一主题只保留最新一条）
         :param topic: 主题
         :param payload: 消息内容（支持str, bytes, dict, list）
         :param qos: QoS等级 (0, 1, 2)
         :param retain: 是否保留消息
-        :return: 是否发布成功
+        :return: 是否发布成功（进入离线缓冲时返回 False）
         """
         try:
-            if not self.mqtt_client or not self.mqtt_client.is_connected():
-                self.core.log.error(f"MQTT未连接，无法发布消息到 {topic}")
-                return False
-
             # 处理不同类型的payload
             if isinstance(payload, (dict, list)):
-                import json
                 payload = json.dumps(payload)
             elif not isinstance(payload, (str, bytes)):
                 payload = str(payload)
 
+            # 未连接或队列已满时由客户端写入离线缓冲
             result = self.mqtt_client.publish(topic, payload, qos, retain)
 
             if result.rc == 0:
                 self.core.log.debug(f"MQTT消息发送成功: {topic}")
                 return True
+            elif result.rc in (mqtt.MQTT_ERR_QUEUE_SIZE, mqtt.MQTT_ERR_NO_CONN):
+                self.core.log.debug(f"MQTT未连接或发送队列已满，消息已缓冲: {topic}, rc={result.rc}")
+                return False
             else:
                 self.core.log.error(f"MQTT消息发送失败: {topic}, rc={result.rc}")
                 return False
@@ -158,6 +547,64 @@ class MQTT:
             self.core.log.error(f"MQTT发布异常: {topic}, 错误: {e}")
             return False
 
+    def _buffer_offline(self, topic, payload, qos, retain):
+        """
+        写入离线缓冲
+        同一主题的新消息覆盖旧消息；缓冲已满时优先丢弃最早的 QoS 0 非保留消息
+        """
+        with self._offline_lock:
+            if topic in self._offline:
+                old_qos, old_retain = self._offline.pop(topic)[1:]
+                # 合并后保留较高的 QoS 和保留标志，避免降低投递保证
+                qos, retain = max(qos, old_qos), retain or old_retain
+                self.offline_stats["coalesced"] += 1
+            elif len(self._offline) >= self.offline_limit:
+                victim = next(
+                    (key for key, (_, q, r) in self._offline.items() if q == 0 and not r),
+                    next(iter(self._offline))
+                )
+                del self._offline[victim]
+                self.offline_stats["dropped"] += 1
+            self._offline[topic] = (payload, qos, retain)
+            self.offline_stats["buffered"] += 1
+
+    def _discard_offline(self, topic):
+        """同一主题已发布更新的消息，丢弃缓冲中的旧消息"""
+        if not self._offline:
+            return
+        with self._offline_lock:
+            self._offline.pop(topic, None)
+
+    def replay_offline(self):
+        """
+        按缓冲顺序补发离线消息，发送失败的消息重新进入缓冲
+        逐条从缓冲中取出，补发期间已发布新消息的主题不再补发旧内容
+        """
+        with self._offline_lock:
+            total = len(self._offline)
+        if not total:
+            return
+
+        sent = 0
+        for _ in range(total):
+            with self._offline_lock:
+                if not self._offline:
+                    break
+                topic, (payload, qos, retain) = self._offline.popitem(last=False)
+            if self.publish(topic, payload, qos, retain):
+                sent += 1
+        self.offline_stats["replayed"] += sent
+        self.core.log.info(f"MQTT离线消息补发 {sent}/{total} 条")
+
+    def get_publish_stats(self):
+        """状态消息统计：实际发送和因内容未变化而跳过的数量"""
+        return dict(self.mqtt_client.state_stats)
+
+    def get_offline_stats(self):
+        """离线缓冲统计：当前深度、累计缓冲/合并/丢弃/补发数量"""
+        with self._offline_lock:
+            return dict(self.offline_stats, depth=len(self._offline), limit=self.offline_limit)
+
     def subscribe(self, topic, callback=None, qos=0):
         """
         订阅MQTT主题
@@ -167,11 +614,17 @@ class MQTT:
         :return: 是否订阅成功
         """
         try:
+            if callback:
+                TopicRouter.validate(topic)
             result = self.mqtt_client.subscribe(topic, qos)
 
             if result[0] == 0:
                 if callback:
+                    old = self.subscribed_topics.get(topic)
+                    if old is not None:
+                        self.router.remove(topic, old)
                     self.subscribed_topics[topic] = callback
+                    self.router.add(topic, callback)
                 self.core.log.debug(f"订阅MQTT主题成功: {topic}")
                 return True
             else:
@@ -194,6 +647,7 @@ class MQTT:
             if result[0] == 0:
                 if topic in self.subscribed_topics:
                     del self.subscribed_topics[topic]
+                self.router.remove(topic)
                 self.core.log.debug(f"取消订阅MQTT主题成功: {topic}")
                 return True
             else:
@@ -229,6 +683,10 @@ class MQTT:
 
     def start_mqtt(self):
         """启动MQTT服务"""
+        if self._callback_executor is None:
+            self._callback_executor = ThreadPoolExecutor(
+                max_workers=self._callback_workers, thread_name_prefix="MQTTCallback"
+            )
         if not self.mqtt_client.is_connected():
             self.connect_broker()
         self.mqtt_client.loop_start()
@@ -248,6 +706,9 @@ class MQTT:
                 self.core.log.error(f"设置版本实体不可用失败: {e}")
 
         self.mqtt_client.loop_stop()
+        executor, self._callback_executor = self._callback_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
         self.core.log.info("MQTT服务已停止")
 
     def reconnect(self):
@@ -1,101 +1,180 @@
-import asyncio
+import heapq
 import inspect
+import itertools
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 class PeriodicTask:
-    def __init__(self, core, function=None, interval=None, name="UnnamedTask"):
+    def __init__(self, core, function=None, interval=None, name="UnnamedTask", manager=None):
         self.core = core
         self.interval = interval if interval is not None else self.core.config.get_config("interval")
         self.name = name
         self.core.log.debug(f"定时器 {self.name} 初始化, 上报间隔 {self.interval} 秒")
         self.function = function
-        self.thread = None
-        self.stop_event = threading.Event()
+        self.manager = manager
+        self.running = False
+        self.generation = 0  # 每次启动/停止递增，用于作废堆中的旧截止时间
         self.lock = threading.Lock()
         self.is_async = inspect.iscoroutinefunction(function)
-        self.loop = None  # 保存事件循环引用
-
-    def _run(self):
-        """定时器主循环"""
-        next_run_time = time.time()
-
-        # 如果是异步函数，创建事件循环
-        if self.is_async:
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-
-        while not self.stop_event.is_set():
-            now = time.time()
-
-            if now >= next_run_time:
-                try:
-                    if self.is_async:
-                        # 异步函数
-                        self.loop.run_until_complete(self.function())
-                    else:
-                        # 同步函数
-                        self.function()
-
-                    next_run_time = now + self.interval
-                    self.core.log.debug(
-                        f"🕛定时器 {self.name} 下次执行时间: "
-                        f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_run_time))}"
-                    )
-                except Exception as e:
-                    self.core.log.error(f"❌ 定时任务 {self.name} 执行失败: {e}")
-                    next_run_time = now + self.interval  # 即使失败也要设置下次执行时间
-
-            # 使用更短的休眠时间以提高响应性，但避免过度占用CPU
-            sleep_time = min(0.1, max(0.01, next_run_time - time.time()))
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-
-        # 清理事件循环
-        if self.is_async and self.loop:
-            self.loop.close()
+
+    def _execute(self):
+        """执行一次任务，返回本次开始执行的时间"""
+        started = time.monotonic()
+        try:
+            if self.is_async:
+                # 异步函数交给 Core 的共享事件循环执行
+                self.core.run_coro(self.function())
+            else:
+                self.function()
+
+            self.core.log.debug(
+                f"🕛定时器 {self.name} 下次执行时间: "
+                f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + self.interval))}"
+            )
+        except Exception as e:
+            self.core.log.error(f"❌ 定时任务 {self.name} 执行失败: {e}")
+        return started
 
     def start(self):
         """启动定时器"""
-        if self.thread is None or not self.thread.is_alive():
-            self.stop_event.clear()
-            self.thread = threading.Thread(target=self._run, name=f"TimerThread-{self.name}", daemon=True)
-            self.thread.start()
+        if self.manager is None:
+            self.core.log.error(f"❌ 定时器 {self.name} 未绑定调度器")
+            return
+        if not self.running:
+            self.manager.schedule(self)
             self.core.log.info(f"🕛定时器 {self.name} 已启动")
         else:
             self.core.log.warning(f"⚠️ 定时器 {self.name} 已在运行")
 
     def stop(self):
         """停止定时器"""
-        if not self.stop_event.is_set():
-            self.stop_event.set()
-            if self.thread and self.thread.is_alive():
-                self.thread.join(timeout=5)  # 添加超时避免无限等待
-                if self.thread.is_alive():
-                    self.core.log.warning(f"⚠️ 定时器 {self.name} 停止超时")
+        if self.running:
+            self.manager.unschedule(self)
             self.core.log.info(f"🕛定时器 {self.name} 已停止")
 
     def update_interval(self, new_interval):
         """更新定时器间隔"""
         with self.lock:
             self.interval = new_interval
+        if self.running:
+            # 按新间隔重新计算下次执行时间
+            self.manager.reschedule(self, time.monotonic() + new_interval)
         self.core.log.info(f"🕛定时器 {self.name} 间隔已更新为 {new_interval} 秒")
 
 
 class TimerManager:
-    def __init__(self, core):
+    """
+    定时器管理器
+    所有定时器共用一个调度线程（按截止时间排列的最小堆）和一个有界线程池执行任务，
+    调度线程在两个截止时间之间不会被唤醒
+    """
+
+    def __init__(self, core, max_workers=None):
         self.core = core
         self.timers = {}
         self.core.log = core.log
 
+        self.max_workers = max_workers or self.core.config.get_config("timer_workers", 4)
+        self._heap = []  # [(deadline, seq, generation, task)]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._shutdown = False
+
+    # ===== 调度器 =====
+
+    def _ensure_scheduler(self):
+        """按需启动调度线程和线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="TimerWorker")
+        if self._thread is None or not self._thread.is_alive():
+            self._shutdown = False
+            self._thread = threading.Thread(target=self._scheduler_loop, name="TimerScheduler", daemon=True)
+            self._thread.start()
+
+    def _push(self, task, deadline):
+        heapq.heappush(self._heap, (deadline, next(self._seq), task.generation, task))
+        self._cond.notify()
+
+    def schedule(self, task, deadline=None):
+        """将任务加入调度，默认立即执行"""
+        with self._cond:
+            self._ensure_scheduler()
+            task.generation += 1
+            task.running = True
+            self._push(task, deadline if deadline is not None else time.monotonic())
+
+    def unschedule(self, task):
+        """取消任务调度，堆中的旧条目会在弹出时被丢弃"""
+        with self._cond:
+            task.generation += 1
+            task.running = False
+            self._cond.notify()
+
+    def reschedule(self, task, deadline):
+        """修改任务的下次执行时间"""
+        with self._cond:
+            if not task.running:
+                return
+            task.generation += 1
+            self._push(task, deadline)
+
+    def _scheduler_loop(self):
+        """调度线程主循环"""
+        while True:
+            with self._cond:
+                while not self._shutdown:
+                    # 丢弃已作废的条目
+                    while self._heap and self._heap[0][2] != self._heap[0][3].generation:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    timeout = self._heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._shutdown:
+                    return
+                _, _, generation, task = heapq.heappop(self._heap)
+
+            try:
+                self._executor.submit(self._run_task, task, generation)
+            except RuntimeError as e:
+                self.core.log.error(f"❌ 定时任务 {task.name} 提交失败: {e}")
+
+    def _run_task(self, task, generation):
+        """在线程池中执行任务，完成后再安排下一次执行，避免同一任务重叠"""
+        started = task._execute()
+        with self._cond:
+            if task.running and task.generation == generation:
+                self._push(task, started + task.interval)
+
+    def shutdown(self):
+        """停止调度线程和线程池"""
+        with self._cond:
+            self._shutdown = True
+            self._heap.clear()
+            self._cond.notify()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._thread = None
+
+    # ===== 定时器管理 =====
+
     def create_timer(self, name, function, interval=None):
         """创建定时器"""
         if name in self.timers:
             self.core.log.warning(f"⚠️ 定时器 {name} 已存在，将被覆盖")
             self.remove_timer(name)
 
-        self.timers[name] = PeriodicTask(self.core, function=function, interval=interval, name=name)
+        self.timers[name] = PeriodicTask(self.core, function=function, interval=interval, name=name, manager=self)
         return self.timers[name]
 
     def get_timer(self, name):
@@ -112,16 +191,9 @@ class TimerManager:
             raise ValueError(f"定时器 {name} 不存在")
 
     def start_all_timers(self):
-        """批量启动所有定时器（并行）"""
-        threads = []
-        for name, timer in self.timers.items():
-            thread = threading.Thread(target=timer.start, name=f"Start-{name}")
-            thread.start()
-            threads.append(thread)
-
-        # 等待所有启动完成
-        for thread in threads:
-            thread.join(timeout=1)
+        """批量启动所有定时器"""
+        for timer in list(self.timers.values()):
+            timer.start()
 
         self.core.log.info(f"✅ 已启动 {len(self.timers)} 个定时器")
 
@@ -135,16 +207,9 @@ class TimerManager:
             raise ValueError(f"定时器 {name} 不存在")
 
     def stop_all_timers(self):
-        """批量停止所有定时器（并行）"""
-        threads = []
-        for name, timer in self.timers.items():
-            thread = threading.Thread(target=timer.stop, name=f"Stop-{name}")
-            thread.start()
-            threads.append(thread)
-
-        # 等待所有停止完成
-        for thread in threads:
-            thread.join(timeout=2)
+        """批量停止所有定时器"""
+        for timer in list(self.timers.values()):
+            timer.stop()
 
         self.core.log.info(f"✅ 已停止 {len(self.timers)} 个定时器")
 
@@ -171,7 +236,7 @@ class TimerManager:
         status = {}
         for name, timer in self.timers.items():
             status[name] = {
-                "running": timer.thread and timer.thread.is_alive(),
+                "running": timer.running,
                 "interval": timer.interval,
                 "is_async": timer.is_async
             }
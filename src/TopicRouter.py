@@ -0,0 +1,108 @@
+"""
+MQTT 主题路由
+按主题层级构建前缀树，支持 + 和 # 通配符，匹配耗时只与主题层数有关
+"""
+import threading
+
+
+class _Node:
+    __slots__ = ("children", "callbacks")
+
+    def __init__(self):
+        self.children = {}  # {层级名: _Node}
+        self.callbacks = []
+
+
+class TopicRouter:
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self.count = 0  # 已注册的订阅数
+
+    @staticmethod
+    def validate(topic_filter: str):
+        """检查订阅主题格式，# 只能出现在最后一层，通配符必须独占一层"""
+        levels = topic_filter.split("/")
+        for i, level in enumerate(levels):
+            if level == "#":
+                if i != len(levels) - 1:
+                    raise ValueError(f"# 只能位于主题末尾: {topic_filter}")
+            elif level != "+" and ("+" in level or "#" in level):
+                raise ValueError(f"通配符必须独占一层: {topic_filter}")
+
+    def add(self, topic_filter: str, callback):
+        """注册订阅回调，同一回调重复注册只保留一次"""
+        self.validate(topic_filter)
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _Node()
+                node = child
+            if callback not in node.callbacks:
+                # 复制后替换，匹配时无需加锁
+                node.callbacks = node.callbacks + [callback]
+                self.count += 1
+
+    def remove(self, topic_filter: str, callback=None):
+        """
+        移除订阅回调
+        :param callback: None 表示移除该主题的全部回调
+        """
+        with self._lock:
+            path = []
+            node = self._root
+            for level in topic_filter.split("/"):
+                child = node.children.get(level)
+                if child is None:
+                    return
+                path.append((node, level))
+                node = child
+
+            if callback is None:
+                self.count -= len(node.callbacks)
+                node.callbacks = []
+            elif callback in node.callbacks:
+                node.callbacks = [cb for cb in node.callbacks if cb != callback]
+                self.count -= 1
+
+            # 清理空分支
+            for parent, level in reversed(path):
+                child = parent.children[level]
+                if child.callbacks or child.children:
+                    break
+                del parent.children[level]
+
+    def match(self, topic: str) -> list:
+        """获取与主题匹配的全部回调"""
+        levels = topic.split("/")
+        # 以 $ 开头的系统主题不匹配首层通配符
+        wildcard = not topic.startswith("$")
+        matched = []
+        nodes = [self._root]
+        for i, level in enumerate(levels):
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                if wildcard or i > 0:
+                    multi = children.get("#")
+                    if multi is not None:
+                        matched.extend(multi.callbacks)
+                    single = children.get("+")
+                    if single is not None:
+                        next_nodes.append(single)
+                exact = children.get(level)
+                if exact is not None:
+                    next_nodes.append(exact)
+            if not next_nodes:
+                return matched
+            nodes = next_nodes
+
+        for node in nodes:
+            matched.extend(node.callbacks)
+            # a/# 同时匹配 a
+            multi = node.children.get("#")
+            if multi is not None:
+                matched.extend(multi.callbacks)
+        return matched
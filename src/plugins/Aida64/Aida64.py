@@ -1,15 +1,37 @@
 """
 Aida64 硬件监控插件
 使用 ha-mqtt-discoverable 管理 Home Assistant 实体
-使用 JSON 模板方式批量更新传感器数据
+每个传感器使用独立的状态主题，只发布变化超过死区的传感器
+采样定时器只读取数据写入历史，实体的增删只在发布和发现流程中进行（持有 entity_lock）
 """
 import json
+import threading
 import time
-import flet as ft
+from LazyImport import lazy_import
 import python_aida64
+from plugins.Aida64.SensorHistory import SensorHistory
 from ha_mqtt_discoverable.sensors import Sensor, SensorInfo
 from ha_mqtt_discoverable import Settings
 
+ft = lazy_import("flet")
+
+# 需要创建传感器的类别
+SENSOR_CATEGORIES = ('temp', 'pwr', 'fan', 'sys', 'volt', 'curr', 'duty')
+
+# 各类别默认死区：abs 为绝对变化量，rel 为相对变化比例，任一满足即视为有效变化
+DEFAULT_DEADBANDS = {
+    "temp": {"abs": 0.5, "rel": 0},
+    "pwr": {"abs": 1.0, "rel": 0.02},
+    "fan": {"abs": 20, "rel": 0.02},
+    "volt": {"abs": 0.01, "rel": 0},
+    "curr": {"abs": 0.05, "rel": 0.02},
+    "duty": {"abs": 1.0, "rel": 0},
+    "sys": {"abs": 0, "rel": 0.01},
+}
+
+# 每次读取都会变化的时间类传感器，不参与变化检测，只随完整刷新发布
+RATE_LIMITED_SENSORS = ("SDATE", "STIME", "SUPTIME", "SUPTIMEUS")
+
 
 class Aida64:
     def __init__(self, core):
@@ -25,20 +47,48 @@ class Aida64:
         # 数据缓存
         self.last_data = None
         self.last_item_count = {}
+        self.last_signature = {}  # {sensor_id: (category, label)}
+
+        # 增量发布配置：只有超过死区的变化才发布，每 N 次强制完整刷新
+        self.delta_publish = self.core.get_plugin_config("Aida64", "delta_publish", True)
+        self.full_refresh_ticks = self.core.get_plugin_config("Aida64", "full_refresh_ticks", 12)
+        self.deadbands = dict(DEFAULT_DEADBANDS)
+        self.deadbands.update(self.core.get_plugin_config("Aida64", "deadbands", {}))
+        self.rate_limited = set(
+            self.core.get_plugin_config("Aida64", "rate_limited_sensors", list(RATE_LIMITED_SENSORS))
+        )
+        self.last_published = {}  # {sensor_id: 上次发布的值}
+        self.ticks_since_full = 0
+        self.publish_stats = {"published": 0, "skipped": 0, "messages": 0}
+
+        # 本地历史数据：固定容量环形缓冲区，窗口聚合值（min/max/mean/p95）作为实体属性随完整刷新发布
+        self.history_minutes = self.core.get_plugin_config("Aida64", "history_minutes", 10)
+        self.sample_interval = self.core.get_plugin_config("Aida64", "sample_interval", self.update_interval)
+        self.aggregate_attributes = self.core.get_plugin_config("Aida64", "aggregate_attributes", False)
+        self.aggregate_window = self.core.get_plugin_config("Aida64", "aggregate_window", 60)
+        self.history = SensorHistory(self.history_minutes * 60 / max(self.sample_interval, 0.1))
+        self.sample_timer = None
 
         # 自动重新discovery配置
         self.auto_rediscovery = self.core.get_plugin_config("Aida64", "auto_rediscovery", False)
         self.last_discovery_time = 0
         self.min_discovery_interval = 30
 
-        # 存储所有传感器实体
+        # 存储所有传感器实体，修改实体集合和数据项签名时持有 entity_lock
         self.sensors = {}
+        self.entity_lock = threading.RLock()
 
-        # 统一的更新主题
-        self.state_topic = f"{self.core.mqtt.prefix}/sensor/{self.core.mqtt.device_name}/aida64/state"
+        # 主题前缀，每个传感器的状态和属性发布到 {topic_base}/{sensor_id}/state|attributes
+        self.topic_base = f"{self.core.mqtt.prefix}/sensor/{self.core.mqtt.device_name}/aida64"
+        # 没有传感器实体时发布完整 JSON 的主题
+        self.state_topic = f"{self.topic_base}/state"
 
     def setup_entities(self):
         """设置所有传感器实体"""
+        with self.entity_lock:
+            self._setup_entities()
+
+    def _setup_entities(self):
         try:
             # 获取初始数据以确定要创建哪些传感器
             aida64_data = self.get_aida64_data()
@@ -50,60 +100,15 @@ class Aida64:
             device_info = self.core.mqtt.get_device_info()
 
             # 分类计数器
-            category_counters = {
-                'temp': 0, 'pwr': 0, 'fan': 0, 'sys': 0,
-                'volt': 0, 'curr': 0, 'duty': 0
-            }
+            category_counters = {category: 0 for category in SENSOR_CATEGORIES}
 
             created_count = 0
 
             # 遍历所有数据项创建传感器
-            for category, items in aida64_data.items():
-                if category not in category_counters:
-                    continue
-
-                for idx, item in enumerate(items):
-                    try:
-                        sensor_name = item["label"]
-                        sensor_id = item["id"]
-                        unique_id = f"{self.core.mqtt.device_name}_aida64_{sensor_id}"
-                        # 使用 value_template 从 JSON 中提取值
-                        value_template = f"{{{{ value_json.{category}[{idx}].value }}}}"
-
-                        # 创建传感器信息
-                        sensor_info = SensorInfo(
-                            name=sensor_name,
-                            unique_id=unique_id,
-                            object_id=unique_id,
-                            device=device_info,
-                            value_template=value_template,
-                            icon=self._get_icon(category, sensor_name),
-                            unit_of_measurement=self._get_unit(category, sensor_name),
-                            device_class=self._get_device_class(category),
-                            expire_after=self.update_interval
-                        )
-
-                        # 创建传感器
-                        sensor = Sensor(Settings(mqtt=mqtt_settings, entity=sensor_info))
-
-                        # 创建后手动设置 state_topic 并重写配置
-                        sensor.state_topic = self.state_topic
-                        sensor.write_config()
-
-                        # 存储传感器引用
-                        key = f"{category}_{idx}"
-                        self.sensors[key] = {
-                            "sensor": sensor,
-                            "category": category,
-                            "index": idx,
-                            "id": sensor_id,
-                            "name": sensor_name
-                        }
-
-                        created_count += 1
-                        category_counters[category] += 1
-                    except (KeyError, IndexError) as e:
-                        self.log.error(f"创建传感器失败: {e}, item: {item}")
+            for sensor_id, (category, item) in self._index_sensors(aida64_data).items():
+                if self._create_sensor(category, item, mqtt_settings, device_info):
+                    created_count += 1
+                    category_counters[category] += 1
 
             self.log.info(f"Aida64 传感器创建完成: 共 {created_count} 个")
 
@@ -115,6 +120,176 @@ class Aida64:
         except Exception as e:
             self.log.error(f"设置 Aida64 传感器失败: {e}")
 
+    def _index_sensors(self, data):
+        """按 AIDA64 id 索引数据项 {id: (category, item)}"""
+        indexed = {}
+        for category, items in data.items():
+            if category not in SENSOR_CATEGORIES:
+                continue
+            for item in items:
+                if item.get("id"):
+                    indexed[item["id"]] = (category, item)
+        return indexed
+
+    def _create_sensor(self, category, item, mqtt_settings, device_info):
+        """创建单个传感器并发布 discovery 配置"""
+        try:
+            sensor_name = item["label"]
+            sensor_id = item["id"]
+            unique_id = f"{self.core.mqtt.device_name}_aida64_{sensor_id}"
+
+            # 创建传感器信息
+            sensor_info = SensorInfo(
+                name=sensor_name,
+                unique_id=unique_id,
+                object_id=unique_id,
+                device=device_info,
+                icon=self._get_icon(category, sensor_name),
+                unit_of_measurement=self._get_unit(category, sensor_name),
+                device_class=self._get_device_class(category),
+                expire_after=self._get_expire_after()
+            )
+
+            # 创建传感器
+            sensor = Sensor(Settings(mqtt=mqtt_settings, entity=sensor_info))
+
+            # 创建后按传感器 id 设置主题并重写配置（默认主题按名称生成，同名传感器会冲突）
+            sensor.state_topic = self._sensor_topic(sensor_id, "state")
+            sensor.attributes_topic = self._sensor_topic(sensor_id, "attributes")
+            sensor.write_config()
+
+            # 存储传感器引用
+            self.sensors[sensor_id] = {
+                "sensor": sensor,
+                "category": category,
+                "id": sensor_id,
+                "name": sensor_name
+            }
+            return True
+        except KeyError as e:
+            self.log.error(f"创建传感器失败: {e}, item: {item}")
+            return False
+
+    def sync_entities(self, data):
+        """
+        对比传感器集合，只发布变化的 discovery 配置
+        新增/改名的传感器发布配置，消失的传感器发布空配置以删除实体
+        """
+        with self.entity_lock:
+            self._sync_entities(data)
+
+    def _sync_entities(self, data):
+        current = self._index_sensors(data)
+        added = [sensor_id for sensor_id in current if sensor_id not in self.sensors]
+        removed = [sensor_id for sensor_id in self.sensors if sensor_id not in current]
+        renamed = [
+            sensor_id for sensor_id, (category, item) in current.items()
+            if sensor_id in self.sensors and (
+                self.sensors[sensor_id]["name"] != item.get("label")
+                or self.sensors[sensor_id]["category"] != category
+            )
+        ]
+
+        if not (added or removed or renamed):
+            return
+
+        mqtt_settings = self.core.mqtt.get_mqtt_settings()
+        device_info = self.core.mqtt.get_device_info()
+
+        for sensor_id in added + renamed:
+            category, item = current[sensor_id]
+            self._create_sensor(category, item, mqtt_settings, device_info)
+
+        self.history.retain(current.keys())
+        for sensor_id in removed:
+            entry = self.sensors.pop(sensor_id)
+            self.last_published.pop(sensor_id, None)
+            try:
+                # 清除保留的状态，再发布空配置删除实体
+                entry["sensor"].mqtt_client.publish(entry["sensor"].state_topic, "", retain=True)
+                entry["sensor"].delete()
+            except Exception as e:
+                self.log.error(f"删除传感器 {sensor_id} 失败: {e}")
+
+        self.log.info(f"Aida64 传感器已同步: 新增 {len(added)}, 删除 {len(removed)}, 改名 {len(renamed)}")
+
+    def _sensor_topic(self, sensor_id, kind):
+        """传感器的状态/属性主题（id 中的主题通配符替换为下划线）"""
+        safe_id = str(sensor_id).replace("/", "_").replace("+", "_").replace("#", "_")
+        return f"{self.topic_base}/{safe_id}/{kind}"
+
+    def _get_expire_after(self):
+        """实体过期时间，增量发布时需覆盖完整刷新周期"""
+        if self.delta_publish:
+            return self.update_interval * (self.full_refresh_ticks + 1)
+        return self.update_interval
+
+    def _exceeds_deadband(self, category, old, new):
+        """判断数值变化是否超过类别死区"""
+        if old is None:
+            return True
+        try:
+            old_value = float(old)
+            new_value = float(new)
+        except (TypeError, ValueError):
+            return old != new
+
+        deadband = self.deadbands.get(category, {})
+        diff = abs(new_value - old_value)
+        abs_band = deadband.get("abs", 0)
+        rel_band = deadband.get("rel", 0)
+        if not abs_band and not rel_band:
+            return diff > 0
+        if abs_band and diff >= abs_band:
+            return True
+        if rel_band and diff >= abs(old_value) * rel_band:
+            return True
+        return False
+
+    def _build_state(self, data):
+        """将数据整理为 {id: value} 状态"""
+        return {
+            sensor_id: item.get("value")
+            for sensor_id, (category, item) in self._index_sensors(data).items()
+        }
+
+    def _select_changes(self, data, full):
+        """
+        选出需要发布的传感器
+        :param full: 完整刷新，发布所有传感器
+        :return: {sensor_id: value}，只包含超过死区的传感器；时间类传感器只在首次和完整刷新时发布
+        """
+        state = {}
+        for sensor_id, (category, item) in self._index_sensors(data).items():
+            value = item.get("value")
+            if value is None:
+                continue
+            old = self.last_published.get(sensor_id)
+            if full or old is None:
+                state[sensor_id] = value
+            elif sensor_id not in self.rate_limited and self._exceeds_deadband(category, old, value):
+                state[sensor_id] = value
+        return state
+
+    def _publish_sensors(self, state):
+        """
+        发布到各传感器的状态主题
+        :return: 发布失败的数量
+        """
+        failed = 0
+        for sensor_id, value in state.items():
+            entry = self.sensors.get(sensor_id)
+            if entry is None:
+                continue  # 新出现的传感器在重新发现前没有实体
+            sensor = entry["sensor"]
+            result = sensor.mqtt_client.publish(sensor.state_topic, str(value), retain=True)
+            if result.rc == 0:  # MQTT_ERR_SUCCESS
+                self.last_published[sensor_id] = value
+                self.publish_stats["messages"] += 1
+            else:
+                failed += 1
+        return failed
+
     def _get_icon(self, category, name):
         """根据类别和名称获取图标"""
         name_lower = name.lower()
@@ -189,8 +364,11 @@ class Aida64:
         }
         return class_map.get(category)
 
-    def get_aida64_data(self):
-        """获取 AIDA64 数据"""
+    def get_aida64_data(self, sync=True):
+        """
+        获取 AIDA64 数据
+        :param sync: 是否检查数据项变化并同步实体（采样和预览时只读取）
+        """
         try:
             aida64_data = python_aida64.getData()
             if not aida64_data:
@@ -198,9 +376,10 @@ class Aida64:
                 return None
 
             self.last_data = aida64_data
+            self.history.append(self._build_state(aida64_data))
 
             # 检查数据项数量变化（仅在自动重新discovery开启时）
-            if self.auto_rediscovery:
+            if sync and self.auto_rediscovery:
                 self.check_item_count_change(aida64_data)
 
             return aida64_data
@@ -210,7 +389,11 @@ class Aida64:
             return None
 
     def check_item_count_change(self, data):
-        """检查数据项数量是否变化"""
+        """检查数据项是否变化（数量或 id/名称）"""
+        with self.entity_lock:
+            self._check_item_count_change(data)
+
+    def _check_item_count_change(self, data):
         current_count = {}
         total_items = 0
 
@@ -219,8 +402,18 @@ class Aida64:
                 current_count[category] = len(items)
                 total_items += len(items)
 
-        # 比较数量变化
-        if current_count != self.last_item_count and self.last_item_count:
+        current_signature = {
+            sensor_id: (category, item.get("label"))
+            for sensor_id, (category, item) in self._index_sensors(data).items()
+        }
+
+        if not self.last_item_count:
+            self.last_item_count = current_count.copy()
+            self.last_signature = current_signature
+            self.log.debug(f"初始数据项数量: 总计 {total_items}")
+            return
+
+        if current_signature != self.last_signature:
             current_time = time.time()
 
             if current_time - self.last_discovery_time >= self.min_discovery_interval:
@@ -231,21 +424,18 @@ class Aida64:
                     if old != new:
                         changes.append(f"{cat}: {old} -> {new}")
 
-                self.log.info(f"检测到数据项数量变化: {', '.join(changes)}")
-                self.log.info("需要重新创建传感器...")
+                self.log.info(f"检测到数据项变化: {', '.join(changes) or '名称变化'}")
 
-                # 重新创建传感器
-                self.sensors.clear()
-                self.setup_entities()
+                # 只同步变化的传感器
+                if self.sensors:
+                    self.sync_entities(data)
 
                 self.last_discovery_time = current_time
                 self.last_item_count = current_count.copy()
-        elif not self.last_item_count:
-            self.last_item_count = current_count.copy()
-            self.log.debug(f"初始数据项数量: 总计 {total_items}")
+                self.last_signature = current_signature
 
     def update_state(self):
-        """更新状态 - 发送整个 JSON 到统一主题"""
+        """更新状态 - 只发布变化的传感器，每 N 次完整刷新"""
         if not self.core.mqtt.is_connected():
             return False
 
@@ -255,33 +445,76 @@ class Aida64:
             return False
 
         try:
-            # 发布 JSON 数据到统一的状态主题
-            payload = json.dumps(aida64_data)
-
-            # 使用第一个传感器的 MQTT 客户端发布（所有传感器共享同一个客户端）
-            if self.sensors:
-                first_sensor = next(iter(self.sensors.values()))["sensor"]
-                result = first_sensor.mqtt_client.publish(self.state_topic, payload, retain=True)
-
-                if result.rc == 0:  # MQTT_ERR_SUCCESS
-                    self.log.debug(f"Aida64 状态更新成功 ({len(self.sensors)} 个传感器)")
-                    return True
-                else:
-                    self.log.warning(f"Aida64 状态更新失败，MQTT 错误码: {result.rc}")
-                    return False
-            else:
-                # 如果没有传感器，直接使用核心 MQTT 客户端
-                result = self.core.mqtt.publish(self.state_topic, payload)
+            full = True
+            if self.delta_publish:
+                self.ticks_since_full += 1
+                full = self.ticks_since_full >= self.full_refresh_ticks
+
+            if not self.sensors:
+                # 如果没有传感器，直接使用核心 MQTT 客户端发布完整 JSON
+                result = self.core.mqtt.publish(self.state_topic, json.dumps(self._build_state(aida64_data)))
                 if result:
                     self.log.debug("Aida64 状态更新成功（无传感器情况）")
                 else:
                     self.log.warning("Aida64 状态更新失败（无传感器情况）")
                 return result
 
+            publish_data = self._select_changes(aida64_data, full)
+            if not publish_data:
+                self.publish_stats["skipped"] += 1
+                self.log.debug("Aida64 数据无有效变化，跳过发布")
+                return True
+
+            failed = self._publish_sensors(publish_data)
+            if failed:
+                self.log.warning(f"Aida64 状态更新失败: {failed}/{len(publish_data)} 个传感器发布失败")
+                return False
+
+            if full:
+                self.ticks_since_full = 0
+                if self.aggregate_attributes:
+                    self._publish_aggregates()
+            self.publish_stats["published"] += 1
+            self.log.debug(f"Aida64 状态更新成功 ({len(publish_data)}/{len(self.sensors)} 个传感器)")
+            return True
+
         except Exception as e:
             self.log.error(f"状态更新异常: {e}")
             return False
 
+    def _publish_aggregates(self):
+        """将窗口内的 min/max/mean/p95 发布为各传感器的属性，状态仍为原始值"""
+        aggregated = self.history.aggregate(self.aggregate_window)
+        for sensor_id, entry in list(self.sensors.items()):
+            attributes = {
+                stat: values[sensor_id] for stat, values in aggregated.items() if sensor_id in values
+            }
+            if not attributes:
+                continue
+            attributes["window"] = self.aggregate_window
+            sensor = entry["sensor"]
+            sensor.mqtt_client.publish(sensor.attributes_topic, json.dumps(attributes), retain=True)
+
+    def sample(self):
+        """仅采样到本地历史，不发布也不同步实体"""
+        self.get_aida64_data(sync=False)
+
+    def get_history_stats(self, window=None):
+        """获取窗口内各传感器的 min/max/mean/p95"""
+        return self.history.aggregate(window or self.aggregate_window)
+
+    def start(self):
+        """采样间隔小于发布间隔时，启动独立的采样定时器"""
+        if self.sample_interval < self.update_interval and self.sample_timer is None:
+            self.sample_timer = self.core.timer.create_timer("Aida64_sampler", self.sample, self.sample_interval)
+            self.sample_timer.start()
+
+    def stop(self):
+        """停止采样定时器"""
+        if self.sample_timer is not None:
+            self.core.timer.remove_timer("Aida64_sampler")
+            self.sample_timer = None
+
     def get_item_count_summary(self):
         """获取数据项数量摘要"""
         if not self.last_item_count:
@@ -295,6 +528,7 @@ class Aida64:
         """插件卸载时清理资源"""
         try:
             self.log.info("Aida64 插件正在卸载")
+            self.stop()
             self.sensors.clear()
             self.last_data = None
             self.log.info("Aida64 插件已卸载")
@@ -357,6 +591,10 @@ class Aida64:
                 for category, items in self.last_data.items():
                     if isinstance(items, list):
                         self.last_item_count[category] = len(items)
+                self.last_signature = {
+                    sensor_id: (category, item.get("label"))
+                    for sensor_id, (category, item) in self._index_sensors(self.last_data).items()
+                }
                 self.log.info(f"自动重建已启用，当前数据项: {self.get_item_count_summary()}")
 
         auto_rediscovery_switch = ft.Switch(
@@ -366,8 +604,26 @@ class Aida64:
             tooltip="当检测到数据项数量变化时自动重新创建传感器"
         )
 
+        def toggle_delta_publish(e):
+            self.delta_publish = e.control.value
+            self.core.set_plugin_config("Aida64", "delta_publish", self.delta_publish)
+            self.last_published.clear()
+            self.ticks_since_full = 0
+
+            status_text.value = f"✓ 增量发布已{'启用' if self.delta_publish else '禁用'}，重新创建传感器后过期时间生效"
+            status_text.color = ft.Colors.GREEN
+            status_text.visible = True
+            status_text.update()
+
+        delta_publish_switch = ft.Switch(
+            label="增量发布",
+            value=self.delta_publish,
+            on_change=toggle_delta_publish,
+            tooltip="仅在传感器变化超过死区时发布，并定期完整刷新"
+        )
+
         def test_read_data(e):
-            data = self.get_aida64_data()
+            data = self.get_aida64_data(sync=False)
             if data:
                 e.control.text = "✓ 读取成功"
                 e.control.bgcolor = ft.Colors.GREEN
@@ -434,8 +690,9 @@ class Aida64:
 
         def recreate_sensors(e):
             try:
-                self.sensors.clear()
-                self.setup_entities()
+                with self.entity_lock:
+                    self.sensors.clear()
+                    self.setup_entities()
                 e.control.text = "✓ 重建完成"
                 e.control.bgcolor = ft.Colors.GREEN
             except Exception as ex:
@@ -446,6 +703,7 @@ class Aida64:
 
         def reset_count(e):
             self.last_item_count = {}
+            self.last_signature = {}
             self.last_discovery_time = 0
             status_text.value = "✓ 数据计数已重置"
             status_text.color = ft.Colors.GREEN
@@ -462,6 +720,10 @@ class Aida64:
                 auto_rediscovery_switch,
                 ft.Text("新增/删除数据项时自动重新创建传感器", size=12, color=ft.Colors.GREY_700),
             ], spacing=10),
+            ft.Row([
+                delta_publish_switch,
+                ft.Text(f"每 {self.full_refresh_ticks} 次更新完整刷新一次", size=12, color=ft.Colors.GREY_700),
+            ], spacing=10),
             status_text,
             ft.Divider(),
             ft.Row([
@@ -478,12 +740,16 @@ class Aida64:
             ft.Text(f"自动重建: {'启用' if auto_rediscovery_enabled else '禁用'}"),
             ft.Text(f"传感器数量: {len(self.sensors)}"),
             ft.Text(f"数据项统计: {self.get_item_count_summary()}"),
+            ft.Text(f"历史缓冲: {self.history_minutes}分钟, 占用 {self.history.memory_bytes() // 1024} KB, "
+                    f"聚合属性: {'启用' if self.aggregate_attributes else '关闭'}"),
+            ft.Text(f"发布统计: 已发布 {self.publish_stats['published']} 次 ({self.publish_stats['messages']} 条消息), "
+                    f"跳过 {self.publish_stats['skipped']} 次"),
             ft.Divider(),
             ft.Text("使用说明:", weight=ft.FontWeight.BOLD, size=14),
             ft.Text(
-                "• 使用 JSON 模板方式批量管理传感器\n"
-                "• 所有传感器共享同一个状态主题，减少 MQTT 流量\n"
-                "• 自动重建：检测到数据项变化时自动重新创建传感器\n"
+                "• 每个传感器使用独立的状态主题，只发布变化超过死区的传感器\n"
+                "• 日期、时间、运行时长等传感器只随完整刷新发布\n"
+                "• 自动重建：检测到数据项变化时只发布新增/改名/删除传感器的配置\n"
                 "• 最小重建间隔：30秒",
                 size=12,
                 color=ft.Colors.GREY_700,
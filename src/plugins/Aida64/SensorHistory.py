@@ -0,0 +1,121 @@
+"""
+传感器历史数据环形缓冲区
+固定容量，每个传感器 id 占一列，内存占用与运行时间无关
+采样定时器、状态更新、GUI 和实体同步可能在不同线程中同时访问，读写都持有锁
+"""
+import threading
+import time
+import warnings
+import numpy as np
+
+
+class SensorHistory:
+    # 支持的聚合统计
+    STATS = ("min", "max", "mean", "p95")
+
+    def __init__(self, capacity: int, column_chunk: int = 32):
+        """
+        :param capacity: 最多保存的采样次数
+        :param column_chunk: 新增传感器时列数的扩容步长
+        """
+        self.capacity = max(1, int(capacity))
+        self.column_chunk = column_chunk
+        self.columns = {}  # {sensor_id: 列索引}
+        self._timestamps = np.full(self.capacity, np.nan)
+        self._data = np.full((self.capacity, 0), np.nan, dtype=np.float32)
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    def _ensure_columns(self, count):
+        """扩容列数（按步长增长，避免频繁复制）"""
+        if count <= self._data.shape[1]:
+            return
+        new_width = ((count + self.column_chunk - 1) // self.column_chunk) * self.column_chunk
+        grown = np.full((self.capacity, new_width), np.nan, dtype=np.float32)
+        grown[:, :self._data.shape[1]] = self._data
+        self._data = grown
+
+    def append(self, values: dict, timestamp: float = None):
+        """
+        写入一次采样
+        :param values: {sensor_id: 数值}，无法转换为数值的项会被忽略
+        :param timestamp: 采样时间（time.monotonic），默认当前时间
+        """
+        numeric = {}
+        for sensor_id, value in values.items():
+            try:
+                numeric[sensor_id] = float(value)
+            except (TypeError, ValueError):
+                continue
+
+        with self._lock:
+            row = self._pos
+            self._data[row, :] = np.nan
+            for sensor_id, value in numeric.items():
+                col = self.columns.get(sensor_id)
+                if col is None:
+                    col = len(self.columns)
+                    self._ensure_columns(col + 1)
+                    self.columns[sensor_id] = col
+                self._data[row, col] = value
+            self._timestamps[row] = time.monotonic() if timestamp is None else timestamp
+            self._pos = (row + 1) % self.capacity
+
+    def retain(self, sensor_ids):
+        """只保留指定传感器的列，释放已消失传感器占用的空间"""
+        sensor_ids = set(sensor_ids)
+        with self._lock:
+            keep = [sensor_id for sensor_id in self.columns if sensor_id in sensor_ids]
+            if len(keep) == len(self.columns):
+                return
+            indices = [self.columns[sensor_id] for sensor_id in keep]
+            data = np.full((self.capacity, 0), np.nan, dtype=np.float32)
+            self._data, old = data, self._data
+            self._ensure_columns(len(keep))
+            self._data[:, :len(keep)] = old[:, indices]
+            self.columns = {sensor_id: i for i, sensor_id in enumerate(keep)}
+
+    def _window(self, seconds, now):
+        """窗口内的采样副本和对应的列索引 (samples, columns)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            with np.errstate(invalid="ignore"):
+                mask = self._timestamps >= now - seconds
+            # 布尔索引返回副本，释放锁后可以安全计算
+            return self._data[mask, :len(self.columns)], dict(self.columns)
+
+    def window(self, seconds: float, now: float = None) -> np.ndarray:
+        """获取最近 seconds 秒内的采样，形状为 (采样数, 传感器数)"""
+        return self._window(seconds, now)[0]
+
+    def aggregate(self, seconds: float, now: float = None) -> dict:
+        """
+        计算滑动窗口内各传感器的统计值
+        :return: {统计名: {sensor_id: 数值}}，窗口内无数据的传感器不包含在结果中
+        """
+        samples, columns = self._window(seconds, now)
+        result = {stat: {} for stat in self.STATS}
+        if samples.size == 0:
+            return result
+
+        with warnings.catch_warnings():
+            # 全为 NaN 的列会产生 RuntimeWarning，结果为 NaN 后统一过滤
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            computed = {
+                "min": np.nanmin(samples, axis=0),
+                "max": np.nanmax(samples, axis=0),
+                "mean": np.nanmean(samples, axis=0),
+                "p95": np.nanpercentile(samples, 95, axis=0),
+            }
+
+        for stat, values in computed.items():
+            for sensor_id, col in columns.items():
+                value = values[col]
+                if not np.isnan(value):
+                    result[stat][sensor_id] = round(float(value), 2)
+        return result
+
+    def memory_bytes(self) -> int:
+        """缓冲区占用的内存"""
+        with self._lock:
+            return self._data.nbytes + self._timestamps.nbytes
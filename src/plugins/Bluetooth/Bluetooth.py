@@ -5,7 +5,6 @@ from winsdk.windows.devices import radios
 from ha_mqtt_discoverable.sensors import Switch, SwitchInfo
 from ha_mqtt_discoverable import Settings
 from paho.mqtt.client import Client as MQTTClient
-import asyncio
 
 
 class Bluetooth:
@@ -84,11 +83,8 @@ class Bluetooth:
 
                 self.log.error("找不到蓝牙设备")
 
-            # 在新的事件循环中执行
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(get_bluetooth_and_listen())
-            loop.close()
+            # 在 Core 的共享事件循环中执行
+            self.core.run_coro(get_bluetooth_and_listen())
 
         except Exception as e:
             self.log.error(f"启动蓝牙监听失败: {e}")
@@ -131,22 +127,32 @@ class Bluetooth:
             payload = message.payload.decode()
             self.log.info(f"收到蓝牙开关命令: {payload}")
 
-            # 创建新的事件循环来执行异步操作
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
+            # 提交到 Core 的共享事件循环，不阻塞 MQTT 网络线程
             if payload == "ON":
-                result = loop.run_until_complete(self.bluetooth_power(True))
-                self.log.info(f"蓝牙设备已开启: {result}")
+                future = self.core.submit(self.bluetooth_power(True))
+                future.add_done_callback(lambda f: self._log_power_result(f, "开启"))
             elif payload == "OFF":
-                result = loop.run_until_complete(self.bluetooth_power(False))
-                self.log.info(f"蓝牙设备已关闭: {result}")
-
-            loop.close()
+                future = self.core.submit(self.bluetooth_power(False))
+                future.add_done_callback(lambda f: self._log_power_result(f, "关闭"))
 
         except Exception as e:
             self.log.error(f"处理蓝牙开关命令失败: {e}")
 
+    def _log_power_result(self, future, action: str):
+        """
+        记录蓝牙开关结果（在事件循环线程中回调，异常不能抛出）
+        :param future: bluetooth_power 的 Future
+        :param action: 开启/关闭
+        """
+        if future.cancelled():
+            self.log.warning(f"蓝牙{action}操作已取消")
+            return
+        error = future.exception()
+        if error is not None:
+            self.log.error(f"蓝牙设备{action}失败: {error}")
+        else:
+            self.log.info(f"蓝牙设备已{action}: {future.result()}")
+
     async def bluetooth_power(self, turn_on: bool):
         """
         蓝牙电源管理
@@ -2,9 +2,15 @@
 CMD和PowerShell命令执行插件
 """
 import subprocess
-from ha_mqtt_discoverable.sensors import Text, TextInfo
+import threading
+import time
+import psutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ha_mqtt_discoverable.sensors import Text, TextInfo, Sensor, SensorInfo
 from ha_mqtt_discoverable import Settings
 from paho.mqtt.client import Client as MQTTClient
+from plugins.Cmd.ShellSession import ShellSession, ShellStartError
 
 
 class Cmd:
@@ -16,9 +22,28 @@ class Cmd:
         self.core = core
         self.log = core.log
 
+        # 执行配置
+        self.max_concurrency = self.core.get_plugin_config("Cmd", "max_concurrency", 2)
+        self.queue_size = self.core.get_plugin_config("Cmd", "queue_size", 10)  # 等待执行的命令上限
+        self.timeout = self.core.get_plugin_config("Cmd", "timeout", 30)
+        self.output_lines = self.core.get_plugin_config("Cmd", "output_lines", 50)  # 输出传感器保留的行数
+        self.stream_interval = self.core.get_plugin_config("Cmd", "stream_interval", 0.5)  # 输出上报最小间隔（秒）
+        # 常驻 PowerShell 会话，省去每条命令启动解释器的时间；关闭时每条命令单独启动进程
+        self.persistent_powershell = self.core.get_plugin_config("Cmd", "persistent_powershell", True)
+        self.powershell_session = ShellSession.powershell(self.log) if self.persistent_powershell else None
+
+        # 命令在线程池中执行，不阻塞 MQTT 网络线程
+        self.executor = None
+        self.slots = None
+        self.processes = {}  # {run_id: Popen} 正在执行的进程
+        self.run_id = 0
+        self.lock = threading.Lock()
+        self.start()
+
         # MQTT 实体
         self.cmd_text = None
         self.powershell_text = None
+        self.output_sensor = None
 
     def setup_entities(self):
         """设置 MQTT 实体"""
@@ -70,6 +95,24 @@ class Cmd:
                 command_callback=self.handle_powershell_command
             )
             self.powershell_text.set_text("输入自定义PowerShell命令")
+
+            # 创建命令输出传感器（状态为执行结果，属性中包含输出、返回码和耗时）
+            output_info = SensorInfo(
+                name="command_output",
+                unique_id=f"{self.core.mqtt.device_name}_command_output",
+                object_id=f"{self.core.mqtt.device_name}_command_output",
+                device=device_info,
+                icon="mdi:text-box-outline",
+                display_name="命令输出"
+            )
+
+            output_settings = Settings(
+                mqtt=mqtt_settings,
+                entity=output_info
+            )
+
+            self.output_sensor = Sensor(output_settings)
+            self.output_sensor.set_state("空闲")
             self.log.info("Cmd MQTT 实体创建成功")
 
         except Exception as e:
@@ -82,31 +125,10 @@ class Cmd:
         :param user_data: 用户数据
         :param message: MQTT 消息
         """
-        try:
-            command = message.payload.decode()
-            self.log.info(f"收到 CMD 命令: {command}")
-            self.cmd_text.set_text(command)
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=30  # 添加超时保护
-            )
-
-            if result.returncode == 0:
-                self.log.info(f"CMD命令执行成功: {command}")
-                if result.stdout:
-                    self.log.info(f"输出: {result.stdout.strip()}")
-            else:
-                self.log.warning(f"CMD命令执行失败 (返回码: {result.returncode}): {command}")
-                if result.stderr:
-                    self.log.warning(f"错误: {result.stderr.strip()}")
-
-        except subprocess.TimeoutExpired:
-            self.log.error(f"CMD命令执行超时: {command}")
-        except Exception as e:
-            self.log.error(f"执行 CMD 命令失败: {e}")
+        command = message.payload.decode()
+        self.log.info(f"收到 CMD 命令: {command}")
+        self.cmd_text.set_text(command)
+        self.submit("CMD", command, command, shell=True)
 
     def handle_powershell_command(self, client: MQTTClient, user_data, message):
         """
@@ -115,27 +137,171 @@ class Cmd:
         :param user_data: 用户数据
         :param message: MQTT 消息
         """
+        command = message.payload.decode()
+        self.log.info(f"收到 PowerShell 命令: {command}")
+        self.powershell_text.set_text(command)
+        self.submit("PowerShell", command, ["powershell", "-Command", command], session=self.powershell_session)
+
+    def submit(self, kind, command, args, shell=False, session=None):
+        """
+        将命令加入执行队列
+        :param kind: 命令类型（用于日志和输出）
+        :param command: 原始命令文本
+        :param args: 单次执行时传给 subprocess 的参数
+        :param shell: 单次执行时是否通过 shell 执行
+        :param session: 常驻会话，None 表示单次执行
+        :return: 是否已加入队列
+        """
+        executor, slots = self.executor, self.slots
+        if executor is None:
+            self.log.warning(f"Cmd 插件未运行，忽略{kind}命令: {command}")
+            return False
+        if not slots.acquire(blocking=False):
+            self.log.warning(f"{kind}命令队列已满，忽略命令: {command}")
+            self._report("队列已满", {"kind": kind, "command": command})
+            return False
+
+        with self.lock:
+            self.run_id += 1
+            run_id = self.run_id
         try:
-            command = message.payload.decode()
-            self.log.info(f"收到 PowerShell 命令: {command}")
-            self.powershell_text.set_text(command)
-            result = subprocess.run(
-                ["powershell", "-Command", command],
-                capture_output=True,
-                text=True,
-                timeout=30  # 添加超时保护
-            )
+            executor.submit(self._run, run_id, kind, command, args, shell, slots, session)
+        except RuntimeError as e:
+            slots.release()
+            self.log.error(f"{kind}命令提交失败: {e}")
+            return False
+        return True
 
-            if result.returncode == 0:
-                self.log.info(f"PowerShell命令执行成功: {command}")
-                if result.stdout:
-                    self.log.info(f"输出: {result.stdout.strip()}")
+    def _run(self, run_id, kind, command, args, shell, slots, session=None):
+        """在线程池中执行命令，逐行上报输出，结束后上报返回码和耗时"""
+        lines = deque(maxlen=self.output_lines)
+        attributes = {"id": run_id, "kind": kind, "command": command, "output": ""}
+        started = time.monotonic()
+        last_report = [started]
+
+        def on_line(line):
+            lines.append(line)
+            if time.monotonic() - last_report[0] >= self.stream_interval:
+                attributes["output"] = "\n".join(lines)
+                self._report("运行中", attributes)
+                last_report[0] = time.monotonic()
+
+        try:
+            self._report("运行中", attributes)
+            timed_out = False
+            returncode = None
+            if session is not None:
+                try:
+                    returncode = session.run(command, self.timeout, on_line)
+                    attributes["session"] = True
+                except TimeoutError:
+                    timed_out = True
+                except ShellStartError as e:
+                    # 常驻会话不可用时退回单次执行
+                    self.log.warning(f"{e}，改为单次执行")
+            if returncode is None and not timed_out:
+                returncode, timed_out = self._run_process(run_id, args, shell, on_line)
+
+            duration = round(time.monotonic() - started, 3)
+            attributes.update(output="\n".join(lines), exit_code=returncode, duration=duration)
+
+            if timed_out:
+                self.log.error(f"{kind}命令执行超时: {command}")
+                self._report("超时", attributes)
+            elif returncode == 0:
+                self.log.info(f"{kind}命令执行成功 ({duration}s): {command}")
+                if lines:
+                    self.log.info(f"输出: {attributes['output']}")
+                self._report("成功", attributes)
             else:
-                self.log.warning(f"PowerShell命令执行失败 (返回码: {result.returncode}): {command}")
-                if result.stderr:
-                    self.log.warning(f"错误: {result.stderr.strip()}")
+                self.log.warning(f"{kind}命令执行失败 (返回码: {returncode}): {command}")
+                if lines:
+                    self.log.warning(f"输出: {attributes['output']}")
+                self._report("失败", attributes)
 
-        except subprocess.TimeoutExpired:
-            self.log.error(f"PowerShell命令执行超时: {command}")
         except Exception as e:
-            self.log.error(f"执行 PowerShell 命令失败: {e}")
\ No newline at end of file
+            self.log.error(f"执行 {kind} 命令失败: {e}")
+            attributes.update(output="\n".join(lines), error=str(e), duration=round(time.monotonic() - started, 3))
+            self._report("失败", attributes)
+        finally:
+            slots.release()
+
+    def _run_process(self, run_id, args, shell, on_line):
+        """
+        单次启动进程执行命令
+        :return: (返回码, 是否超时)
+        """
+        timed_out = threading.Event()
+        process = subprocess.Popen(
+            args,
+            shell=shell,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,  # 合并错误输出，保持输出顺序
+            stdin=subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            bufsize=1
+        )
+        with self.lock:
+            self.processes[run_id] = process
+
+        def kill():
+            timed_out.set()
+            self._kill_tree(process)
+
+        timer = threading.Timer(self.timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            for line in process.stdout:
+                on_line(line.rstrip("\r\n"))
+            return process.wait(), timed_out.is_set()
+        finally:
+            timer.cancel()
+            with self.lock:
+                self.processes.pop(run_id, None)
+
+    def _report(self, state, attributes):
+        """更新命令输出传感器"""
+        if self.output_sensor is None:
+            return
+        try:
+            self.output_sensor.set_attributes(attributes)
+            self.output_sensor.set_state(state)
+        except Exception as e:
+            self.log.debug(f"更新命令输出传感器失败: {e}")
+
+    def start(self):
+        """创建执行队列"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="CmdWorker")
+            self.slots = threading.BoundedSemaphore(self.max_concurrency + self.queue_size)
+
+    def stop(self):
+        """停止执行队列并结束正在运行的命令"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        with self.lock:
+            processes = list(self.processes.values())
+        for process in processes:
+            self._kill_tree(process)
+        if self.powershell_session is not None:
+            self.powershell_session.close()
+
+    @staticmethod
+    def _kill_tree(process):
+        """结束进程及其子进程（shell 启动的子进程会占用输出管道）"""
+        try:
+            children = psutil.Process(process.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+        for child in children:
+            try:
+                child.kill()
+            except psutil.Error:
+                pass
+        try:
+            process.kill()
+        except OSError:
+            pass
@@ -0,0 +1,213 @@
+"""
+常驻 Shell 会话
+保持一个解释器进程，通过 stdin 逐条发送命令，用唯一分隔标记划分每条命令的输出和返回码，
+省去每条命令重新启动解释器的开销。进程崩溃或命令超时后在下一条命令时自动重启
+"""
+import base64
+import queue
+import subprocess
+import threading
+import uuid
+import psutil
+
+
+class ShellSessionError(RuntimeError):
+    """会话进程意外退出"""
+
+
+class ShellStartError(ShellSessionError):
+    """会话进程无法启动"""
+
+
+def _posix_wrap(command, sentinel):
+    # 命令输出末尾可能没有换行，分隔标记前补一个换行，解析时忽略
+    return f"{command}\n__rc=$?; printf '\\n%s %s\\n' '{sentinel}' \"$__rc\"\n"
+
+
+def _powershell_wrap(command, sentinel):
+    # 命令以 base64 传入，避免引号转义和多行命令被逐行执行
+    encoded = base64.b64encode(command.encode("utf-8")).decode("ascii")
+    return (
+        "$global:LASTEXITCODE = 0; $__err = $false; "
+        f"$__c = [Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{encoded}')); "
+        "try { Invoke-Expression $__c 2>&1 | ForEach-Object { "
+        "if ($_ -is [System.Management.Automation.ErrorRecord]) { $__err = $true }; $_ } | Out-String -Stream "
+        "} catch { $_ | Out-String -Stream; $__err = $true }; "
+        "$__rc = if ($global:LASTEXITCODE) { $global:LASTEXITCODE } elseif ($__err) { 1 } else { 0 }; "
+        f"[Console]::Out.WriteLine(''); [Console]::Out.WriteLine('{sentinel} ' + $__rc); [Console]::Out.Flush()\n"
+    )
+
+
+class ShellSession:
+    def __init__(self, argv, wrap, log, init_script="", encoding="utf-8", name="Shell"):
+        """
+        :param argv: 解释器启动参数（从 stdin 读取命令）
+        :param wrap: 生成单条命令脚本的函数 wrap(command, sentinel)，脚本执行完需输出 "<sentinel> <返回码>"
+        :param log: 日志对象
+        :param init_script: 进程启动后先执行的脚本（如设置输出编码）
+        :param encoding: 进程输入输出编码
+        :param name: 会话名称（用于日志）
+        """
+        self.argv = argv
+        self.wrap = wrap
+        self.log = log
+        self.init_script = init_script
+        self.encoding = encoding
+        self.name = name
+        self.process = None
+        self.started = 0  # 进程启动次数
+        self.restarts = 0
+        self._lines = None
+        self._lock = threading.Lock()  # 同一时间只执行一条命令
+
+    @classmethod
+    def posix(cls, log, shell="bash"):
+        """POSIX shell 会话"""
+        return cls([shell], _posix_wrap, log, name=shell)
+
+    @classmethod
+    def powershell(cls, log, executable="powershell"):
+        """PowerShell 会话"""
+        return cls(
+            [executable, "-NoLogo", "-NoProfile", "-NonInteractive", "-Command", "-"],
+            _powershell_wrap,
+            log,
+            init_script="[Console]::OutputEncoding = [Text.Encoding]::UTF8\n",
+            name="PowerShell"
+        )
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _start(self):
+        """启动解释器进程和输出读取线程"""
+        try:
+            self.process = subprocess.Popen(
+                self.argv,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                encoding=self.encoding,
+                errors="replace",
+                bufsize=1
+            )
+        except OSError as e:
+            self.process = None
+            raise ShellStartError(f"{self.name} 会话启动失败: {e}")
+
+        self.started += 1
+        # 每个进程使用独立队列，旧进程残留的输出不会混入新会话
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=self._read_output, args=(self.process, self._lines),
+            name=f"{self.name}SessionReader", daemon=True
+        ).start()
+        if self.init_script:
+            self._write(self.init_script)
+        self.log.debug(f"{self.name} 常驻会话已启动 (pid {self.process.pid})")
+
+    @staticmethod
+    def _read_output(process, lines):
+        """读取进程输出，进程退出时放入 None"""
+        try:
+            for line in process.stdout:
+                lines.put(line)
+        except (OSError, ValueError):
+            pass
+        lines.put(None)
+
+    def _write(self, text):
+        try:
+            self.process.stdin.write(text)
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise ShellSessionError(f"{self.name} 会话写入失败: {e}")
+
+    def run(self, command, timeout=30, on_line=None):
+        """
+        在会话中执行一条命令
+        :param command: 命令文本
+        :param timeout: 超时时间（秒），超时后结束会话进程
+        :param on_line: 每行输出的回调 on_line(line)
+        :return: 返回码
+        :raises TimeoutError: 命令超时
+        :raises ShellStartError: 会话无法启动
+        :raises ShellSessionError: 执行中会话意外退出
+        """
+        with self._lock:
+            if not self.is_alive():
+                if self.started:
+                    self.restarts += 1
+                self._start()
+
+            sentinel = f"__PCTOOLS_{uuid.uuid4().hex}__"
+            self._write(self.wrap(command, sentinel))
+
+            lines = self._lines
+            pending = None  # 暂存的空行，分隔标记前补的换行不作为输出
+            deadline = threading.Event()
+            timer = threading.Timer(timeout, deadline.set)
+            timer.daemon = True
+            timer.start()
+            try:
+                while True:
+                    try:
+                        line = lines.get(timeout=0.1)
+                    except queue.Empty:
+                        if deadline.is_set():
+                            self.kill()
+                            raise TimeoutError(f"{self.name} 命令执行超时")
+                        continue
+
+                    if line is None:
+                        self.kill()
+                        raise ShellSessionError(f"{self.name} 会话意外退出")
+
+                    line = line.rstrip("\r\n")
+                    index = line.find(sentinel)
+                    if index >= 0:
+                        if line[:index]:
+                            self._emit(on_line, pending)
+                            self._emit(on_line, line[:index])
+                        try:
+                            return int(line[index + len(sentinel):].strip() or 0)
+                        except ValueError:
+                            return 1
+
+                    self._emit(on_line, pending)
+                    pending = line if line == "" else None
+                    if pending is None:
+                        self._emit(on_line, line)
+            finally:
+                timer.cancel()
+
+    @staticmethod
+    def _emit(on_line, line):
+        if on_line is not None and line is not None:
+            on_line(line)
+
+    def kill(self):
+        """结束会话进程及其子进程，下一条命令时重启"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            for child in psutil.Process(process.pid).children(recursive=True):
+                child.kill()
+        except psutil.Error:
+            pass
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    def close(self):
+        """关闭会话"""
+        process = self.process
+        if process is not None and process.poll() is None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=2)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
@@ -3,13 +3,15 @@
 """
 import base64
 import hashlib
-import flet as ft
+from LazyImport import lazy_import
 import os
 import subprocess
 from ha_mqtt_discoverable.sensors import Button, ButtonInfo
 from ha_mqtt_discoverable import Settings
 from paho.mqtt.client import Client as MQTTClient
 
+ft = lazy_import("flet")
+
 
 def generate_short_id(filename: str) -> str:
     '''
@@ -3,10 +3,13 @@
 这是一个标准的插件示例，展示了所有可用的方法和配置
 适配新版 MQTT 架构 (ha-mqtt-discoverable)
 """
-import flet as ft
+from LazyImport import lazy_import
 from ha_mqtt_discoverable import Settings
 from ha_mqtt_discoverable.sensors import Sensor, SensorInfo, Switch, SwitchInfo, Button, ButtonInfo
 
+# 界面库只在 setting_page 中使用，延迟到首次访问时导入（见 LazyImport.lazy_import）
+ft = lazy_import("flet")
+
 class Example:
     """插件模板类(需要确保类名和文件夹名一致，只会加载同名py文件)"""
 
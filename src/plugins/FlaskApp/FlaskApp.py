@@ -1,21 +1,68 @@
 import time
-import numpy as np
-import cv2
 from flask import Flask, Response, request, jsonify
 import multiprocessing
 import signal
 import os
-import mss
 import requests
-import flet as ft
+from LazyImport import lazy_import
 from ha_mqtt_discoverable import Settings
-from ha_mqtt_discoverable.sensors import Select, SelectInfo
+from ha_mqtt_discoverable.sensors import Select, SelectInfo, Sensor, SensorInfo
+from plugins.FlaskApp.FrameBroadcaster import FrameBroadcaster, FramePacer, QualityController, FrameStats, \
+    ChangeDetector
+
+ft = lazy_import("flet")
+np = lazy_import("numpy")  # 图像相关依赖在首次截图/推流时才导入
+cv2 = lazy_import("cv2")
+mss = lazy_import("mss")
 
 app = Flask(__name__)
 select_monitor = 1  # 默认选择第一个显示器
 camera_index = 2
 
 
+class ScreenSource:
+    """显示器截图源，在采集线程中创建（mss 实例不能跨线程使用）"""
+
+    def __init__(self, index):
+        self.sct = mss.mss()
+        self.monitor = self.sct.monitors[index]
+        self.detector = ChangeDetector()
+        self.frame = None  # 上次编码结果
+        self.params = None  # 上次编码参数 (quality, scale)
+
+    def read(self, quality=70, scale=1.0, force=False):
+        """
+        截图并编码，画面和编码参数都未变化时跳过编码
+        :param force: 画面未变化时也返回上一帧（关键帧）
+        :return: JPEG 数据，未变化且非关键帧时返回 None
+        """
+        shot = self.sct.grab(self.monitor)
+        changed = self.detector.changed(shot.raw)
+        if not changed and self.frame is not None and self.params == (quality, scale):
+            return self.frame if force else None
+
+        self.frame = encode_jpeg(np.array(shot), quality, scale)
+        self.params = (quality, scale)
+        return self.frame
+
+    def close(self):
+        self.sct.close()
+
+
+def encode_jpeg(image, quality, scale=1.0):
+    """按缩放比例和质量编码为 JPEG"""
+    if scale < 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+# 每个显示器一个采集线程，所有推流和截图请求共享编码结果（启动时按配置的帧率重新创建）
+screens = FrameBroadcaster(ScreenSource, name="Screen")
+camera_stats = FrameStats()
+stream_fps = 20
+
+
 @app.route('/set_monitor/<int:monitor_index>', methods=['GET'])
 def set_monitor(monitor_index):
     global select_monitor
@@ -32,19 +79,11 @@ def set_monitor(monitor_index):
 
 @app.route('/screenshot.jpg')
 def get_screenshot():
-    with mss.mss() as sct:
-        monitor = sct.monitors[select_monitor]
-        screenshot = np.array(sct.grab(monitor))
-
-        if screenshot.shape[1] > 1920:
-            screenshot = cv2.resize(screenshot, (1920, 1080))
-
-        _, buffer = cv2.imencode('.jpg', screenshot, [
-            cv2.IMWRITE_JPEG_QUALITY, 80,
-            cv2.IMWRITE_JPEG_OPTIMIZE, 1
-        ])
-
-        return Response(buffer.tobytes(), mimetype='image/jpeg')
+    # 有推流时直接使用最新一帧，否则由采集线程采集一帧
+    frame = screens.get(select_monitor).latest()
+    if frame is None:
+        return Response("截图失败", status=503)
+    return Response(frame, mimetype='image/jpeg')
 
 
 @app.route('/screen')
@@ -68,39 +107,57 @@ def set_camera(cam_index):
 
 
 def generate_screenshots():
-    with mss.mss() as sct:
-        monitor = sct.monitors[select_monitor]
-        current_monitor = select_monitor
-        while True:
-            if current_monitor != select_monitor:
-                monitor = sct.monitors[select_monitor]
-            screenshot = np.array(sct.grab(monitor))
-            _, buffer = cv2.imencode('.jpg', screenshot,
-                                     [cv2.IMWRITE_JPEG_QUALITY, 70])
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.05)
+    while True:
+        monitor = select_monitor
+        reader = screens.get(monitor).frames()
+        try:
+            for frame in reader:
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                if select_monitor != monitor:
+                    # 切换显示器后改为读取新显示器的采集线程
+                    break
+        finally:
+            reader.close()
 
 
 def generate_frames():
     global camera_index
     camera = cv2.VideoCapture(camera_index)
-    while True:
-        success, frame = camera.read()
-        if not success:
-            with open(r"img/failed.jpeg", "rb") as f:
-                frame = f.read()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        else:
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
+    pacer = FramePacer(stream_fps)
+    controller = QualityController(stream_fps)
+    try:
+        while True:
+            pacer.wait()
+            started = time.monotonic()
+            success, frame = camera.read()
+            if not success:
+                with open(r"img/failed.jpeg", "rb") as f:
+                    frame = f.read()
+            else:
+                frame = encode_jpeg(frame, controller.quality, controller.scale)
+            encode_time = time.monotonic() - started
+            camera_stats.add(encode_time, len(frame))
+
+            sent = time.monotonic()
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            controller.update(encode_time + time.monotonic() - sent)
+    finally:
+        camera.release()
+
 
+@app.route('/stats')
+def get_stats():
+    """推流统计：实际帧率、采集编码耗时、每帧字节数"""
+    screen = screens.get(select_monitor).get_stats()
+    return jsonify({'screen': screen, 'camera': camera_stats.to_dict()})
 
-def run_flask_app(host, port):
+
+def run_flask_app(host, port, fps=20, keyframe_interval=2.0):
+    global screens, stream_fps
+    stream_fps = fps
+    screens = FrameBroadcaster(ScreenSource, fps=fps, name="Screen", keyframe_interval=keyframe_interval)
     app.run(host=host, port=port, debug=False)
 
 
@@ -115,6 +172,11 @@ class FlaskApp:
         self.current_monitor = 1
         self.camera_index = 2
 
+        # 推流诊断传感器
+        self.stats_interval = self.core.get_plugin_config("FlaskApp", "stats_interval", 10)
+        self.stats_timer = None
+        self.stats_sensors = {}  # {统计项: Sensor}
+
         # 获取可用的显示器列表
         self.monitor_options = self.get_monitor_options()
 
@@ -175,6 +237,22 @@ class FlaskApp:
             initial_camera = self.core.get_plugin_config("FlaskApp", "camera_index", 2)
             self.camera_select.select_option(str(initial_camera))
 
+            # 创建推流诊断传感器
+            self.stats_sensors = {}
+            for key, unit, icon in (("fps", "fps", "mdi:speedometer"),
+                                    ("encode_ms", "ms", "mdi:timer-outline"),
+                                    ("bytes_per_frame", "B", "mdi:file-image-outline")):
+                stats_info = SensorInfo(
+                    name=f"stream_{key}",
+                    unique_id=f"{self.core.mqtt.device_name}_FlaskApp_stream_{key}",
+                    object_id=f"{self.core.mqtt.device_name}_FlaskApp_stream_{key}",
+                    device=device_info,
+                    unit_of_measurement=unit,
+                    entity_category="diagnostic",
+                    icon=icon
+                )
+                self.stats_sensors[key] = Sensor(Settings(mqtt=mqtt_settings, entity=stats_info))
+
             self.core.log.info(
                 f"FlaskApp MQTT实体创建成功，可用显示器: {self.monitor_options}, 摄像头: {camera_options}")
         except Exception as e:
@@ -204,21 +282,49 @@ class FlaskApp:
                 # 从配置中获取主机和端口
                 web_path = self.core.get_plugin_config("FlaskApp", "web_path", "0.0.0.0")
                 fps = self.core.get_plugin_config("FlaskApp", "fps", 30)
+                keyframe_interval = self.core.get_plugin_config("FlaskApp", "keyframe_interval", 2.0)
 
                 self.process = multiprocessing.Process(
-                    target=run_flask_app, args=(web_path, self.port))
+                    target=run_flask_app, args=(web_path, self.port, fps, keyframe_interval))
                 self.process.start()
                 self.core.log.info(f"Flask进程启动 http://{web_path}:{self.port}，帧率: {fps}")
+
+                if self.stats_timer is None:
+                    self.stats_timer = self.core.timer.create_timer("FlaskApp_stats", self.publish_stats,
+                                                                    self.stats_interval)
+                    self.stats_timer.start()
             except Exception as e:
                 self.core.log.error(f"Flask进程启动失败: {e}")
 
     def stop(self):
+        if self.stats_timer is not None:
+            self.core.timer.remove_timer("FlaskApp_stats")
+            self.stats_timer = None
         if self.process is not None:
             os.kill(self.process.pid, signal.SIGTERM)
             self.process.join()
             self.process = None
             self.core.log.debug("Flask进程停止")
 
+    def publish_stats(self):
+        """从 Flask 进程读取推流统计并发布到诊断传感器"""
+        if not self.stats_sensors:
+            return
+        try:
+            stats = requests.get(f"http://localhost:{self.port}/stats", timeout=2).json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.core.log.debug(f"读取推流统计失败: {e}")
+            return
+
+        screen, camera = stats.get("screen", {}), stats.get("camera", {})
+        for key, sensor in self.stats_sensors.items():
+            attributes = {"camera": camera.get(key)}
+            if key == "fps":
+                attributes.update(clients=screen.get("clients"), quality=screen.get("quality"),
+                                  scale=screen.get("scale"))
+            sensor.set_attributes(attributes)
+            sensor.set_state(screen.get(key, 0))
+
     def change_monitor(self, index):
         url = f"http://localhost:{self.port}/set_monitor/{index}"
         try:
@@ -0,0 +1,328 @@
+"""
+画面广播
+每个画面来源只有一个采集线程负责截图和编码，编码结果放入共享槽位，
+所有客户端读取同一帧；客户端总是拿到最新的一帧（来不及读取的旧帧直接丢弃），
+没有客户端时采集线程暂停并释放采集资源。
+采集按目标帧率定时，编码或发送耗时超出每帧预算时自动降低画质和分辨率；
+画面没有变化时不重新编码也不发送，只按关键帧间隔重发上一帧
+"""
+import threading
+import time
+from collections import deque
+
+
+class FramePacer:
+    """按固定帧率计算下一帧的截止时间（time.monotonic），落后超过一帧时重新对齐，不补帧"""
+
+    def __init__(self, fps):
+        self.interval = 1.0 / max(1, fps)
+        self.deadline = None
+
+    def wait(self):
+        """等待到下一帧的截止时间"""
+        now = time.monotonic()
+        if self.deadline is None or now - self.deadline > self.interval:
+            self.deadline = now
+        else:
+            delay = self.deadline - now
+            if delay > 0:
+                time.sleep(delay)
+        self.deadline += self.interval
+
+
+class QualityController:
+    """
+    根据每帧耗时调整 JPEG 质量和缩放比例
+    耗时超过预算的 90% 时先降质量，质量到下限后再降分辨率；
+    连续多帧耗时低于预算一半时按相反顺序恢复
+    """
+    SCALES = (1.0, 0.75, 0.5, 0.35)
+
+    def __init__(self, fps, quality=70, min_quality=35, max_quality=80, step=5, recover_frames=30):
+        self.budget = 1.0 / max(1, fps)
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.step = step
+        self.recover_frames = recover_frames
+        self.scale_index = 0
+        self.cost = 0.0  # 每帧耗时的指数平均（秒）
+        self._fast_frames = 0
+
+    @property
+    def scale(self):
+        return self.SCALES[self.scale_index]
+
+    def update(self, cost):
+        """
+        记录一帧的耗时（采集编码 + 发送）
+        :param cost: 秒
+        """
+        self.cost = cost if self.cost == 0 else self.cost * 0.8 + cost * 0.2
+        if self.cost > self.budget * 0.9:
+            self._fast_frames = 0
+            if self.quality > self.min_quality:
+                self.quality = max(self.min_quality, self.quality - self.step)
+            elif self.scale_index < len(self.SCALES) - 1:
+                self.scale_index += 1
+            self.cost = 0.0  # 调整后重新统计，避免连续多次下调
+        elif self.cost < self.budget * 0.5:
+            self._fast_frames += 1
+            if self._fast_frames >= self.recover_frames:
+                self._fast_frames = 0
+                if self.scale_index > 0:
+                    self.scale_index -= 1
+                elif self.quality < self.max_quality:
+                    self.quality = min(self.max_quality, self.quality + self.step)
+        else:
+            self._fast_frames = 0
+
+
+class ChangeDetector:
+    """比较原始像素缓冲区判断画面是否变化（逐字节比较，远快于 JPEG 编码）"""
+
+    def __init__(self):
+        self.last = None
+
+    def changed(self, buffer) -> bool:
+        """与上次的缓冲区比较，变化时记录新内容"""
+        if self.last is not None and len(self.last) == len(buffer) and self.last == buffer:
+            return False
+        self.last = bytes(buffer)
+        return True
+
+    def reset(self):
+        self.last = None
+
+
+class FrameStats:
+    """实际帧率、采集编码耗时、每帧字节数（可被多个推流线程和统计请求同时访问）"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.times = deque()
+        self.encode_ms = 0.0
+        self.frame_bytes = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, encode_seconds, size, now=None):
+        now = time.monotonic() if now is None else now
+        encode_ms = encode_seconds * 1000
+        with self._lock:
+            self.times.append(now)
+            while self.times and self.times[0] < now - self.window:
+                self.times.popleft()
+            self.encode_ms = encode_ms if self.encode_ms == 0 else self.encode_ms * 0.9 + encode_ms * 0.1
+            self.frame_bytes = size if self.frame_bytes == 0 else self.frame_bytes * 0.9 + size * 0.1
+
+    def fps(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            recent = [t for t in self.times if t >= now - self.window]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / max(1e-6, recent[-1] - recent[0])
+
+    def to_dict(self):
+        fps = self.fps()
+        with self._lock:
+            encode_ms, frame_bytes = self.encode_ms, self.frame_bytes
+        return {
+            "fps": round(fps, 1),
+            "encode_ms": round(encode_ms, 1),
+            "bytes_per_frame": round(frame_bytes)
+        }
+
+
+class FrameProducer:
+    def __init__(self, open_source, fps=20, name="Frame", log=None, keyframe_interval=2.0):
+        """
+        :param open_source: 创建采集源的函数，返回对象需提供 read(quality, scale, force) 和 close()；
+                            read 在画面未变化且 force 为 False 时返回 None，否则返回编码结果；
+                            在采集线程中调用（部分采集库的实例不能跨线程使用）
+        :param fps: 目标帧率
+        :param name: 名称（用于线程名和日志）
+        :param log: 日志对象
+        :param keyframe_interval: 画面未变化时重发上一帧的间隔（秒），保持客户端连接
+        """
+        self.open_source = open_source
+        self.fps = fps
+        self.keyframe_interval = keyframe_interval
+        self.name = name
+        self.log = log
+        self.pacer = FramePacer(fps)
+        self.controller = QualityController(fps)
+        self.frame_stats = FrameStats()
+        self.send_time = 0.0  # 客户端发送一帧的最长耗时（秒）
+
+        self.frame = None  # 最新一帧编码结果
+        self.seq = 0  # 帧序号
+        self.frame_time = 0  # 最新一帧的采集时间（time.monotonic）
+        self.checks = 0  # 采集次数（包括画面未变化的）
+        self.check_time = 0  # 最近一次采集时间，画面未变化时最新一帧仍是当前画面
+        self.clients = 0
+        self.stats = {"captured": 0, "skipped": 0, "errors": 0}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}Producer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        source = None
+        while True:
+            with self._cond:
+                idle = self.clients == 0
+                if idle and source is None:
+                    self._cond.wait()
+                    continue
+            if idle:
+                # 没有客户端，释放采集源后等待
+                self._close(source)
+                source = None
+                continue
+
+            self.pacer.wait()
+            started = time.monotonic()
+            try:
+                if source is None:
+                    source = self.open_source()
+                force = time.monotonic() - self.frame_time >= self.keyframe_interval
+                frame = source.read(self.controller.quality, self.controller.scale, force)
+            except Exception as e:
+                self.stats["errors"] += 1
+                if self.log:
+                    self.log.error(f"{self.name} 采集失败: {e}")
+                self._close(source)
+                source = None
+                time.sleep(1)
+                continue
+
+            encode_time = time.monotonic() - started
+            if frame is None:
+                # 画面未变化，不更新帧，客户端不会收到重复数据
+                with self._cond:
+                    self.checks += 1
+                    self.check_time = time.monotonic()
+                    self.stats["skipped"] += 1
+                    self._cond.notify_all()
+                continue
+
+            with self._cond:
+                self.checks += 1
+                self.check_time = time.monotonic()
+                self.frame = frame
+                self.seq += 1
+                self.frame_time = time.monotonic()
+                self.stats["captured"] += 1
+                self.frame_stats.add(encode_time, len(frame))
+                send_time, self.send_time = self.send_time, 0.0
+                self._cond.notify_all()
+            # 采集编码和最慢客户端的发送都计入每帧耗时
+            self.controller.update(encode_time + send_time)
+
+    def _close(self, source):
+        if source is None:
+            return
+        try:
+            source.close()
+        except Exception as e:
+            if self.log:
+                self.log.debug(f"{self.name} 采集源关闭失败: {e}")
+
+    def frames(self, timeout=5.0):
+        """
+        客户端读取生成器，每次返回比上次更新的最新一帧
+        已有画面时新客户端立即收到当前帧（画面不变时不会再有新帧）
+        客户端断开（生成器关闭）时自动注销
+        """
+        with self._cond:
+            self.clients += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+            last = self.seq - 1 if self.frame is not None else self.seq
+        try:
+            while True:
+                with self._cond:
+                    if self.seq == last:
+                        self._cond.wait_for(lambda: self.seq != last, timeout)
+                    if self.seq == last:
+                        continue
+                    frame, last = self.frame, self.seq
+                sent = time.monotonic()
+                yield frame
+                # 生成器恢复时上一帧已写出，间隔即为发送耗时
+                elapsed = time.monotonic() - sent
+                with self._cond:
+                    self.send_time = max(self.send_time, elapsed)
+        finally:
+            with self._cond:
+                self.clients -= 1
+
+    def latest(self, max_age=1.0, timeout=5.0):
+        """
+        获取一帧：最新帧足够新时直接返回，否则等待采集下一帧
+        :return: 编码结果，超时返回 None
+        """
+        with self._cond:
+            if self.frame is not None and time.monotonic() - self.check_time <= max_age:
+                return self.frame
+
+            self.clients += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+            last = self.checks
+            try:
+                self._cond.wait_for(lambda: self.checks != last and self.frame is not None, timeout)
+                return self.frame if self.checks != last else None
+            finally:
+                self.clients -= 1
+
+    def get_stats(self):
+        """采集统计：实际帧率、耗时、每帧大小、当前画质"""
+        with self._cond:
+            stats = self.frame_stats.to_dict()
+            if self.clients == 0:
+                stats["fps"] = 0.0
+            stats.update(
+                clients=self.clients,
+                quality=self.controller.quality,
+                scale=self.controller.scale,
+                **self.stats
+            )
+            return stats
+
+
+class FrameBroadcaster:
+    """按来源（如显示器编号）管理采集线程"""
+
+    def __init__(self, open_source, fps=20, name="Frame", log=None, keyframe_interval=2.0):
+        """
+        :param open_source: 创建采集源的函数 open_source(key)
+        """
+        self.open_source = open_source
+        self.fps = fps
+        self.keyframe_interval = keyframe_interval
+        self.name = name
+        self.log = log
+        self.producers = {}
+        self._lock = threading.Lock()
+
+    def get(self, key) -> FrameProducer:
+        with self._lock:
+            producer = self.producers.get(key)
+            if producer is None:
+                producer = FrameProducer(
+                    lambda: self.open_source(key), self.fps, name=f"{self.name}{key}", log=self.log,
+                    keyframe_interval=self.keyframe_interval
+                )
+                self.producers[key] = producer
+            return producer
+
+    def get_stats(self) -> dict:
+        """各来源的采集统计 {key: stats}"""
+        with self._lock:
+            producers = dict(self.producers)
+        return {key: producer.get_stats() for key, producer in producers.items()}
@@ -1,7 +1,9 @@
 import multiprocessing
 import os
 import sys
-import flet as ft
+from LazyImport import lazy_import
+
+ft = lazy_import("flet")
 
 def run_ha_widget():
     from HaWidgetTask import HA_widget
@@ -1,9 +1,11 @@
 import keyboard
 import time
-import flet as ft
+from LazyImport import lazy_import
 from ha_mqtt_discoverable import Settings
 from ha_mqtt_discoverable.sensors import BinarySensor, BinarySensorInfo
 
+ft = lazy_import("flet")
+
 
 class Hotkey:
     def __init__(self, core):
@@ -1,9 +1,11 @@
 import time
 import keyboard
-import flet as ft
+from LazyImport import lazy_import
 from ha_mqtt_discoverable import Settings
 from ha_mqtt_discoverable.sensors import Button, ButtonInfo, Number, NumberInfo
 
+ft = lazy_import("flet")
+
 
 class KeySim:
     def __init__(self, core):
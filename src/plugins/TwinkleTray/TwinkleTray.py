@@ -8,11 +8,13 @@ import re
 import os
 import time
 import keyboard
-import flet as ft
+from LazyImport import lazy_import
 from ha_mqtt_discoverable.sensors import Light, LightInfo, Text, TextInfo
 from ha_mqtt_discoverable import Settings
 from paho.mqtt.client import Client as MQTTClient
 
+ft = lazy_import("flet")
+
 
 def _remove_ansi_escape(text):
     ansi_escape = re.compile(r'\x1b\[[0-9;]*m')
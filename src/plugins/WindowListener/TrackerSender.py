@@ -0,0 +1,188 @@
+"""
+Runtime Tracker 上报
+上报在后台线程中发送，不阻塞前台窗口监听：
+- 防抖窗口内的多次应用切换只发送最后一次
+- 复用 HTTP 连接，失败时按指数退避重试
+- 接口不可用时未发送的记录写入本地缓存文件，恢复后按顺序补发
+"""
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+import requests
+from Config import atomic_write_json
+
+
+class TrackerSender:
+    def __init__(self, log, url_provider, debounce=1.0, timeout=5, max_retries=5,
+                 queue_size=100, spool_path=Path("runtime_tracker_spool.json")):
+        """
+        :param log: 日志对象
+        :param url_provider: 返回上报地址的函数（发送时读取，配置修改后立即生效）
+        :param debounce: 防抖窗口（秒）
+        :param timeout: 单次请求超时（秒）
+        :param max_retries: 单轮发送的最大重试次数，超过后写入缓存文件
+        :param queue_size: 待发送记录上限，超出时丢弃最早的记录
+        :param spool_path: 缓存文件
+        """
+        self.log = log
+        self.url_provider = url_provider
+        self.debounce = debounce
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.queue_size = queue_size
+        self.spool_path = Path(spool_path)
+
+        self.session = requests.Session()
+        self.outbox = deque()  # 待发送的记录
+        self.stats = {"submitted": 0, "coalesced": 0, "sent": 0, "failed": 0, "dropped": 0, "spooled": 0}
+        self._latest = None  # 防抖窗口内最新的记录
+        self._latest_at = 0
+        self._last_sent = None  # 最近一次成功发送的应用名
+        self._cond = threading.Condition()
+        self._stop = False
+        self.thread = threading.Thread(target=self._run, name="TrackerSender", daemon=True)
+        self.thread.start()
+
+    def submit(self, payload: dict):
+        """提交一条上报记录（不阻塞）"""
+        with self._cond:
+            if self._latest is not None:
+                self.stats["coalesced"] += 1
+            self._latest = payload
+            self._latest_at = time.monotonic()
+            self.stats["submitted"] += 1
+            self._cond.notify()
+
+    def stop(self):
+        """停止发送线程，未发送的记录写入缓存文件"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self.thread.join(timeout=self.timeout + 1)
+        self.session.close()
+
+    # ===== 发送线程 =====
+
+    def _take_latest(self):
+        """等待防抖窗口结束，取出最新记录；有待发送记录时不等待新记录"""
+        with self._cond:
+            while not self._stop:
+                if self._latest is None:
+                    if self.outbox:
+                        return None
+                    self._cond.wait()
+                    continue
+                remaining = self._latest_at + self.debounce - time.monotonic()
+                if remaining <= 0:
+                    payload, self._latest = self._latest, None
+                    return payload
+                self._cond.wait(remaining)
+            payload, self._latest = self._latest, None
+            return payload
+
+    def _enqueue(self, payload):
+        if payload is None:
+            return
+        last = self.outbox[-1].get("app_name") if self.outbox else self._last_sent
+        if payload.get("app_name") == last:
+            return
+        self.outbox.append(payload)
+        while len(self.outbox) > self.queue_size:
+            self.outbox.popleft()
+            self.stats["dropped"] += 1
+
+    def _run(self):
+        self._load_spool()
+        while True:
+            self._enqueue(self._take_latest())
+            if self._stop:
+                self._save_spool()
+                return
+            if self.outbox and not self._flush():
+                self._save_spool()
+                self._wait(self._backoff(self.max_retries))
+
+    def _wait(self, seconds):
+        """可被停止打断的等待"""
+        with self._cond:
+            if not self._stop:
+                self._cond.wait(seconds)
+
+    def _backoff(self, attempt):
+        return min(60, 2 ** attempt)
+
+    def _flush(self):
+        """按顺序发送待发送记录，返回是否全部发送完成"""
+        while self.outbox:
+            payload = self.outbox[0]
+            for attempt in range(self.max_retries + 1):
+                if self._stop:
+                    return False
+                result = self._post(payload)
+                if result is not None:
+                    break
+                if attempt < self.max_retries:
+                    self._wait(self._backoff(attempt))
+            else:
+                self.stats["failed"] += 1
+                return False
+
+            self.outbox.popleft()
+            if result:
+                self._last_sent = payload.get("app_name")
+                self.stats["sent"] += 1
+        self._clear_spool()
+        return True
+
+    def _post(self, payload):
+        """
+        发送一条记录
+        :return: True 成功，False 被拒绝（不重试），None 需要重试
+        """
+        url = self.url_provider()
+        if not url:
+            self.log.error("未配置上报地址")
+            return False
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.log.warning(f"上报失败，稍后重试: {e}")
+            return None
+
+        if response.status_code == 200:
+            self.log.info(f"成功上报: {payload.get('app_name')}")
+            return True
+        if response.status_code >= 500 or response.status_code == 429:
+            self.log.warning(f"上报失败 ({response.status_code})，稍后重试")
+            return None
+        self.log.error(f"上报失败: {response.text}")
+        return False
+
+    # ===== 缓存文件 =====
+
+    def _load_spool(self):
+        try:
+            if self.spool_path.exists():
+                with open(self.spool_path, "r", encoding="utf-8") as f:
+                    spooled = json.load(f)
+                self.outbox.extendleft(reversed(spooled))
+                self.log.info(f"读取到 {len(spooled)} 条未发送的上报记录")
+        except Exception as e:
+            self.log.error(f"读取上报缓存失败: {e}")
+
+    def _save_spool(self):
+        if not self.outbox:
+            return
+        try:
+            atomic_write_json(self.spool_path, list(self.outbox)[-self.queue_size:])
+            self.stats["spooled"] = len(self.outbox)
+        except Exception as e:
+            self.log.error(f"写入上报缓存失败: {e}")
+
+    def _clear_spool(self):
+        try:
+            self.spool_path.unlink(missing_ok=True)
+        except OSError as e:
+            self.log.error(f"删除上报缓存失败: {e}")
@@ -0,0 +1,265 @@
+"""
+应用使用时长统计
+记录每段前台时间，按分钟/小时/天汇总：
+- 分钟、小时、天三级桶分别只保留最近一段时间，内存占用与运行时长无关
+- 每段前台时间追加写入日志文件，定期把汇总结果原子写入快照并清空日志
+- 压缩在后台线程中执行，写入快照期间不持有锁，前台切换不会被文件读写阻塞
+- 启动时读取快照，再重放快照之后的日志
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from Config import atomic_write_json
+
+MINUTE = 60
+HOUR = 3600
+
+
+def _hour_start(ts):
+    """ts 所在本地小时的起始时间"""
+    offset = time.localtime(ts).tm_gmtoff
+    return ts - (ts + offset) % HOUR
+
+
+def _day_key(ts):
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+
+class UsageStore:
+    def __init__(self, directory=Path("usage"), minute_hours=24, hour_days=31, day_days=400,
+                 compact_every=500, log=None):
+        """
+        :param directory: 数据目录
+        :param minute_hours: 分钟桶保留小时数
+        :param hour_days: 小时桶保留天数
+        :param day_days: 天桶保留天数
+        :param compact_every: 日志追加多少条后压缩一次
+        :param log: 日志对象
+        """
+        self.directory = Path(directory)
+        self.log_path = self.directory / "usage.log"
+        self.snapshot_path = self.directory / "usage.json"
+        self.minute_keep = minute_hours * HOUR
+        self.hour_keep = hour_days * 24 * HOUR
+        self.day_keep = day_days
+        self.compact_every = compact_every
+        self.log = log
+
+        # {桶起始时间或日期: {exe: 秒}}
+        self.minutes = defaultdict(lambda: defaultdict(float))
+        self.hours = defaultdict(lambda: defaultdict(float))
+        self.days = defaultdict(lambda: defaultdict(float))
+        self.compacted_until = 0  # 快照包含的最后一条记录的结束时间
+        self.current = None  # (exe, 开始时间) 当前前台应用
+        self.appended = 0
+        self._last_end = 0  # 最近一条记录的结束时间
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()  # 同一时间只执行一次压缩
+        self._compact_thread = None  # 已安排的后台压缩
+        self._carry = None  # 压缩期间追加的日志行，压缩完成后写回新日志
+        self._file = None
+        self._load()
+
+    # ===== 记录 =====
+
+    def switch(self, exe, now=None):
+        """
+        前台应用切换
+        :param exe: 新的前台应用，None 表示结束当前记录（如停止监听）
+        :param now: 切换时间（time.time）
+        """
+        now = time.time() if now is None else now
+        compactor = None
+        with self._lock:
+            if self.current is not None:
+                previous, start = self.current
+                if previous == exe:
+                    return
+                if now > start:
+                    self._add(previous, start, now)
+                    self._append(previous, start, now)
+                    self._last_end = now
+            self.current = (exe, now) if exe else None
+
+            # 只安排压缩，不在调用线程（窗口事件线程）中读写文件
+            if self.appended >= self.compact_every and self._compact_thread is None:
+                compactor = self._compact_thread = threading.Thread(
+                    target=self._compact_background, name="UsageCompact", daemon=True
+                )
+        if compactor is not None:
+            compactor.start()
+
+    def _add(self, exe, start, end):
+        """把一段前台时间累加到各级桶"""
+        minute_floor = end - self.minute_keep
+        piece_start = start
+        while piece_start < end:
+            hour = _hour_start(piece_start)
+            piece_end = min(end, hour + HOUR)
+            seconds = piece_end - piece_start
+            self.hours[hour][exe] += seconds
+            self.days[_day_key(piece_start)][exe] += seconds
+
+            # 只有最近的时间段才拆分到分钟桶
+            if piece_end > minute_floor:
+                t = max(piece_start, minute_floor)
+                while t < piece_end:
+                    minute = t - t % MINUTE
+                    minute_end = min(piece_end, minute + MINUTE)
+                    self.minutes[minute][exe] += minute_end - t
+                    t = minute_end
+            piece_start = piece_end
+
+    def _append(self, exe, start, end):
+        """追加写入日志"""
+        try:
+            if self._file is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.log_path, "a", encoding="utf-8", buffering=1)
+            line = f"{start:.3f}\t{end:.3f}\t{exe}\n"
+            self._file.write(line)
+            self.appended += 1
+            if self._carry is not None:
+                self._carry.append(line)
+        except OSError as e:
+            if self.log:
+                self.log.error(f"写入使用记录失败: {e}")
+
+    # ===== 查询 =====
+
+    def today(self, now=None):
+        """今日各应用使用秒数（包含当前正在进行的时段）"""
+        now = time.time() if now is None else now
+        key = _day_key(now)
+        with self._lock:
+            usage = dict(self.days.get(key, {}))
+            if self.current is not None:
+                exe, start = self.current
+                day_start = now - (now + time.localtime(now).tm_gmtoff) % (24 * HOUR)
+                usage[exe] = usage.get(exe, 0) + now - max(start, day_start)
+        return usage
+
+    def top(self, n=5, now=None):
+        """今日使用时长前 n 的应用 [(exe, 秒)]"""
+        return sorted(self.today(now).items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def range(self, level, start, end):
+        """
+        指定级别、时间范围内的汇总
+        :param level: "minute" / "hour" / "day"
+        :param start: 起始（分钟、小时为时间戳，天为日期字符串）
+        :param end: 结束（不含）
+        :return: {exe: 秒}
+        """
+        buckets = {"minute": self.minutes, "hour": self.hours, "day": self.days}[level]
+        result = defaultdict(float)
+        with self._lock:
+            for key, usage in buckets.items():
+                if start <= key < end:
+                    for exe, seconds in usage.items():
+                        result[exe] += seconds
+        return dict(result)
+
+    # ===== 持久化 =====
+
+    def _prune(self, now):
+        """丢弃超出保留期的桶"""
+        for key in [k for k in self.minutes if k < now - self.minute_keep]:
+            del self.minutes[key]
+        for key in [k for k in self.hours if k < now - self.hour_keep]:
+            del self.hours[key]
+        if len(self.days) > self.day_keep:
+            for key in sorted(self.days)[:len(self.days) - self.day_keep]:
+                del self.days[key]
+
+    def _compact_background(self):
+        try:
+            self.compact()
+        finally:
+            with self._lock:
+                self._compact_thread = None
+
+    def compact(self, now=None):
+        """
+        写入快照并清空日志
+        只在复制汇总结果和替换日志时持有锁；写入快照期间追加的记录会写回新日志
+        """
+        now = time.time() if now is None else now
+        with self._compact_lock:
+            with self._lock:
+                self._prune(now)
+                until = round(self._last_end, 3)  # 与日志中记录的精度一致
+                snapshot = {
+                    "compacted_until": until,
+                    "minutes": {str(k): dict(v) for k, v in self.minutes.items()},
+                    "hours": {str(k): dict(v) for k, v in self.hours.items()},
+                    "days": {k: dict(v) for k, v in self.days.items()},
+                }
+                self._carry = []
+
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                atomic_write_json(self.snapshot_path, snapshot)
+            except OSError as e:
+                with self._lock:
+                    self._carry = None
+                if self.log:
+                    self.log.error(f"压缩使用记录失败: {e}")
+                return
+
+            with self._lock:
+                carry, self._carry = self._carry, None
+                try:
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    # 快照写入后再替换日志；两步之间中断时，重放会跳过快照已包含的记录
+                    with open(self.log_path, "w", encoding="utf-8") as f:
+                        f.writelines(carry)
+                    self.compacted_until = until
+                    self.appended = len(carry)
+                except OSError as e:
+                    if self.log:
+                        self.log.error(f"清空使用记录日志失败: {e}")
+
+    def _load(self):
+        """读取快照并重放日志"""
+        try:
+            if self.snapshot_path.exists():
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                self.compacted_until = snapshot.get("compacted_until", 0)
+                self._last_end = self.compacted_until
+                for target, key, convert in ((self.minutes, "minutes", float), (self.hours, "hours", float),
+                                             (self.days, "days", str)):
+                    for bucket, usage in snapshot.get(key, {}).items():
+                        target[convert(bucket)].update(usage)
+        except Exception as e:
+            if self.log:
+                self.log.error(f"读取使用统计快照失败: {e}")
+
+        try:
+            if self.log_path.exists():
+                with open(self.log_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        parts = line.rstrip("\n").split("\t", 2)
+                        if len(parts) != 3:
+                            continue
+                        start, end, exe = float(parts[0]), float(parts[1]), parts[2]
+                        self.appended += 1
+                        # 每条记录要么整条包含在快照中，要么完全不包含
+                        if end <= self.compacted_until:
+                            continue
+                        self._add(exe, start, end)
+                        self._last_end = max(self._last_end, end)
+        except Exception as e:
+            if self.log:
+                self.log.error(f"重放使用记录失败: {e}")
+
+    def close(self):
+        """结束当前时段并压缩"""
+        self.switch(None)
+        self.compact()
@@ -3,15 +3,15 @@
 """
 import win32gui
 import win32process
-import threading
-import time
 import psutil
-import requests
-import flet as ft
+from LazyImport import lazy_import
 from ha_mqtt_discoverable.sensors import Sensor, SensorInfo
 from ha_mqtt_discoverable import Settings
+from plugins.WindowListener.WindowSource import WinEventHookSource, PollingSource, ProcessCache
+from plugins.WindowListener.TrackerSender import TrackerSender
+from plugins.WindowListener.UsageStore import UsageStore
 
-last_app = None
+ft = lazy_import("flet")
 
 
 class WindowListener:
@@ -22,13 +22,27 @@ class WindowListener:
         """
         self.core = core
         self.log = core.log
-        self.stop_event = threading.Event()
-        self.thread = None
+        self.source = None  # 前台窗口事件源
+        self.tracker = None  # Runtime Tracker 上报，启用上报后创建
+        self.last_window = None
+        self.process_cache = ProcessCache(
+            self._lookup_process,
+            self._process_start_time,
+            size=self.core.get_plugin_config("WindowListener.py", "pid_cache_size", 128)
+        )
+
+        # 本地应用使用时长统计
+        self.usage_enabled = self.core.get_plugin_config("WindowListener.py", "usage_enabled", True)
+        self.usage_top_n = self.core.get_plugin_config("WindowListener.py", "usage_top_n", 5)
+        self.usage_interval = self.core.get_plugin_config("WindowListener.py", "usage_publish_interval", 60)
+        self.usage = UsageStore(log=self.log) if self.usage_enabled else None
+        self.usage_timer = None
 
         # MQTT 实体
         self.window_title_sensor = None
         self.window_exe_sensor = None
         self.window_path_sensor = None
+        self.usage_sensors = []  # 今日使用时长排行
 
     def setup_entities(self):
         """设置 MQTT 实体"""
@@ -90,6 +104,22 @@ class WindowListener:
             self.window_path_sensor = Sensor(path_settings)
             self.window_path_sensor.set_state("启动中...")
 
+            # 创建今日使用时长排行传感器
+            self.usage_sensors = []
+            if self.usage is not None:
+                for rank in range(1, self.usage_top_n + 1):
+                    usage_info = SensorInfo(
+                        name=f"app_usage_top_{rank}",
+                        unique_id=f"{self.core.mqtt.device_name}_app_usage_top_{rank}",
+                        object_id=f"{self.core.mqtt.device_name}_app_usage_top_{rank}",
+                        device=device_info,
+                        icon="mdi:chart-timeline-variant",
+                        unit_of_measurement="min",
+                        display_name=f"今日使用第{rank}名"
+                    )
+                    self.usage_sensors.append(Sensor(Settings(mqtt=mqtt_settings, entity=usage_info)))
+                self.publish_usage()
+
             self.log.info("WindowListener MQTT 实体创建成功")
 
             # 创建实体后自动启动监听
@@ -99,54 +129,98 @@ class WindowListener:
             self.log.error(f"创建 WindowListener MQTT 实体失败: {e}")
 
     def start(self):
-        if self.thread and self.thread.is_alive():
+        if self.source and self.source.is_running():
             self.core.log.info("监听已在运行")
             return False
 
-        self.stop_event.clear()
-        self.thread = threading.Thread(target=self._run_listener, daemon=True)
-        self.thread.start()
-        self.core.log.debug("窗口监听已启动")
+        self.last_window = None
+        self.source = self._create_source()
+        if self.usage is not None and self.usage_timer is None:
+            self.usage_timer = self.core.timer.create_timer("WindowListener_usage", self.publish_usage,
+                                                            self.usage_interval)
+            self.usage_timer.start()
+        self.core.log.debug(f"窗口监听已启动 ({self.source.name})")
         return True
 
     def stop(self):
-        if not self.thread or not self.thread.is_alive():
+        if not self.source or not self.source.is_running():
             self.core.log.info("监听未运行")
             return False
 
-        self.stop_event.set()
-        self.thread.join(timeout=1)
+        self.source.stop()
+        if self.usage_timer is not None:
+            self.core.timer.remove_timer("WindowListener_usage")
+            self.usage_timer = None
+        if self.usage is not None:
+            self.usage.close()
+        if self.tracker is not None:
+            self.tracker.stop()
+            self.tracker = None
         self.core.log.debug("窗口监听已停止")
         return True
 
-    def _run_listener(self):
-        """后台监听线程"""
-        last_window = None
-        while not self.stop_event.is_set():
+    def _create_source(self):
+        """创建并启动前台窗口事件源，优先使用系统事件钩子，不可用时退回轮询"""
+        mode = self.core.get_plugin_config("WindowListener.py", "event_source", "auto")  # auto/hook/poll
+        if mode in ("auto", "hook"):
+            source = WinEventHookSource(self.log)
             try:
-                current_hwnd = win32gui.GetForegroundWindow()
-                if current_hwnd != last_window:
-                    last_window = current_hwnd
-                    window_info = self._get_window_info(current_hwnd)
-                    if window_info:
-                        self.log.debug(f"前台应用: {window_info['exe_name']}")
-
-                        # 上报应用变化（如果启用）
-                        if self.core.get_plugin_config("WindowListener.py", "post_enabled", False):
-                            self.report_app_change(window_info["exe_name"])
-
-                        # 更新 MQTT 传感器状态
-                        if self.window_title_sensor:
-                            self.window_title_sensor.set_state(window_info["window_title"])
-                        if self.window_exe_sensor:
-                            self.window_exe_sensor.set_state(window_info["exe_name"])
-                        if self.window_path_sensor:
-                            self.window_path_sensor.set_state(window_info["exe_path"])
-
-                time.sleep(0.1)
+                source.start(self._on_foreground)
+                return source
             except Exception as e:
-                self.log.error(f"窗口监听错误: {e}")
-                time.sleep(1)
+                self.log.warning(f"窗口事件钩子不可用，改为轮询: {e}")
+
+        source = PollingSource(
+            win32gui.GetForegroundWindow,
+            interval=self.core.get_plugin_config("WindowListener.py", "poll_interval", 0.1),
+            log=self.log
+        )
+        source.start(self._on_foreground)
+        return source
+
+    def _on_foreground(self, hwnd):
+        """前台窗口变化回调（在事件源线程中执行）"""
+        if hwnd == self.last_window:
+            return
+        self.last_window = hwnd
+
+        window_info = self._get_window_info(hwnd)
+        if window_info:
+            self.log.debug(f"前台应用: {window_info['exe_name']}")
+
+            if self.usage is not None:
+                self.usage.switch(window_info["exe_name"])
+
+            # 上报应用变化（如果启用）
+            if self.core.get_plugin_config("WindowListener.py", "post_enabled", False):
+                self.report_app_change(window_info["exe_name"])
+
+            # 更新 MQTT 传感器状态
+            if self.window_title_sensor:
+                self.window_title_sensor.set_state(window_info["window_title"])
+            if self.window_exe_sensor:
+                self.window_exe_sensor.set_state(window_info["exe_name"])
+            if self.window_path_sensor:
+                self.window_path_sensor.set_state(window_info["exe_path"])
+
+    def publish_usage(self):
+        """发布今日使用时长排行"""
+        if not self.usage_sensors:
+            return
+        top = self.usage.top(self.usage_top_n)
+        for rank, sensor in enumerate(self.usage_sensors):
+            exe, seconds = top[rank] if rank < len(top) else ("", 0)
+            sensor.set_attributes({"app": exe, "seconds": round(seconds)})
+            sensor.set_state(round(seconds / 60, 1))
+
+    @staticmethod
+    def _lookup_process(pid):
+        process = psutil.Process(pid)
+        return process.name(), process.exe()
+
+    @staticmethod
+    def _process_start_time(pid):
+        return psutil.Process(pid).create_time()
 
     def _get_window_info(self, hwnd):
         try:
@@ -159,14 +233,8 @@ class WindowListener:
             # 获取进程ID
             _, pid = win32process.GetWindowThreadProcessId(hwnd)
 
-            # 获取进程信息
-            process = psutil.Process(pid)
-
-            # 获取EXE路径
-            exe_path = process.exe()
-
-            # 获取EXE名称
-            exe_name = process.name()
+            # 获取EXE名称和路径（按 pid 缓存）
+            exe_name, exe_path = self.process_cache.get(pid)
 
             return {
                 "hwnd": hwnd,
@@ -181,31 +249,23 @@ class WindowListener:
             return None
 
     def report_app_change(self, current_app):
-        """上报应用程序变化"""
-        global last_app
-
-        if current_app != last_app:
-            try:
-                payload = {
-                    "secret": self.core.get_plugin_config("WindowListener.py", "post_secret_key", ''),
-                    "device": self.core.get_plugin_config("WindowListener.py", "post_device_id", '电脑'),
-                    "app_name": current_app,
-                    "running": True
-                }
-
-                response = requests.post(
-                    self.core.get_plugin_config("WindowListener.py", "post_api_url", False),
-                    json=payload
-                )
-
-                if response.status_code == 200:
-                    self.log.info(f"成功上报: {current_app}")
-                    last_app = current_app
-                else:
-                    self.log.error(f"上报失败: {response.text}")
+        """上报应用程序变化（由后台线程发送）"""
+        if self.tracker is None:
+            self.tracker = TrackerSender(
+                self.log,
+                lambda: self.core.get_plugin_config("WindowListener.py", "post_api_url", False),
+                debounce=self.core.get_plugin_config("WindowListener.py", "post_debounce", 1.0),
+                timeout=self.core.get_plugin_config("WindowListener.py", "post_timeout", 5),
+                max_retries=self.core.get_plugin_config("WindowListener.py", "post_retries", 5),
+                queue_size=self.core.get_plugin_config("WindowListener.py", "post_queue_size", 100)
+            )
 
-            except Exception as e:
-                self.log.error(f"发生错误: {str(e)}")
+        self.tracker.submit({
+            "secret": self.core.get_plugin_config("WindowListener.py", "post_secret_key", ''),
+            "device": self.core.get_plugin_config("WindowListener.py", "post_device_id", '电脑'),
+            "app_name": current_app,
+            "running": True
+        })
 
     def handle_url_input(self, field_name, input_type="string"):
         def callback(e):
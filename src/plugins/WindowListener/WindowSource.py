@@ -0,0 +1,218 @@
+"""
+前台窗口事件源与窗口信息解析
+事件源只负责在前台窗口变化时回调窗口句柄：
+- WinEventHookSource: SetWinEventHook(EVENT_SYSTEM_FOREGROUND)，窗口切换时由系统通知
+- PollingSource: 定时轮询 GetForegroundWindow，钩子不可用时使用
+- FakeSource: 手动推送窗口句柄，用于在非 Windows 环境验证处理流程
+"""
+import ctypes
+import sys
+from abc import ABC, abstractmethod
+import threading
+from collections import OrderedDict
+
+EVENT_SYSTEM_FOREGROUND = 0x0003
+WINEVENT_OUTOFCONTEXT = 0x0000
+WINEVENT_SKIPOWNPROCESS = 0x0002
+WM_QUIT = 0x0012
+
+
+class ForegroundSource(ABC):
+    """前台窗口事件源基类"""
+    name = "base"
+
+    def __init__(self):
+        self.callback = None
+        self.thread = None
+
+    @abstractmethod
+    def start(self, callback):
+        """
+        开始监听
+        :param callback: 前台窗口变化时调用 callback(hwnd)
+        """
+
+    @abstractmethod
+    def stop(self):
+        """停止监听"""
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _emit(self, hwnd):
+        if hwnd and self.callback:
+            self.callback(hwnd)
+
+
+class PollingSource(ForegroundSource):
+    """轮询前台窗口"""
+    name = "poll"
+
+    def __init__(self, get_foreground, interval=0.1, log=None):
+        """
+        :param get_foreground: 返回当前前台窗口句柄的函数
+        :param interval: 轮询间隔（秒）
+        """
+        super().__init__()
+        self.get_foreground = get_foreground
+        self.interval = interval
+        self.log = log
+        self.stop_event = threading.Event()
+
+    def start(self, callback):
+        self.callback = callback
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="WindowPoller", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        last_window = None
+        while not self.stop_event.is_set():
+            try:
+                current_hwnd = self.get_foreground()
+                if current_hwnd != last_window:
+                    last_window = current_hwnd
+                    self._emit(current_hwnd)
+                self.stop_event.wait(self.interval)
+            except Exception as e:
+                if self.log:
+                    self.log.error(f"窗口监听错误: {e}")
+                self.stop_event.wait(1)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=1)
+
+
+class WinEventHookSource(ForegroundSource):
+    """通过 SetWinEventHook 接收前台窗口切换事件，空闲时不占用 CPU"""
+    name = "hook"
+
+    def __init__(self, log=None):
+        super().__init__()
+        self.log = log
+        self.thread_id = None
+        self._proc = None  # 保持回调引用，避免被回收
+
+    def start(self, callback):
+        if sys.platform != "win32":
+            raise OSError("SetWinEventHook 仅支持 Windows")
+        self.callback = callback
+        ready = threading.Event()
+        result = {}
+        self.thread = threading.Thread(target=self._run, args=(ready, result), name="WindowEventHook", daemon=True)
+        self.thread.start()
+        ready.wait(timeout=2)
+        if "error" in result:
+            raise result["error"]
+
+    def _run(self, ready, result):
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        kernel32 = ctypes.windll.kernel32
+
+        proc_type = ctypes.WINFUNCTYPE(
+            None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+            wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+        )
+        user32.SetWinEventHook.restype = wintypes.HANDLE
+        user32.SetWinEventHook.argtypes = [
+            wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, proc_type,
+            wintypes.DWORD, wintypes.DWORD, wintypes.DWORD
+        ]
+        user32.UnhookWinEvent.argtypes = [wintypes.HANDLE]
+
+        def on_event(hook, event, hwnd, id_object, id_child, thread, time_ms):
+            try:
+                self._emit(hwnd)
+            except Exception as e:
+                if self.log:
+                    self.log.error(f"窗口事件处理错误: {e}")
+
+        self._proc = proc_type(on_event)
+        self.thread_id = kernel32.GetCurrentThreadId()
+        hook = user32.SetWinEventHook(
+            EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND, 0, self._proc, 0, 0,
+            WINEVENT_OUTOFCONTEXT | WINEVENT_SKIPOWNPROCESS
+        )
+        if not hook:
+            result["error"] = ctypes.WinError()
+            ready.set()
+            return
+        ready.set()
+
+        # 启动时先上报当前前台窗口
+        self._emit(user32.GetForegroundWindow())
+
+        # 消息循环，钩子回调在此线程中执行
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+        user32.UnhookWinEvent(hook)
+
+    def stop(self):
+        if self.is_running() and self.thread_id:
+            ctypes.windll.user32.PostThreadMessageW(self.thread_id, WM_QUIT, 0, 0)
+            self.thread.join(timeout=1)
+
+
+class FakeSource(ForegroundSource):
+    """手动推送窗口句柄的事件源"""
+    name = "fake"
+
+    def __init__(self):
+        super().__init__()
+        self.running = False
+
+    def start(self, callback):
+        self.callback = callback
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def is_running(self):
+        return self.running
+
+    def push(self, hwnd):
+        """模拟一次前台窗口切换"""
+        if self.running:
+            self._emit(hwnd)
+
+
+class ProcessCache:
+    """
+    pid → (exe_name, exe_path) 的 LRU 缓存
+    以进程创建时间校验缓存项，pid 被新进程复用时重新查询
+    """
+
+    def __init__(self, lookup, start_time, size=128):
+        """
+        :param lookup: 查询进程信息的函数 lookup(pid) -> (exe_name, exe_path)
+        :param start_time: 查询进程创建时间的函数 start_time(pid)
+        :param size: 缓存容量
+        """
+        self.lookup = lookup
+        self.start_time = start_time
+        self.size = size
+        self._cache = OrderedDict()  # {pid: (创建时间, exe_name, exe_path)}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pid):
+        created = self.start_time(pid)
+        entry = self._cache.get(pid)
+        if entry is not None and entry[0] == created:
+            self._cache.move_to_end(pid)
+            self.hits += 1
+            return entry[1], entry[2]
+
+        self.misses += 1
+        exe_name, exe_path = self.lookup(pid)
+        self._cache[pid] = (created, exe_name, exe_path)
+        self._cache.move_to_end(pid)
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+        return exe_name, exe_path
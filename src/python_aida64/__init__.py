@@ -1,14 +1,87 @@
 import mmap
+import os
+import re
+import threading
+from html import unescape
 from xml.etree import ElementTree as ET
 import sys
 
+_SHM_NAME = 'AIDA64_SensorValues'
+_MIN_LENGTH = 2000
+_MAX_LENGTH = 10000 * 100
+
+# 共享内存读取状态：缓存上次有效长度和映射，避免每次读取都二分探测
+_state = {
+    "length": None,  # 上次有效长度
+    "mapping": None,  # 上次有效长度对应的 mmap
+    "file": None,  # 文件替身模式下打开的文件
+    "source": os.environ.get('AIDA64_SHM_FILE'),  # 文件替身路径，None 表示使用 AIDA64 共享内存
+}
+_lock = threading.Lock()
+# 单个传感器条目：<类别><id>..</id><label>..</label><value>..</value></类别>
+_ITEM_RE = re.compile(
+    rb'<([A-Za-z]+)><id>([^<]*)</id><label>([^<]*)</label><value>([^<]*)</value></\1>'
+)
+_stats = {"reads": 0, "probes": 0}
+
+
+def setSource(path=None):
+    """
+    设置数据源
+    :param path: 用于替代 AIDA64_SensorValues 共享内存的文件路径（内容格式相同，以 NUL 结尾），
+                 None 表示读取 AIDA64 共享内存
+    """
+    with _lock:
+        _reset()
+        _state["source"] = path
+
+
+def getStats() -> dict:
+    """获取读取统计：读取次数、映射探测次数"""
+    stats = dict(_stats)
+    stats["probes_per_read"] = stats["probes"] / stats["reads"] if stats["reads"] else 0
+    stats["length"] = _state["length"]
+    return stats
+
+
+def _close_mapping():
+    if _state["mapping"] is not None:
+        _state["mapping"].close()
+        _state["mapping"] = None
+    if _state["file"] is not None:
+        _state["file"].close()
+        _state["file"] = None
+
+
+def _open_mapping(length):
+    """打开指定长度的映射，长度超过共享内存大小时抛出 OSError"""
+    _stats["probes"] += 1
+    source = _state["source"]
+    if source:
+        f = open(source, 'rb')
+        try:
+            # 长度超过文件大小时 mmap 抛出 ValueError，与共享内存越界统一为 OSError
+            return mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ), f
+        except ValueError as e:
+            f.close()
+            raise OSError(str(e))
+        except Exception:
+            f.close()
+            raise
+    return mmap.mmap(
+        -1, length,  # anonymous file
+        tagname=_SHM_NAME,
+        access=mmap.ACCESS_READ), None
+
 
 def _readRawData(length):
-    with mmap.mmap(
-            -1, length,  # anonymous file
-            tagname='AIDA64_SensorValues',
-            access=mmap.ACCESS_READ) as mm:
+    mm, f = _open_mapping(length)
+    try:
         return mm.read()
+    finally:
+        mm.close()
+        if f:
+            f.close()
 
 
 def _decode(b):
@@ -20,32 +93,181 @@ def _decode(b):
     return b.decode()
 
 
-def getXmlRawData() -> str:
-    options = [100 * i for i in range(20, 100)]
+def _payload(raw):
+    """
+    截取第一个 NUL 之前的数据（数据变短时 NUL 之后是上一次的残留内容）
+    :return: 数据，全为 NUL（AIDA64 未运行，映射由本进程新建）时返回 None
+    """
+    end = raw.find(b'\x00')
+    if end < 0:
+        return raw
+    return raw[:end] or None
+
+
+def _search(low_length):
+    """
+    按 100 字节粒度二分查找最小的有效长度
+    :param low_length: 已知无效（放不下数据）的长度下界
+    :return: 有效长度，找不到或共享内存中没有数据时返回 None
+    """
+    options = [100 * i for i in range(max(_MIN_LENGTH, low_length + 100) // 100, _MAX_LENGTH // 100)]
     low = 0
     high = len(options) - 1
-    result = None
+    found = None
 
-    while low <= high:  # 改为 <=
+    while low <= high:
         mid = (low + high) // 2
         try:
-            length = options[mid]
-            raw = _readRawData(length)
+            raw = _readRawData(options[mid])
+            if raw[0] == 0:  # 没有数据，继续探测也只会得到空映射
+                return None
             if raw[-1] == 0:  # 找到有效长度
-                decoded = _decode(raw.rstrip(b'\x00'))
-                result = '<root>{}</root>'.format(decoded)
+                found = options[mid]
                 high = mid - 1  # 继续寻找更小的有效长度
             else:  # 不够长
-                low = mid + 1  # ✅ 修复
-        except (PermissionError, OSError):  # 处理更多异常
+                low = mid + 1
+        except (PermissionError, OSError):  # 超出共享内存大小
             high = mid - 1
+    return found
+
 
-    if result is None:
+def _remap(length):
+    """切换缓存的映射到新长度"""
+    _close_mapping()
+    mm, f = _open_mapping(length)
+    _state["mapping"], _state["file"], _state["length"] = mm, f, length
+
+
+def _reset():
+    """关闭缓存的映射，下次读取重新探测"""
+    _close_mapping()
+    _state["length"] = None
+
+
+def _read_cached():
+    """
+    从缓存映射读取，数据增长时按几何级数扩大长度，失败时退回二分查找
+    :return: 第一个 NUL 之前的数据，没有数据时返回 None（不缓存映射）
+    """
+    length = _state["length"]
+    if length is not None:
+        mm = _state["mapping"]
+        try:
+            mm.seek(0)
+            raw = mm.read()
+        except (ValueError, OSError):
+            raw = None
+
+        if raw is not None and raw[-1] == 0:
+            payload = _payload(raw)
+            if payload is None:
+                _reset()
+            return payload
+
+        if raw is not None:
+            # 结尾 NUL 后移（数据变长），几何增长
+            grow = length * 2
+            while grow < _MAX_LENGTH:
+                try:
+                    raw = _readRawData(grow)
+                except (PermissionError, OSError):
+                    break
+                if raw[-1] == 0:
+                    _remap(grow)
+                    return _payload(raw)
+                length, grow = grow, grow * 2
+        else:
+            length = 0
+
+    found = _search(length or 0)
+    if found is None:
+        _reset()
+        return None
+    _remap(found)
+    _state["mapping"].seek(0)
+    payload = _payload(_state["mapping"].read())
+    if payload is None:
+        _reset()
+    return payload
+
+
+def getRawData() -> bytes:
+    """读取共享内存原始字节（截至第一个 NUL）"""
+    with _lock:
+        _stats["reads"] += 1
+        raw = _read_cached()
+
+    if raw is None:
         raise RuntimeError("无法读取AIDA64共享内存数据")
-    return result
+    return raw
+
+
+def getXmlRawData() -> str:
+    return '<root>{}</root>'.format(_decode(getRawData()))
+
+
+def _text(b):
+    """解码文本字段，仅在包含实体时反转义"""
+    try:
+        text = b.decode('utf-8')
+    except UnicodeDecodeError:
+        text = _decode(b)
+    return unescape(text) if '&' in text else text
+
+
+def iterRecords(raw: bytes = None, typed: bool = True):
+    """
+    直接扫描原始字节，逐条生成传感器记录
+    :param raw: 原始字节（只解析第一个 NUL 之前的内容），None 表示从共享内存读取
+    :param typed: True 时数值转换为 float（无法转换的保持字符串），False 时保持字符串
+    :return: 生成 (category, id, label, value)
+    """
+    if raw is None:
+        raw = getRawData()
+    else:
+        raw = _payload(raw) or b''
+    for m in _ITEM_RE.finditer(raw):
+        category, sensor_id, label, value = m.groups()
+        if typed:
+            try:
+                value = float(value)
+            except ValueError:
+                value = _text(value)
+        else:
+            value = _text(value)
+        yield category.decode('ascii'), _text(sensor_id), _text(label), value
+
+
+def getColumns(raw: bytes = None) -> dict:
+    """
+    以列存形式返回传感器数据
+    :return: {"category": [...], "id": [...], "label": [...], "value": [...]}
+    """
+    columns = {"category": [], "id": [], "label": [], "value": []}
+    append_category = columns["category"].append
+    append_id = columns["id"].append
+    append_label = columns["label"].append
+    append_value = columns["value"].append
+    for category, sensor_id, label, value in iterRecords(raw):
+        append_category(category)
+        append_id(sensor_id)
+        append_label(label)
+        append_value(value)
+    return columns
 
 
 def getData() -> dict:
+    data = {}
+    for category, sensor_id, label, value in iterRecords(typed=False):
+        items = data.get(category)
+        if items is None:
+            items = data[category] = []
+        items.append({'id': sensor_id, 'label': label, 'value': value})
+    return data
+
+
+def getDataElementTree() -> dict:
+    """使用 ElementTree 解析（旧实现，用于对比）"""
     data = {}
     tree = ET.fromstring(getXmlRawData())
 
@@ -60,6 +282,12 @@ def getData() -> dict:
 
 
 __all__ = [
+    'getRawData',
     'getXmlRawData',
-    'getData'
+    'getData',
+    'getDataElementTree',
+    'iterRecords',
+    'getColumns',
+    'getStats',
+    'setSource'
 ]
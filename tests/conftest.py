@@ -0,0 +1,67 @@
+"""
+测试公共配置
+程序以 src 为工作目录运行（模块间使用 from Config import ... 形式导入），测试时同样把 src 加入搜索路径
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+
+class FakeConfig:
+    """只读配置，接口与 Config.get_config 相同"""
+
+    def __init__(self, **values):
+        self.values = values
+
+    def get_config(self, key, default=None):
+        return self.values.get(key, default)
+
+
+def wait_until(predicate, timeout=2.0):
+    """轮询等待条件成立，返回最终结果"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class RecordingLog:
+    """记录日志内容的日志对象，接口与 Logger 相同"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def _add(self, level, message):
+        with self._lock:
+            self.records.append((level, message))
+
+    def debug(self, message):
+        self._add("debug", message)
+
+    def info(self, message):
+        self._add("info", message)
+
+    def warning(self, message):
+        self._add("warning", message)
+
+    def error(self, message):
+        self._add("error", message)
+
+    def messages(self, level=None):
+        with self._lock:
+            return [message for record_level, message in self.records if level in (None, record_level)]
+
+
+@pytest.fixture
+def log():
+    return RecordingLog()
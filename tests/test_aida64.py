@@ -0,0 +1,122 @@
+"""
+python_aida64 读取测试
+使用文件替身（setSource）代替 AIDA64_SensorValues 共享内存，文件原地改写模拟 AIDA64 更新数据
+"""
+import pytest
+
+import python_aida64
+
+SIZE = 64 * 1024
+
+
+def make_payload(count, value=40):
+    """生成 count 个传感器条目"""
+    categories = ("temp", "fan", "volt", "pwr")
+    return "".join(
+        f"<{categories[i % 4]}><id>S{i}</id><label>Sensor {i}</label><value>{value + i % 7}</value></{categories[i % 4]}>"
+        for i in range(count)
+    ).encode("utf-8")
+
+
+def write(path, payload):
+    """原地改写文件开头并以 NUL 结尾，之后的旧内容保持不变（与共享内存一致）"""
+    with open(path, "r+b") as f:
+        f.write(payload + b"\x00")
+
+
+@pytest.fixture
+def shm(tmp_path):
+    path = tmp_path / "AIDA64_SensorValues.bin"
+    path.write_bytes(b"\x00" * SIZE)
+    python_aida64.setSource(str(path))
+    yield path
+    python_aida64.setSource(None)
+
+
+def test_reads_payload_and_caches_length(shm):
+    write(shm, make_payload(100))
+    assert python_aida64.getRawData() == make_payload(100)
+
+    probes = python_aida64.getStats()["probes"]
+    for _ in range(20):
+        assert python_aida64.getRawData() == make_payload(100)
+    assert python_aida64.getStats()["probes"] == probes
+
+
+def test_payload_grows(shm):
+    write(shm, make_payload(10))
+    python_aida64.getRawData()
+    write(shm, make_payload(300))
+
+    assert python_aida64.getRawData() == make_payload(300)
+    assert python_aida64.getStats()["length"] > len(make_payload(300))
+
+
+def test_payload_shrinks_ignores_stale_tail(shm):
+    write(shm, make_payload(300))
+    python_aida64.getRawData()
+    write(shm, make_payload(100, value=50))
+
+    assert python_aida64.getRawData() == make_payload(100, value=50)
+    assert sum(len(items) for items in python_aida64.getData().values()) == 100
+
+
+def test_empty_section_is_not_cached(shm):
+    with pytest.raises(RuntimeError):
+        python_aida64.getRawData()
+    assert python_aida64.getStats()["length"] is None
+
+    write(shm, make_payload(5))
+    assert python_aida64.getRawData() == make_payload(5)
+
+
+def test_section_cleared_after_read(shm):
+    write(shm, make_payload(5))
+    python_aida64.getRawData()
+    shm.write_bytes(b"\x00" * SIZE)
+
+    with pytest.raises(RuntimeError):
+        python_aida64.getRawData()
+    assert python_aida64.getStats()["length"] is None
+
+
+def make_mixed_payload():
+    """包含文本值、实体转义和中文标签的条目"""
+    return (
+        "<sys><id>SDATE</id><label>Date</label><value>2024-05-01</value></sys>"
+        "<sys><id>STIME</id><label>Time</label><value>12:34:56</value></sys>"
+        "<temp><id>TCPU</id><label>CPU 温度</label><value>45</value></temp>"
+        "<temp><id>TGPU1</id><label>GPU &amp; VRM</label><value>51.5</value></temp>"
+        "<fan><id>FCPU</id><label>&lt;CPU&gt; Fan</label><value>1200</value></fan>"
+        "<volt><id>VCPU</id><label>CPU Core</label><value>1.235</value></volt>"
+    ).encode("utf-8")
+
+
+@pytest.mark.parametrize("payload", [make_payload(300), make_mixed_payload() + make_payload(50)])
+def test_scanner_matches_element_tree(shm, payload):
+    write(shm, payload)
+    assert python_aida64.getData() == python_aida64.getDataElementTree()
+
+
+def test_scanner_matches_element_tree_after_shrink(shm):
+    write(shm, make_mixed_payload() + make_payload(300))
+    assert python_aida64.getData() == python_aida64.getDataElementTree()
+
+    write(shm, make_mixed_payload() + make_payload(20, value=60))
+    data = python_aida64.getData()
+    assert data == python_aida64.getDataElementTree()
+    assert sum(len(items) for items in data.values()) == 26
+
+
+def test_typed_records_and_columns():
+    raw = make_mixed_payload() + b"\x00" + make_payload(10)  # NUL 之后的残留内容不解析
+    records = list(python_aida64.iterRecords(raw))
+
+    assert len(records) == 6
+    assert records[0] == ("sys", "SDATE", "Date", "2024-05-01")
+    assert records[3] == ("temp", "TGPU1", "GPU & VRM", 51.5)
+    assert records[4] == ("fan", "FCPU", "<CPU> Fan", 1200.0)
+
+    columns = python_aida64.getColumns(raw)
+    assert columns["id"] == [r[1] for r in records]
+    assert columns["value"] == [r[3] for r in records]
@@ -0,0 +1,70 @@
+"""Aida64 插件实体同步测试（模拟 MQTT 和传感器实体）"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from plugins.Aida64 import Aida64 as aida_module
+from plugins.Aida64.Aida64 import Aida64
+
+
+class _Core:
+    def __init__(self, log, **config):
+        self.log = log
+        self.config = dict(auto_rediscovery=True, **config)
+        self.mqtt = SimpleNamespace(
+            prefix="homeassistant", device_name="PC", is_connected=lambda: True,
+            get_mqtt_settings=lambda: None, get_device_info=lambda: None
+        )
+
+    def get_plugin_config(self, plugin, key, default=None):
+        return self.config.get(key, default)
+
+
+def make_data(count):
+    return {"temp": [{"id": f"T{i}", "label": f"Sensor {i}", "value": str(40 + i)} for i in range(count)]}
+
+
+@pytest.fixture
+def plugin(log, monkeypatch):
+    plugin = Aida64(_Core(log))
+    created = []
+
+    def fake_create(category, item, mqtt_settings, device_info):
+        created.append(item["id"])
+        time.sleep(0.01)  # 放大并发窗口
+        plugin.sensors[item["id"]] = {
+            "sensor": None, "category": category, "id": item["id"], "name": item["label"]
+        }
+        return True
+
+    monkeypatch.setattr(plugin, "_create_sensor", fake_create)
+    plugin.created = created
+    data = make_data(1)
+    monkeypatch.setattr(aida_module.python_aida64, "getData", lambda: data)
+    plugin.setup_entities()
+    plugin.check_item_count_change(data)  # 记录初始签名
+    created.clear()
+    return plugin
+
+
+def test_concurrent_change_checks_create_each_entity_once(plugin):
+    data = make_data(6)
+    threads = [threading.Thread(target=plugin.check_item_count_change, args=(data,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(plugin.created) == ["T1", "T2", "T3", "T4", "T5"]
+    assert set(plugin.sensors) == {f"T{i}" for i in range(6)}
+
+
+def test_sample_only_records_history(plugin, monkeypatch):
+    monkeypatch.setattr(aida_module.python_aida64, "getData", lambda: make_data(3))
+    plugin.sample()
+
+    assert plugin.created == []
+    assert set(plugin.sensors) == {"T0"}
+    assert set(plugin.history.columns) == {"T0", "T1", "T2"}
@@ -0,0 +1,110 @@
+"""配置合并写入测试"""
+import json
+import threading
+import time
+
+import pytest
+
+from Config import Config, DebouncedJsonWriter
+
+
+class _Core:
+    def __init__(self, log):
+        self.log = log
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch, log):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config_example.json").write_text(
+        json.dumps({"version": "v1.0.0", "config_save_delay": 0.2}), encoding="utf-8"
+    )
+    config = Config(_Core(log))
+    yield config
+    # 在恢复工作目录之前写完，避免合并定时器把文件写到仓库目录
+    config.flush()
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_thousand_sets_write_once(config, tmp_path):
+    writes = config._writer.write_count
+    threads = [
+        threading.Thread(target=lambda n=n: [config.set_config(f"k{n}_{i}", i) for i in range(250)])
+        for n in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(0.4)
+
+    assert config._writer.write_count - writes == 1
+    data = read(tmp_path / "config.json")
+    assert data == config.config_data
+    assert sum(1 for key in data if key.startswith("k")) == 1000
+
+
+def test_file_is_never_torn(tmp_path, log):
+    path = tmp_path / "data.json"
+    data = {}
+    writer = DebouncedJsonWriter(path, lambda: data, log, delay=0.001)
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        while not stop.is_set():
+            if path.exists():
+                try:
+                    read(path)
+                except ValueError as e:
+                    errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for i in range(1000):
+        with writer.lock:
+            data[f"key{i}"] = "x" * 100
+        writer.schedule()
+    writer.flush()
+    stop.set()
+    thread.join()
+
+    assert not errors
+    assert len(read(path)) == 1000
+    assert 1 <= writer.write_count < 1000
+
+
+def test_transaction_is_not_flushed_midway(tmp_path, log):
+    path = tmp_path / "data.json"
+    data = {"x": 0}
+    writer = DebouncedJsonWriter(path, lambda: data, log, delay=0.05)
+    writer.schedule()  # 事务开始前已安排的写入
+
+    with writer.transaction():
+        with writer.lock:
+            data["a"] = 1
+        time.sleep(0.15)  # 超过合并窗口
+        assert not path.exists()
+        with writer.lock:
+            data["b"] = 2
+        writer.schedule()
+
+    assert read(path) == {"x": 0, "a": 1, "b": 2}
+    assert writer.write_count == 1
+
+
+def test_failed_write_is_reported(config, tmp_path, monkeypatch):
+    monkeypatch.setattr(config._writer, "path", tmp_path / "missing" / "config.json")
+    config.set_config("a", 1)
+
+    assert config.flush() is False
+    assert config.set_config("b", 2) is False
+
+    monkeypatch.setattr(config._writer, "path", tmp_path / "config.json")
+    assert config.flush() is True
+    assert config.set_config("c", 3) is True
+    assert read(tmp_path / "config.json")["b"] == 2
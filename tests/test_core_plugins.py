@@ -0,0 +1,112 @@
+"""插件并行初始化测试"""
+import threading
+import time
+import types
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeConfig
+from Core import Core
+
+
+def make_plugin(name, on_initialize=None, dependencies=()):
+    """构造插件模块和元数据，on_initialize 在插件 initialize 中调用"""
+    unloaded = threading.Event()
+
+    class Plugin:
+        def __init__(self, core):
+            self.core = core
+
+        def initialize(self):
+            if on_initialize:
+                on_initialize()
+
+        def on_unload(self):
+            unloaded.set()
+
+    Plugin.__name__ = name
+    module = types.ModuleType(f"plugins.{name}.{name}")
+    setattr(module, name, Plugin)
+    metadata = SimpleNamespace(
+        config=SimpleNamespace(enabled=True), dependencies=list(dependencies),
+        display_name=name, version="1.0.0"
+    )
+    return module, metadata, unloaded
+
+
+@pytest.fixture
+def core(log):
+    core = Core.__new__(Core)
+    core.log = log
+    core.config = FakeConfig(plugin_init_timeout=0.2)
+    core.plugins = {key: {} for key in ("instances", "metadata", "modules", "errors", "import_times")}
+    core._import_lock = threading.Lock()
+    return core
+
+
+def add(core, name, **kwargs):
+    module, metadata, unloaded = make_plugin(name, **kwargs)
+    core.plugins["modules"][name] = module
+    core.plugins["metadata"][name] = metadata
+    return unloaded
+
+
+def test_timed_out_plugin_is_unloaded_when_it_finishes_late(core):
+    release = threading.Event()
+    slow_unloaded = add(core, "Slow", on_initialize=release.wait)
+    add(core, "Child", dependencies=["Slow"])
+    add(core, "Fast")
+
+    try:
+        core.initialize_all_plugins()
+
+        assert set(core.plugins["instances"]) == {"Fast"}
+        assert "初始化超时" in core.plugins["errors"]["Slow"]
+        assert "Child" not in core.plugins["instances"]
+    finally:
+        release.set()
+    assert slow_unloaded.wait(2)
+    time.sleep(0.05)
+    assert "Slow" not in core.plugins["instances"]
+    assert not hasattr(core, "Slow")
+    assert core.Fast is core.plugins["instances"]["Fast"]
+    assert any("超时后才完成初始化" in m for m in core.log.messages("warning"))
+
+
+def test_dependencies_initialize_before_dependents(core):
+    order = []
+    add(core, "Base", on_initialize=lambda: (time.sleep(0.05), order.append("Base")))
+    add(core, "Child", on_initialize=lambda: order.append("Child"), dependencies=["Base"])
+
+    core.initialize_all_plugins()
+
+    assert order == ["Base", "Child"]
+    assert not core.plugins["errors"]
+
+
+def test_parallel_imports_are_measured_separately(core, monkeypatch):
+    """并行导入时，每个插件只统计自己导入的模块"""
+    import sys
+    import Core as core_module
+
+    def fake_import(module_path):
+        for i in range(3):
+            sys.modules[f"{module_path}._dep{i}"] = types.ModuleType("dep")
+            time.sleep(0.02)
+        return types.ModuleType(module_path)
+
+    monkeypatch.setattr(core_module.importlib, "import_module", fake_import)
+    threads = [threading.Thread(target=core._import_plugin_module, args=(name,)) for name in ("A", "B", "C")]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        for name in ("A", "B", "C"):
+            for i in range(3):
+                sys.modules.pop(f"plugins.{name}.{name}._dep{i}", None)
+
+    assert {name: count for name, (_, count) in core.plugins["import_times"].items()} == {"A": 3, "B": 3, "C": 3}
+    assert all(elapsed < 100 for elapsed, _ in core.plugins["import_times"].values())
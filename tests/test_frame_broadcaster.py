@@ -0,0 +1,236 @@
+"""画面广播测试（使用模拟采集源）"""
+import threading
+import time
+
+import pytest
+
+from conftest import wait_until
+from plugins.FlaskApp.FrameBroadcaster import (
+    ChangeDetector, FrameBroadcaster, FramePacer, FrameProducer, FrameStats, QualityController
+)
+
+
+class FakeSource:
+    """每次读取返回递增编号的帧；changed 为 False 时模拟画面不变（force 时仍返回上一帧）"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.closed = False
+        self.changed = True
+        registry["opened"] += 1
+        registry["sources"].append(self)
+
+    def read(self, quality, scale, force):
+        with self.registry["lock"]:
+            self.registry["reads"] += 1
+            if self.changed or self.registry["frame"] == 0:
+                self.registry["frame"] += 1
+            elif not force:
+                return None
+            return f"frame{self.registry['frame']}".encode()
+
+    def close(self):
+        self.closed = True
+        self.registry["closed"] += 1
+
+
+@pytest.fixture
+def registry():
+    return {"opened": 0, "closed": 0, "reads": 0, "frame": 0, "sources": [], "lock": threading.Lock()}
+
+
+def test_clients_share_one_capture_thread(registry, log):
+    producer = FrameProducer(lambda: FakeSource(registry), fps=50, name="Shared", log=log)
+    clients = [producer.frames() for _ in range(3)]
+    received = [[next(client) for _ in range(5)] for client in clients]
+
+    assert registry["opened"] == 1
+    assert producer.clients == 3
+    for frames in received:
+        numbers = [int(frame[5:]) for frame in frames]
+        assert numbers == sorted(set(numbers))  # 每个客户端只收到更新的帧
+    assert len([t for t in threading.enumerate() if t.name == "SharedProducer"]) == 1
+
+    for client in clients:
+        client.close()
+    assert producer.clients == 0
+    # 没有客户端时释放采集源
+    assert wait_until(lambda: registry["closed"] == 1)
+
+
+def test_slow_client_gets_latest_frame(registry, log):
+    producer = FrameProducer(lambda: FakeSource(registry), fps=50, log=log)
+    client = producer.frames()
+    first = int(next(client)[5:])
+    time.sleep(0.2)  # 期间采集了约 10 帧
+    second = int(next(client)[5:])
+    client.close()
+
+    assert second - first > 3  # 跳过积压的旧帧，直接拿到最新一帧
+
+
+def test_latest_reuses_recent_frame(registry, log):
+    producer = FrameProducer(lambda: FakeSource(registry), fps=50, log=log)
+    frame = producer.latest(max_age=5.0)
+    assert frame == b"frame1"
+    reads = registry["reads"]
+
+    assert producer.latest(max_age=5.0) == frame
+    assert registry["reads"] == reads
+    assert producer.clients == 0
+
+
+def test_failing_source_is_reopened(log):
+    attempts = {"count": 0}
+
+    class Broken:
+        def read(self, quality, scale, force):
+            attempts["count"] += 1
+            if attempts["count"] == 1:
+                raise OSError("device lost")
+            return b"ok"
+
+        def close(self):
+            pass
+
+    producer = FrameProducer(Broken, fps=50, log=log)
+    client = producer.frames()
+    assert next(client) == b"ok"
+    client.close()
+    assert producer.get_stats()["errors"] == 1
+    assert any("device lost" in m for m in log.messages("error"))
+
+
+def test_broadcaster_keeps_one_producer_per_source(registry, log):
+    broadcaster = FrameBroadcaster(lambda key: FakeSource(registry), fps=50, log=log)
+    assert broadcaster.get(0) is broadcaster.get(0)
+    assert broadcaster.get(0) is not broadcaster.get(1)
+    assert set(broadcaster.get_stats()) == {0, 1}
+
+
+def test_pacer_keeps_target_rate():
+    pacer = FramePacer(50)
+    started = time.monotonic()
+    for _ in range(26):
+        pacer.wait()
+    assert 0.45 <= time.monotonic() - started < 0.7
+
+
+def test_pacer_does_not_burst_after_stall():
+    pacer = FramePacer(50)
+    pacer.wait()
+    time.sleep(0.2)  # 落后 10 帧
+    pacer.wait()  # 重新对齐，立即返回
+    started = time.monotonic()
+    for _ in range(5):
+        pacer.wait()
+    # 不补帧：之后仍按每帧 20ms 间隔
+    assert time.monotonic() - started >= 0.09
+
+
+def test_quality_drops_before_scale_and_recovers_in_reverse():
+    controller = QualityController(fps=20, quality=45, min_quality=35, max_quality=50, step=5, recover_frames=3)
+    for _ in range(2):
+        controller.update(0.1)  # 超出 50ms 预算
+    assert (controller.quality, controller.scale) == (35, 1.0)
+    controller.update(0.1)
+    controller.update(0.1)
+    assert (controller.quality, controller.scale_index) == (35, 2)
+
+    for _ in range(6):
+        controller.update(0.001)
+    assert (controller.quality, controller.scale_index) == (35, 0)
+    for _ in range(9):
+        controller.update(0.001)
+    assert (controller.quality, controller.scale_index) == (50, 0)
+
+
+def test_quality_is_stable_within_budget():
+    controller = QualityController(fps=20, recover_frames=3)
+    for _ in range(20):
+        controller.update(0.035)  # 预算的 70%，既不降级也不恢复
+    assert (controller.quality, controller.scale) == (70, 1.0)
+
+
+def test_frame_stats():
+    stats = FrameStats(window=2.0)
+    for i in range(21):
+        stats.add(0.010, 1000, now=100 + i * 0.1)
+    assert stats.fps(now=102.0) == pytest.approx(10.0)
+    assert stats.encode_ms == pytest.approx(10.0)
+    assert stats.frame_bytes == pytest.approx(1000)
+    assert stats.fps(now=110.0) == 0.0
+
+
+def test_change_detector():
+    detector = ChangeDetector()
+    frame = bytearray(b"\x00" * 1024)
+    assert detector.changed(frame)
+    assert not detector.changed(bytearray(frame))
+
+    frame[-1] = 1
+    assert detector.changed(frame)
+    frame[-1] = 2  # 记录的是副本，原缓冲区被复用修改后仍能识别变化
+    assert detector.changed(frame)
+    assert detector.changed(frame[:512])  # 分辨率变化
+
+    detector.reset()
+    assert detector.changed(frame[:512])
+
+
+def test_unchanged_screen_is_not_resent(registry, log):
+    producer = FrameProducer(lambda: FakeSource(registry), fps=50, log=log, keyframe_interval=10)
+    client = producer.frames()
+    assert next(client) == b"frame1"
+    registry["sources"][0].changed = False
+    assert wait_until(lambda: producer.get_stats()["skipped"] >= 5)
+
+    assert producer.get_stats()["captured"] <= 2
+    client.close()
+
+
+def test_joining_client_gets_current_frame_immediately(registry, log):
+    producer = FrameProducer(lambda: FakeSource(registry), fps=50, log=log, keyframe_interval=10)
+    first = producer.frames()
+    assert next(first) == b"frame1"
+    registry["sources"][0].changed = False
+    assert wait_until(lambda: producer.get_stats()["skipped"] >= 1)
+
+    # 画面不再变化，新客户端不能等到下一个关键帧才收到画面
+    received = []
+    joiner = threading.Thread(target=lambda: received.append(next(producer.frames())), daemon=True)
+    started = time.monotonic()
+    joiner.start()
+    joiner.join(1.0)
+
+    assert received == [producer.frame]
+    assert time.monotonic() - started < 0.5
+    first.close()
+
+
+def test_frame_stats_concurrent_readers_and_writers():
+    """多个推流线程写入、统计请求同时读取"""
+    stats = FrameStats(window=0.001)
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        while not stop.is_set():
+            stats.add(0.001, 100)
+
+    def reader():
+        while not stop.is_set():
+            try:
+                stats.to_dict()
+            except RuntimeError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(3)] + [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    assert not errors
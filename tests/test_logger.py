@@ -0,0 +1,67 @@
+"""Logger 队列写入测试"""
+import logging
+import queue
+import threading
+import uuid
+
+from Logger import Logger, _DroppingQueueHandler
+
+
+def make_logger(tmp_path):
+    name = f"test_{uuid.uuid4().hex}"
+    path = tmp_path / "app.log"
+    logger = Logger(name=name, log_file=str(path))
+    return logger, logging.getLogger(name), path
+
+
+def test_args_are_formatted_at_call_time(tmp_path):
+    logger, std_logger, path = make_logger(tmp_path)
+    values = ["before"]
+    std_logger.info("values: %s", values)
+    values[0] = "after"
+    logger.close()
+
+    text = path.read_text(encoding="utf-8")
+    assert "values: ['before']" in text
+    assert "after" not in text
+
+
+def test_exception_text_is_written(tmp_path):
+    logger, std_logger, path = make_logger(tmp_path)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        std_logger.exception("failed")
+    logger.close()
+
+    text = path.read_text(encoding="utf-8")
+    assert "failed" in text
+    assert "ValueError: boom" in text
+
+
+def test_caller_name_and_level(tmp_path):
+    logger, _, path = make_logger(tmp_path)
+    logger.set_level("INFO")
+    logger.debug("hidden")
+    logger.info("shown")
+    logger.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    assert " - test_logger - INFO - shown" in lines[0]
+
+
+def test_dropped_count_is_exact_under_contention():
+    handler = _DroppingQueueHandler(queue.Queue(maxsize=10))
+    record = logging.LogRecord("t", logging.INFO, __file__, 1, "message", None, None)
+    threads = [
+        threading.Thread(target=lambda: [handler.enqueue(record) for _ in range(5000)])
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert handler.queue.qsize() == 10
+    assert handler.dropped == 8 * 5000 - 10
@@ -0,0 +1,281 @@
+"""MQTT 客户端测试（使用模拟 broker，不需要网络连接）"""
+import threading
+import time
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from conftest import FakeConfig, wait_until
+from MQTT import MQTT, ThrottledClient
+
+
+class FakeBroker:
+    """
+    替换客户端的订阅接口：订阅后在网络线程中依次下发订阅确认和保留消息
+    :param retained: {topic: payload} broker 保留的消息
+    :param live: 保留消息之后下发的实时消息主题，None 表示不下发
+    """
+
+    def __init__(self, client, retained, live=None, ack=True, delay=0.0):
+        self.client = client
+        self.retained = retained
+        self.live = live
+        self.ack = ack
+        self.delay = delay
+        self.callbacks = {}
+        self.subscribed = []
+        client.subscribe = self.subscribe
+        client.unsubscribe = lambda topic_filter: (mqtt.MQTT_ERR_SUCCESS, 2)
+        client.message_callback_add = self.callbacks.__setitem__
+        client.message_callback_remove = self.callbacks.pop
+
+    def subscribe(self, topic_filter, qos=0):
+        self.subscribed.append(topic_filter)
+        threading.Thread(target=self._deliver, args=(topic_filter,), daemon=True).start()
+        return mqtt.MQTT_ERR_SUCCESS, 1
+
+    def _deliver(self, topic_filter):
+        time.sleep(self.delay)
+        if not self.ack:
+            return
+        self.client.on_subscribe(self.client, None, 1, [], None)
+        callback = self.callbacks[topic_filter]
+        for topic, payload in self.retained.items():
+            if mqtt.topic_matches_sub(topic_filter, topic):
+                callback(self.client, None, SimpleNamespace(topic=topic, payload=payload, retain=True))
+        if self.live:
+            callback(self.client, None, SimpleNamespace(topic=self.live, payload=b"{}", retain=False))
+
+
+@pytest.fixture
+def mqtt_manager(tmp_path, monkeypatch, log):
+    monkeypatch.chdir(tmp_path)
+    core = SimpleNamespace(log=log, config=FakeConfig(device_name="My PC", ha_prefix="homeassistant"))
+    manager = MQTT(core)
+    yield manager
+    # 在恢复工作目录之前写完 discovery 缓存
+    manager._config_cache_writer.flush()
+
+
+RETAINED = {
+    "homeassistant/sensor/My-PC/cpu/config": b'{"name": "cpu"}',
+    "homeassistant/switch/My-PC/power/config": b'{"name": "power"}',
+    "homeassistant/sensor/Other-PC/cpu/config": b'{"name": "cpu"}',
+}
+
+
+def test_scan_reads_only_this_device(mqtt_manager):
+    broker = FakeBroker(mqtt_manager.mqtt_client, RETAINED)
+    mqtt_manager._scan_broker_configs()
+
+    assert broker.subscribed == ["homeassistant/+/My-PC/+/config"]
+    assert set(mqtt_manager.mqtt_client.broker_configs) == {
+        "homeassistant/sensor/My-PC/cpu/config", "homeassistant/switch/My-PC/power/config"
+    }
+    assert mqtt_manager.mqtt_client.on_subscribe is None
+
+
+def test_scan_ends_at_retained_boundary(mqtt_manager):
+    FakeBroker(mqtt_manager.mqtt_client, RETAINED, live="homeassistant/sensor/My-PC/new/config")
+    started = time.monotonic()
+    mqtt_manager._scan_broker_configs(max_time=3.0, quiet=1.0)
+
+    # 收到实时消息即结束，不等待静默时间
+    assert time.monotonic() - started < 0.5
+    assert len(mqtt_manager.mqtt_client.broker_configs) == 2
+
+
+def test_scan_ends_after_quiet_period(mqtt_manager):
+    FakeBroker(mqtt_manager.mqtt_client, RETAINED, delay=0.1)
+    started = time.monotonic()
+    mqtt_manager._scan_broker_configs(max_time=3.0, quiet=0.2)
+
+    assert 0.3 <= time.monotonic() - started < 1.0
+    assert len(mqtt_manager.mqtt_client.broker_configs) == 2
+
+
+def test_scan_without_ack_falls_back_to_local_cache(mqtt_manager):
+    FakeBroker(mqtt_manager.mqtt_client, RETAINED, ack=False)
+    mqtt_manager._scan_broker_configs(max_time=0.3)
+
+    assert mqtt_manager.mqtt_client.broker_configs is None
+    assert mqtt_manager.core.log.messages("warning")
+
+
+def test_config_outside_scan_uses_local_cache():
+    client = ThrottledClient(mqtt.CallbackAPIVersion.VERSION2)
+    digest = client.digest(b"x")
+    client.config_cache = {"ha/sensor/PC/a/config": digest, "ha/sensor/b/config": digest}
+    client.broker_config_filter = "ha/+/PC/+/config"
+    client.broker_configs = {}
+
+    # broker 上缺失的本设备配置需要重新发布，范围外的配置按本地缓存跳过
+    assert not client._config_unchanged("ha/sensor/PC/a/config", digest)
+    assert client._config_unchanged("ha/sensor/b/config", digest)
+
+
+class PahoDouble:
+    """替换 paho 的底层发布：记录发送的消息，rc 可指定"""
+
+    def __init__(self, monkeypatch, client):
+        self.sent = []
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+        self.connected = False
+        monkeypatch.setattr(mqtt.Client, "publish", self.publish)
+        monkeypatch.setattr(client, "is_connected", lambda: self.connected)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        info = mqtt.MQTTMessageInfo(len(self.sent))
+        info.rc = self.rc
+        if self.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.sent.append((topic, payload, retain))
+        return info
+
+
+def make_sensor(mqtt_manager, name="cpu"):
+    from ha_mqtt_discoverable import Settings
+    from ha_mqtt_discoverable.sensors import Sensor, SensorInfo
+
+    info = SensorInfo(name=name, unique_id=f"test_{name}", device=mqtt_manager.get_device_info())
+    return Sensor(Settings(mqtt=mqtt_manager.get_mqtt_settings(), entity=info))
+
+
+def test_entity_publish_is_buffered_while_offline(mqtt_manager, monkeypatch):
+    paho = PahoDouble(monkeypatch, mqtt_manager.mqtt_client)
+    sensor = make_sensor(mqtt_manager)
+
+    sensor.set_state(1)
+    sensor.set_state(2)
+    assert paho.sent == []
+    stats = mqtt_manager.get_offline_stats()
+    assert stats["depth"] == 2  # 配置和状态各一条，状态只保留最新值
+    assert stats["coalesced"] == 1
+
+    paho.connected = True
+    mqtt_manager.replay_offline()
+    assert paho.sent[-1] == (sensor.state_topic, "2", False)
+    assert mqtt_manager.get_offline_stats()["depth"] == 0
+
+
+def test_publish_is_buffered_when_paho_queue_is_full(mqtt_manager, monkeypatch):
+    paho = PahoDouble(monkeypatch, mqtt_manager.mqtt_client)
+    paho.connected = True
+    paho.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+    sensor = make_sensor(mqtt_manager)
+    sensor.write_config()
+    paho.rc = mqtt.MQTT_ERR_SUCCESS
+    paho.sent.clear()
+
+    paho.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+    assert not mqtt_manager.publish(sensor.state_topic, "on")
+    assert mqtt_manager.get_offline_stats()["buffered"] == 2  # 配置 + 状态，没有重复缓冲
+
+    paho.rc = mqtt.MQTT_ERR_SUCCESS
+    mqtt_manager.replay_offline()
+    assert [topic for topic, _, _ in paho.sent] == [sensor.config_topic, sensor.state_topic]
+
+
+def test_reconnect_during_discovery_release_is_not_lost(mqtt_manager, monkeypatch):
+    """新线程在上一轮释放锁之前尝试获取失败时，由上一轮的线程补做这次发现"""
+    runs = []
+    monkeypatch.setattr(mqtt_manager, "_discover", lambda connected_at: runs.append(connected_at))
+    real_lock = threading.Lock()
+
+    class RacingLock:
+        """第一次释放前模拟 on_connect：设置请求标志并启动一个获取锁失败的发现线程"""
+        raced = False
+
+        def acquire(self, blocking=True):
+            return real_lock.acquire(blocking)
+
+        def release(self):
+            if not RacingLock.raced:
+                RacingLock.raced = True
+                mqtt_manager.connected_at = 2
+                mqtt_manager._discovery_pending.set()
+                competitor = threading.Thread(target=mqtt_manager._run_discovery)
+                competitor.start()
+                competitor.join()
+            real_lock.release()
+
+    monkeypatch.setattr(mqtt_manager, "_discovery_lock", RacingLock())
+    mqtt_manager.connected_at = 1
+    mqtt_manager._discovery_pending.set()
+    mqtt_manager._run_discovery()
+
+    assert runs == [1, 2]
+    assert not mqtt_manager._discovery_pending.is_set()
+
+
+def deliver(mqtt_manager, topic, payload=b"1"):
+    mqtt_manager.on_message(mqtt_manager.mqtt_client, None, SimpleNamespace(topic=topic, payload=payload))
+
+
+def test_callbacks_survive_service_restart(mqtt_manager, monkeypatch):
+    monkeypatch.setattr(mqtt_manager, "connect_broker", lambda: None)
+    monkeypatch.setattr(mqtt_manager.mqtt_client, "loop_start", lambda: None)
+    monkeypatch.setattr(mqtt_manager.mqtt_client, "loop_stop", lambda: None)
+    mqtt_manager._callback_workers = 1
+    slots = mqtt_manager._callback_slots._value
+
+    release = threading.Event()
+    received = []
+
+    def handler(topic, payload):
+        release.wait(2)
+        received.append(payload)
+
+    mqtt_manager.router.add("pc/cmd", handler)
+    mqtt_manager.start_mqtt()
+    for i in range(5):
+        deliver(mqtt_manager, "pc/cmd", str(i).encode())
+    # 第一条正在执行，其余在队列中，停止服务时被取消
+    mqtt_manager.stop_mqtt()
+    release.set()
+    assert wait_until(lambda: mqtt_manager._callback_slots._value == slots)
+
+    mqtt_manager.start_mqtt()
+    deliver(mqtt_manager, "pc/cmd", b"after")
+    assert wait_until(lambda: "after" in received)
+    assert mqtt_manager.dropped_messages == 0
+    mqtt_manager.stop_mqtt()
+
+
+def test_message_without_executor_is_counted_as_dropped(mqtt_manager, log):
+    mqtt_manager.router.add("pc/cmd", lambda topic, payload: None)
+    slots = mqtt_manager._callback_slots._value
+    deliver(mqtt_manager, "pc/cmd")
+
+    assert mqtt_manager.dropped_messages == 1
+    assert mqtt_manager._callback_slots._value == slots
+    assert any("pc/cmd" in m for m in log.messages("warning"))
+
+
+def test_discovery_state_wins_over_offline_buffer(mqtt_manager, monkeypatch):
+    paho = PahoDouble(monkeypatch, mqtt_manager.mqtt_client)
+    mqtt_manager.publish("pc/sensor/cpu/state", "stale", retain=True)
+    mqtt_manager.publish("pc/sensor/gpu/state", "buffered", retain=True)
+    assert mqtt_manager.get_offline_stats()["depth"] == 2
+
+    paho.connected = True
+    mqtt_manager.discovery_verify = False
+    mqtt_manager.core.config_plugin_entities = lambda: mqtt_manager.publish("pc/sensor/cpu/state", "fresh", retain=True)
+    for name in ("create_version_entity", "start_version_heartbeat"):
+        monkeypatch.setattr(mqtt_manager, name, lambda: None)
+    monkeypatch.setattr(mqtt_manager, "_report_discovery_time", lambda connected_at: None)
+    mqtt_manager._discover(time.perf_counter())
+
+    latest = {topic: payload for topic, payload, _ in paho.sent}
+    assert latest == {"pc/sensor/cpu/state": "fresh", "pc/sensor/gpu/state": "buffered"}
+    assert mqtt_manager.get_offline_stats()["depth"] == 0
+
+
+def test_publish_after_reconnect_supersedes_buffered_message(mqtt_manager, monkeypatch):
+    paho = PahoDouble(monkeypatch, mqtt_manager.mqtt_client)
+    mqtt_manager.publish("pc/sensor/cpu/state", "stale")
+    paho.connected = True
+    mqtt_manager.publish("pc/sensor/cpu/state", "fresh")  # 定时器在补发前已发布新值
+    mqtt_manager.replay_offline()
+
+    assert paho.sent == [("pc/sensor/cpu/state", "fresh", False)]
@@ -0,0 +1,94 @@
+"""SensorHistory 环形缓冲区测试"""
+import threading
+
+import numpy as np
+import pytest
+
+from plugins.Aida64.SensorHistory import SensorHistory
+
+
+def test_aggregate_over_window():
+    history = SensorHistory(capacity=100)
+    for i in range(20):
+        history.append({"TCPU": 40 + i, "FCPU": "1200", "SDATE": "2024-05-01"}, timestamp=float(i))
+
+    stats = history.aggregate(10, now=19.0)  # 时间戳 9..19
+    assert stats["min"]["TCPU"] == 49
+    assert stats["max"]["TCPU"] == 59
+    assert stats["mean"]["TCPU"] == 54
+    assert stats["p95"]["TCPU"] == pytest.approx(58.5)
+    assert stats["mean"]["FCPU"] == 1200
+    assert "SDATE" not in history.columns  # 非数值不记录
+
+
+def test_capacity_is_bounded():
+    history = SensorHistory(capacity=10)
+    for i in range(1000):
+        history.append({"TCPU": i}, timestamp=float(i))
+    memory = history.memory_bytes()
+    for i in range(1000, 5000):
+        history.append({"TCPU": i}, timestamp=float(i))
+
+    assert history.memory_bytes() == memory
+    samples = history.window(1e9, now=4999.0)
+    assert sorted(samples[:, 0].tolist()) == list(range(4990, 5000))
+
+
+def test_retain_drops_columns_and_keeps_data():
+    history = SensorHistory(capacity=10, column_chunk=2)
+    for i in range(5):
+        history.append({"A": i, "B": 10 + i, "C": 20 + i}, timestamp=float(i))
+    history.retain(["A", "C"])
+
+    assert list(history.columns) == ["A", "C"]
+    stats = history.aggregate(100, now=4.0)
+    assert stats["max"] == {"A": 4, "C": 24}
+
+
+def test_missing_sensor_in_window_is_omitted():
+    history = SensorHistory(capacity=10)
+    history.append({"A": 1}, timestamp=0.0)
+    history.append({"B": 2}, timestamp=10.0)
+
+    stats = history.aggregate(5, now=10.0)
+    assert stats["mean"] == {"B": 2}
+
+
+def test_concurrent_append_retain_aggregate():
+    history = SensorHistory(capacity=50, column_chunk=4)
+    errors = []
+    stop = threading.Event()
+
+    def run(action):
+        try:
+            i = 0
+            while not stop.is_set():
+                action(i)
+                i += 1
+        except Exception as e:  # noqa: BLE001 - 任何异常都说明存在竞争
+            errors.append(e)
+            stop.set()
+
+    def append(i):
+        history.append({f"S{j}": j for j in range(i % 40)})
+
+    def retain(i):
+        history.retain([f"S{j}" for j in range(0, 40, 1 + i % 3)])
+
+    def aggregate(i):
+        stats = history.aggregate(60)
+        for stat in SensorHistory.STATS:
+            for sensor_id, value in stats[stat].items():
+                # 每个传感器的值固定为其编号，列错位时会读到其他传感器的值
+                assert value == int(sensor_id[1:])
+
+    threads = [threading.Thread(target=run, args=(action,)) for action in (append, append, retain, aggregate)]
+    for t in threads:
+        t.start()
+    threading.Event().wait(1.0)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert np.isfinite(history.window(60)).any()
@@ -0,0 +1,70 @@
+"""常驻 Shell 会话的输出分帧测试（使用 bash）"""
+import shutil
+
+import pytest
+
+from plugins.Cmd.ShellSession import ShellSession, ShellSessionError, ShellStartError
+
+pytestmark = pytest.mark.skipif(shutil.which("bash") is None, reason="需要 bash")
+
+
+@pytest.fixture
+def session(log):
+    session = ShellSession.posix(log)
+    yield session
+    session.close()
+
+
+def run(session, command, timeout=5):
+    lines = []
+    rc = session.run(command, timeout=timeout, on_line=lines.append)
+    return rc, lines
+
+
+def test_output_and_return_code(session):
+    assert run(session, "echo hello; echo world") == (0, ["hello", "world"])
+    assert run(session, "echo failed >&2; exit_code() { return 3; }; exit_code") == (3, ["failed"])
+
+
+def test_output_without_trailing_newline(session):
+    assert run(session, "printf 'no newline'") == (0, ["no newline"])
+    assert run(session, "printf ''") == (0, [])
+
+
+def test_blank_lines_are_kept(session):
+    assert run(session, "printf 'a\\n\\nb\\n\\n'") == (0, ["a", "", "b", ""])
+
+
+def test_sentinel_like_output_does_not_end_command(session):
+    # 分隔标记每条命令随机生成，固定前缀的输出不会被误判为结束
+    rc, lines = run(session, "echo __PCTOOLS_deadbeef__ 7; echo after")
+    assert rc == 0
+    assert lines == ["__PCTOOLS_deadbeef__ 7", "after"]
+
+
+def test_state_persists_between_commands(session):
+    run(session, "cd /tmp; export PCTOOLS_TEST=42")
+    assert run(session, "pwd; echo $PCTOOLS_TEST") == (0, ["/tmp", "42"])
+    assert session.started == 1
+
+
+def test_timeout_kills_and_restarts(session):
+    with pytest.raises(TimeoutError):
+        session.run("sleep 10", timeout=0.3)
+    assert not session.is_alive()
+
+    assert run(session, "echo back") == (0, ["back"])
+    assert session.restarts == 1
+
+
+def test_exit_restarts_session(session):
+    with pytest.raises(ShellSessionError):
+        session.run("exit 5")
+    assert run(session, "echo again") == (0, ["again"])
+    assert session.restarts == 1
+
+
+def test_missing_interpreter(log):
+    session = ShellSession(["/nonexistent/shell"], None, log)
+    with pytest.raises(ShellStartError):
+        session.run("echo")
@@ -0,0 +1,129 @@
+"""
+TimerManager 调度测试
+包含 50 个定时器的抖动和 CPU 占用基准，运行 pytest -s 可查看测量结果
+"""
+import threading
+import time
+
+import pytest
+
+from conftest import FakeConfig
+from Timer import TimerManager
+
+
+class _Core:
+    def __init__(self, log, **config):
+        self.log = log
+        self.config = FakeConfig(interval=1, **config)
+
+    def run_coro(self, coro):
+        raise AssertionError("测试中不应执行异步任务")
+
+
+@pytest.fixture
+def manager(log):
+    manager = TimerManager(_Core(log), max_workers=4)
+    yield manager
+    manager.stop_all_timers()
+    manager.shutdown()
+
+
+def _scheduler_threads():
+    return [t for t in threading.enumerate() if t.name.startswith(("TimerScheduler", "TimerWorker"))]
+
+
+def test_timer_runs_at_interval(manager):
+    calls = []
+    manager.create_timer("tick", lambda: calls.append(time.monotonic()), interval=0.05)
+    manager.start_timer("tick")
+    time.sleep(0.5)
+    manager.stop_timer("tick")
+
+    assert 7 <= len(calls) <= 12
+    gaps = [b - a for a, b in zip(calls, calls[1:])]
+    assert all(gap >= 0.045 for gap in gaps)
+
+
+def test_stopped_timer_does_not_run(manager):
+    calls = []
+    manager.create_timer("tick", lambda: calls.append(1), interval=0.05)
+    manager.start_timer("tick")
+    time.sleep(0.12)
+    manager.stop_timer("tick")
+    count = len(calls)
+    time.sleep(0.2)
+
+    assert len(calls) == count
+
+
+def test_update_interval_takes_effect_immediately(manager):
+    calls = []
+    manager.create_timer("tick", lambda: calls.append(time.monotonic()), interval=10)
+    manager.start_timer("tick")
+    time.sleep(0.05)
+    assert len(calls) == 1  # 启动时立即执行一次
+
+    manager.update_timer_interval("tick", 0.05)
+    time.sleep(0.3)
+    assert len(calls) >= 4
+
+
+def test_failing_task_keeps_schedule(manager, log):
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise ValueError("boom")
+
+    manager.create_timer("fail", fail, interval=0.05)
+    manager.start_timer("fail")
+    time.sleep(0.3)
+
+    assert len(calls) >= 4
+    assert any("boom" in message for message in log.messages("error"))
+
+
+def test_shutdown_stops_threads_and_can_restart(manager):
+    calls = []
+    manager.create_timer("tick", lambda: calls.append(1), interval=0.05)
+    manager.start_all_timers()
+    time.sleep(0.1)
+    manager.stop_all_timers()
+    manager.shutdown()
+    time.sleep(0.1)
+
+    assert not [t for t in _scheduler_threads() if t.name == "TimerScheduler" and t.is_alive()]
+
+    count = len(calls)
+    manager.start_all_timers()
+    time.sleep(0.15)
+    assert len(calls) > count
+
+
+def test_benchmark_50_timers(manager):
+    """50 个 100ms 定时器运行 2 秒：平均抖动、最大抖动、线程数、CPU 占用"""
+    interval = 0.1
+    duration = 2.0
+    calls = {i: [] for i in range(50)}
+    for i in range(50):
+        manager.create_timer(f"t{i}", lambda i=i: calls[i].append(time.monotonic()), interval=interval)
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    manager.start_all_timers()
+    time.sleep(duration)
+    manager.stop_all_timers()
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+
+    jitter = [abs(b - a - interval) for times in calls.values() for a, b in zip(times, times[1:])]
+    mean_ms = sum(jitter) / len(jitter) * 1000
+    max_ms = max(jitter) * 1000
+    threads = len(_scheduler_threads())
+    print(f"\n50 个定时器: 平均抖动 {mean_ms:.2f}ms, 最大抖动 {max_ms:.2f}ms, "
+          f"调度线程 {threads}, CPU {cpu / wall * 100:.1f}%")
+
+    assert all(len(times) >= duration / interval * 0.8 for times in calls.values())
+    assert mean_ms < 10
+    assert threads <= 1 + manager.max_workers
+    assert cpu / wall < 0.5
@@ -0,0 +1,111 @@
+"""
+MQTT 主题路由测试
+匹配结果与 paho 的 topic_matches_sub 逐一对比；包含与逐个比较的匹配耗时基准，运行 pytest -s 可查看测量结果
+"""
+import random
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from TopicRouter import TopicRouter
+
+FILTERS = [
+    "a/b/c", "a/+/c", "a/#", "#", "+/b/#", "a/b", "+", "+/+", "a/+/+/d", "$SYS/#", "$SYS/broker/+",
+    "homeassistant/+/PC/+/config", "homeassistant/sensor/#",
+]
+TOPICS = [
+    "a", "a/b", "a/b/c", "a/x/c", "a/b/c/d", "x/b", "x/b/y", "$SYS/broker/load", "$SYS",
+    "homeassistant/switch/PC/power/config", "homeassistant/sensor/PC/cpu/state", "/a", "a/",
+]
+
+
+class Handler:
+    def __init__(self):
+        self.calls = []
+
+    def on_message(self, topic, payload):
+        self.calls.append(topic)
+
+
+def callback_for(topic_filter):
+    return lambda topic, payload: (topic_filter, topic)
+
+
+@pytest.mark.parametrize("topic", TOPICS)
+def test_match_agrees_with_paho(topic):
+    router = TopicRouter()
+    callbacks = {f: callback_for(f) for f in FILTERS}
+    for topic_filter, callback in callbacks.items():
+        router.add(topic_filter, callback)
+
+    matched = {cb(None, None)[0] for cb in router.match(topic)}
+    expected = {f for f in FILTERS if mqtt.topic_matches_sub(f, topic)}
+    assert matched == expected
+
+
+def test_invalid_filters_are_rejected():
+    router = TopicRouter()
+    for topic_filter in ("a/#/b", "a/b+", "a#"):
+        with pytest.raises(ValueError):
+            router.add(topic_filter, print)
+
+
+def test_bound_method_is_added_once_and_removed():
+    router = TopicRouter()
+    handler = Handler()
+    # 每次取属性都会创建新的绑定方法对象，相等但不是同一个对象
+    router.add("a/b", handler.on_message)
+    router.add("a/b", handler.on_message)
+    assert router.count == 1
+
+    router.remove("a/b", handler.on_message)
+    assert router.match("a/b") == []
+    assert router.count == 0
+    assert router._root.children == {}
+
+
+def test_remove_keeps_other_callbacks():
+    router = TopicRouter()
+    first, second = Handler(), Handler()
+    router.add("a/+", first.on_message)
+    router.add("a/+", second.on_message)
+    router.add("a/+/c", first.on_message)
+
+    router.remove("a/+", first.on_message)
+    assert router.match("a/x") == [second.on_message]
+    assert router.match("a/x/c") == [first.on_message]
+
+    router.remove("a/+")
+    assert router.match("a/x") == []
+    assert router.count == 1
+
+
+def test_remove_unknown_callback_keeps_count():
+    router = TopicRouter()
+    router.add("a", Handler().on_message)
+    router.remove("a", Handler().on_message)
+    router.remove("missing/topic")
+    assert router.count == 1
+
+
+def test_match_benchmark():
+    """2000 个订阅时，前缀树匹配应明显快于逐个比较"""
+    rng = random.Random(1)
+    filters = [f"home/{rng.choice(['+', f'room{i % 50}'])}/device{i}/#" for i in range(2000)]
+    router = TopicRouter()
+    for topic_filter in filters:
+        router.add(topic_filter, callback_for(topic_filter))
+    topics = [f"home/room{rng.randrange(50)}/device{rng.randrange(2000)}/state" for _ in range(100)]
+
+    started = time.perf_counter()
+    routed = [len(router.match(topic)) for topic in topics]
+    router_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    linear = [sum(mqtt.topic_matches_sub(f, topic) for f in filters) for topic in topics]
+    linear_time = time.perf_counter() - started
+
+    print(f"\n前缀树 {router_time / len(topics) * 1e6:.1f}us/条, 逐个比较 {linear_time / len(topics) * 1e6:.1f}us/条")
+    assert routed == linear
+    assert router_time * 10 < linear_time
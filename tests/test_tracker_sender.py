@@ -0,0 +1,144 @@
+"""Runtime Tracker 上报测试（使用模拟 HTTP 会话，不需要网络连接）"""
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from conftest import wait_until
+from plugins.WindowListener import TrackerSender as tracker_module
+from plugins.WindowListener.TrackerSender import TrackerSender
+
+URL = "http://tracker.test/api"
+
+
+class FakeSession:
+    """
+    按脚本返回结果的 HTTP 会话
+    responses 中的整数为状态码，异常实例会被抛出；脚本用完后重复最后一项
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses) or [200]
+        self.posts = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def post(self, url, json=None, timeout=None):
+        with self._lock:
+            self.posts.append(json)
+            result = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(result, Exception):
+            raise result
+        return SimpleNamespace(status_code=result, text=f"status {result}")
+
+    def close(self):
+        self.closed = True
+
+    def sent_apps(self):
+        with self._lock:
+            return [payload["app_name"] for payload in self.posts]
+
+
+@pytest.fixture
+def make_sender(tmp_path, monkeypatch, log):
+    monkeypatch.setattr(TrackerSender, "_backoff", lambda self, attempt: 0.01)
+    senders = []
+
+    def make(session, **kwargs):
+        monkeypatch.setattr(tracker_module.requests, "Session", lambda: session)
+        kwargs.setdefault("debounce", 0.05)
+        kwargs.setdefault("spool_path", tmp_path / "spool.json")
+        sender = TrackerSender(log, lambda: URL, **kwargs)
+        senders.append(sender)
+        return sender
+
+    yield make
+    for sender in senders:
+        sender.stop()
+
+
+def app(name):
+    return {"app_name": name}
+
+
+def test_debounce_sends_only_latest(make_sender):
+    session = FakeSession(200)
+    sender = make_sender(session)
+    for name in ("a.exe", "b.exe", "c.exe"):
+        sender.submit(app(name))
+
+    assert wait_until(lambda: sender.stats["sent"] == 1)
+    time.sleep(0.1)
+    assert session.sent_apps() == ["c.exe"]
+    assert sender.stats["coalesced"] == 2
+
+    # 与上次成功发送的应用相同时不重复上报
+    sender.submit(app("c.exe"))
+    time.sleep(0.15)
+    assert session.sent_apps() == ["c.exe"]
+
+
+def test_retries_with_backoff_until_success(make_sender):
+    session = FakeSession(500, requests.ConnectionError("down"), 429, 200)
+    sender = make_sender(session)
+    sender.submit(app("a.exe"))
+
+    assert wait_until(lambda: sender.stats["sent"] == 1)
+    assert session.sent_apps() == ["a.exe"] * 4
+    assert sender.stats["failed"] == 0
+
+
+def test_rejected_record_is_not_retried(make_sender):
+    session = FakeSession(400, 200)
+    sender = make_sender(session)
+    sender.submit(app("a.exe"))
+    assert wait_until(lambda: len(session.posts) == 1)
+    sender.submit(app("b.exe"))
+
+    assert wait_until(lambda: sender.stats["sent"] == 1)
+    assert session.sent_apps() == ["a.exe", "b.exe"]
+
+
+def test_failed_records_are_spooled_and_replayed(make_sender, tmp_path):
+    spool = tmp_path / "spool.json"
+    down = FakeSession(requests.ConnectionError("down"))
+    sender = make_sender(down, max_retries=1)
+    sender.submit(app("a.exe"))
+    assert wait_until(lambda: sender.stats["failed"] >= 1 and spool.exists())
+    sender.submit(app("b.exe"))
+    assert wait_until(lambda: spool.exists() and len(json.loads(spool.read_text(encoding="utf-8"))) == 2)
+    sender.stop()
+    assert down.closed
+
+    # 重新启动后按顺序补发，全部发送后删除缓存文件
+    up = FakeSession(200)
+    sender = make_sender(up)
+    assert wait_until(lambda: sender.stats["sent"] == 2)
+    assert up.sent_apps() == ["a.exe", "b.exe"]
+    assert wait_until(lambda: not spool.exists())
+
+
+def test_queue_size_drops_oldest(make_sender, tmp_path):
+    spool = tmp_path / "spool.json"
+    spool.write_text(json.dumps([app("a.exe"), app("b.exe"), app("c.exe")]), encoding="utf-8")
+    sender = make_sender(FakeSession(503), max_retries=0, queue_size=3)
+    sender.submit(app("d.exe"))
+
+    assert wait_until(lambda: sender.stats["dropped"] == 1)
+    sender.stop()
+    assert [p["app_name"] for p in json.loads(spool.read_text(encoding="utf-8"))] == ["b.exe", "c.exe", "d.exe"]
+
+
+def test_stop_interrupts_backoff(make_sender, monkeypatch):
+    monkeypatch.setattr(TrackerSender, "_backoff", lambda self, attempt: 60)
+    sender = make_sender(FakeSession(503))
+    sender.submit(app("a.exe"))
+    assert wait_until(lambda: len(sender.session.posts) == 1)
+
+    started = time.monotonic()
+    sender.stop()
+    assert time.monotonic() - started < 1
+    assert not sender.thread.is_alive()
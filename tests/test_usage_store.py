@@ -0,0 +1,137 @@
+"""应用使用时长统计测试"""
+import threading
+import time
+
+import pytest
+
+from plugins.WindowListener import UsageStore as usage_module
+from plugins.WindowListener.UsageStore import UsageStore
+
+BASE = time.time() - 3600
+
+
+@pytest.fixture
+def make_store(tmp_path, log):
+    stores = []
+
+    def make(**kwargs):
+        store = UsageStore(directory=tmp_path, log=log, **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        if store._file is not None:
+            store._file.close()
+
+
+def play(store, switches):
+    """按 [(偏移秒, exe)] 依次切换前台应用"""
+    for offset, exe in switches:
+        store.switch(exe, now=BASE + offset)
+
+
+def day_total(store):
+    totals = {}
+    for usage in store.days.values():
+        for exe, seconds in usage.items():
+            totals[exe] = totals.get(exe, 0) + seconds
+    return totals
+
+
+def test_switch_accumulates_usage(make_store):
+    store = make_store()
+    play(store, [(0, "a.exe"), (60, "b.exe"), (90, "a.exe"), (100, "a.exe"), (130, None)])
+
+    assert day_total(store) == pytest.approx({"a.exe": 100, "b.exe": 30})
+    assert store.current is None
+    assert store.range("minute", BASE - 60, BASE + 3600) == pytest.approx({"a.exe": 100, "b.exe": 30})
+
+
+def test_reload_replays_snapshot_and_log(make_store):
+    store = make_store()
+    play(store, [(0, "a.exe"), (60, "b.exe"), (90, "a.exe")])
+    store.compact()
+    play(store, [(150, "c.exe"), (170, None)])
+    store._file.close()
+    store._file = None
+
+    reloaded = make_store()
+    assert day_total(reloaded) == pytest.approx({"a.exe": 120, "b.exe": 30, "c.exe": 20})
+
+
+def test_interrupted_compaction_does_not_double_count(make_store, tmp_path):
+    store = make_store()
+    play(store, [(0, "a.exe"), (60, "b.exe"), (90, "a.exe")])
+    store._file.flush()
+    old_log = store.log_path.read_text(encoding="utf-8")
+    store.compact()
+    play(store, [(150, None)])
+    store._file.close()
+    store._file = None
+
+    # 模拟快照写入后、清空日志前中断：旧记录仍在日志中
+    new_log = store.log_path.read_text(encoding="utf-8")
+    store.log_path.write_text(old_log + new_log, encoding="utf-8")
+
+    reloaded = make_store()
+    assert day_total(reloaded) == pytest.approx({"a.exe": 120, "b.exe": 30})
+
+
+def test_switch_does_not_wait_for_compaction(make_store, monkeypatch):
+    """压缩在后台执行：写快照期间前台切换不阻塞，期间追加的记录保留到新日志"""
+    writing = threading.Event()
+    release = threading.Event()
+    real_write = usage_module.atomic_write_json
+
+    def slow_write(path, data):
+        writing.set()
+        release.wait(5)
+        real_write(path, data)
+
+    monkeypatch.setattr(usage_module, "atomic_write_json", slow_write)
+    store = make_store(compact_every=3)
+    try:
+        play(store, [(0, "a.exe"), (10, "b.exe"), (20, "a.exe"), (30, "b.exe")])
+        assert writing.wait(2)
+
+        started = time.monotonic()
+        play(store, [(40, "c.exe"), (50, "a.exe")])
+        assert time.monotonic() - started < 0.5
+    finally:
+        release.set()
+
+    assert wait_for_compaction(store)
+    assert store.appended == 2
+    lines = store.log_path.read_text(encoding="utf-8").splitlines()
+    assert [line.split("\t")[2] for line in lines] == ["b.exe", "c.exe"]
+
+    play(store, [(60, None)])
+    store._file.close()
+    store._file = None
+    reloaded = make_store()
+    assert day_total(reloaded) == pytest.approx(day_total(store))
+
+
+def wait_for_compaction(store, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with store._lock:
+            if store._compact_thread is None:
+                return True
+        time.sleep(0.01)
+    return False
+
+
+def test_failed_snapshot_keeps_log(make_store, monkeypatch, log):
+    def broken(path, data):
+        raise OSError("disk full")
+
+    store = make_store()
+    play(store, [(0, "a.exe"), (60, "b.exe")])
+    monkeypatch.setattr(usage_module, "atomic_write_json", broken)
+    store.compact()
+
+    assert store.appended == 1
+    assert store._carry is None
+    assert any("disk full" in m for m in log.messages("error"))
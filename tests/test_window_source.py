@@ -0,0 +1,96 @@
+"""前台窗口事件源与进程信息缓存测试"""
+import threading
+import time
+
+import pytest
+
+from plugins.WindowListener.WindowSource import FakeSource, ForegroundSource, PollingSource, ProcessCache
+
+
+def test_base_source_is_abstract():
+    with pytest.raises(TypeError):
+        ForegroundSource()
+
+    class Incomplete(ForegroundSource):
+        def start(self, callback):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_fake_source_delivers_pushed_windows():
+    source = FakeSource()
+    received = []
+    source.push(1)  # 未启动时忽略
+    source.start(received.append)
+    assert source.is_running()
+
+    source.push(100)
+    source.push(0)  # 无前台窗口时不回调
+    source.push(200)
+    source.stop()
+    source.push(300)
+
+    assert received == [100, 200]
+    assert not source.is_running()
+
+
+def test_fake_source_drives_process_lookup():
+    """模拟监听流程：窗口句柄 → pid → 进程信息，重复切换到同一进程时命中缓存"""
+    pids = {100: 10, 200: 20, 300: 10}
+    lookups = []
+
+    def lookup(pid):
+        lookups.append(pid)
+        return f"app{pid}.exe", f"C:/apps/app{pid}.exe"
+
+    cache = ProcessCache(lookup, start_time=lambda pid: 1000.0)
+    switches = []
+    source = FakeSource()
+    source.start(lambda hwnd: switches.append(cache.get(pids[hwnd])[0]))
+    for hwnd in (100, 200, 300, 100):
+        source.push(hwnd)
+
+    assert switches == ["app10.exe", "app20.exe", "app10.exe", "app10.exe"]
+    assert lookups == [10, 20]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_process_cache_detects_pid_reuse_and_evicts():
+    created = {1: 1.0, 2: 2.0, 3: 3.0}
+    cache = ProcessCache(lambda pid: (f"p{pid}-{created[pid]}", ""), lambda pid: created[pid], size=2)
+
+    assert cache.get(1)[0] == "p1-1.0"
+    created[1] = 9.0  # pid 被新进程复用
+    assert cache.get(1)[0] == "p1-9.0"
+
+    cache.get(2)
+    cache.get(1)  # 1 变为最近使用
+    cache.get(3)  # 淘汰 2
+    assert set(cache._cache) == {1, 3}
+
+
+def test_polling_source_reports_changes_only():
+    windows = iter([1, 1, 2, 2, 2, 3])
+    current = {"hwnd": 1}
+    received = []
+    done = threading.Event()
+
+    def get_foreground():
+        current["hwnd"] = next(windows, current["hwnd"])
+        return current["hwnd"]
+
+    def on_window(hwnd):
+        received.append(hwnd)
+        if hwnd == 3:
+            done.set()
+
+    source = PollingSource(get_foreground, interval=0.01)
+    source.start(on_window)
+    assert done.wait(2)
+    time.sleep(0.05)
+    source.stop()
+
+    assert received == [1, 2, 3]
+    assert not source.is_running()